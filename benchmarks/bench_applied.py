@@ -0,0 +1,61 @@
+"""
+Compares the cost of entering and leaving doubles.applied with the
+generator-based context manager it replaced.
+
+    python benchmarks/bench_applied.py
+"""
+import timeit
+from contextlib import contextmanager
+
+from duplo import doubles
+
+class NoopDoubler(doubles.DoublerBase):
+    def apply(self):
+        pass
+
+    def unapply(self):
+        pass
+
+def make_manager(size):
+    manager = doubles.DoubleManager()
+    for i in range(size):
+        manager.register_double(NoopDoubler('double{0}'.format(i)))
+    return manager
+
+@contextmanager
+def legacy_applied(manager, names):
+    names = manager._conform_double_names(names)
+    manager.apply_doubles(names)
+    yield
+    manager.revert()
+
+def main(size=1500, number=20000):
+    manager = make_manager(size)
+    names = ['double1', 'double2', 'double3']
+
+    def legacy():
+        with legacy_applied(manager, names):
+            pass
+
+    plan = doubles.applied(manager, names)
+    def context_manager():
+        with doubles.applied(manager, names):
+            pass
+
+    def precompiled():
+        with plan:
+            pass
+
+    @doubles.applied(manager, names)
+    def decorated():
+        pass
+
+    for label, func in [('generator context manager (before)', legacy),
+                        ('applied() context manager', context_manager),
+                        ('precompiled plan', precompiled),
+                        ('decorated function', decorated)]:
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        print("{0:<36} {1:8.2f} us/call".format(label, best / number * 1e6))
+
+if __name__ == '__main__':
+    main()
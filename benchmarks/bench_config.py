@@ -0,0 +1,44 @@
+"""
+Compares registering PatchingDoublers in code with loading the same
+declarations from a (cached) config file.
+
+    python benchmarks/bench_config.py
+"""
+import json, os, shutil, tempfile, timeit
+
+from duplo import config, doubles
+
+def declarations(size):
+    return [('double{0}'.format(i), 'fakes.module{0}:Fake'.format(i),
+             ['real.module{0}:thing'.format(i), 'alias.module{0}:thing'.format(i)], ['tag{0}'.format(i % 10)])
+            for i in range(size)]
+
+def main(size=1500, number=20):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'doubles.json')
+        with open(path, 'w') as fh:
+            json.dump(dict((name, {'variant': variant, 'targets': targets, 'tags': tags})
+                           for name, variant, targets, tags in declarations(size)), fh)
+
+        def eager():
+            manager = doubles.DoubleManager()
+            for name, variant, targets, tags in declarations(size):
+                manager.register_double(doubles.PatchingDoubler(name, variant, targets, tags))
+
+        def uncached():
+            config.load_config(doubles.DoubleManager(), path, cache_dir=tmpdir)
+            os.remove(config._cache_path(path, tmpdir))
+
+        def cached():
+            config.load_config(doubles.DoubleManager(), path, cache_dir=tmpdir)
+
+        cached()
+        for label, func in [('in code', eager), ('config, uncached', uncached), ('config, cached', cached)]:
+            seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+            print("{0:<18} {1:8.2f} ms per {2} doubles".format(label, seconds * 1000, size))
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+"""
+Measures the per-call overhead of LatencyProfiler's timing wrapper.
+
+    python benchmarks/bench_latency.py
+"""
+import sys, timeit, types
+
+from duplo.latency import LatencyProfiler
+
+def main(number=1000000):
+    module = types.ModuleType('bench_latency_targets')
+    exec("def noop(x):\n    return x\n", vars(module))
+    sys.modules[module.__name__] = module
+
+    def call():
+        module.noop(1)
+
+    plain = min(timeit.repeat(call, number=number, repeat=3)) / number
+    profiler = LatencyProfiler(['bench_latency_targets:noop'])
+    with profiler:
+        timed = min(timeit.repeat(call, number=number, repeat=3)) / number
+        with profiler.scope('test'):
+            scoped = min(timeit.repeat(call, number=number, repeat=3)) / number
+    for label, seconds in [('plain', plain), ('timed', timed), ('timed, in a scope', scoped)]:
+        print("{0:<18} {1:6.0f} ns per call".format(label, seconds * 1e9))
+
+if __name__ == '__main__':
+    main()
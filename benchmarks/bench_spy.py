@@ -0,0 +1,30 @@
+"""
+Compares the per-call overhead of duplo.spies.Spy with
+mock.Mock(wraps=...).
+
+    python benchmarks/bench_spy.py
+"""
+import timeit
+
+from mock import Mock
+
+from duplo.spies import Spy
+
+def shorten(url, domain='sho.rt'):
+    return domain
+
+def main(number=200000):
+    spy = Spy(shorten, capacity=1024)
+    mock = Mock(wraps=shorten)
+
+    for label, func in [('plain call', shorten),
+                        ('Spy', spy),
+                        ('Mock(wraps=...)', mock)]:
+        best = min(timeit.repeat(lambda: func('http://example.com', domain='ex.am'),
+                                 number=number, repeat=5))
+        print("{0:<18} {1:8.3f} us/call".format(label, best / number * 1e6))
+        if func is mock:
+            mock.reset_mock()
+
+if __name__ == '__main__':
+    main()
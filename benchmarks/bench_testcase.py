@@ -0,0 +1,71 @@
+"""
+Compares applying doubles in setUp (and reverting in tearDown) with
+DoublesTestCase, which applies them once per class, on a sample suite:
+how many apply/unapply calls each makes, and how long the suite takes.
+
+    python benchmarks/bench_testcase.py
+"""
+import sys, timeit, types, unittest
+
+from duplo import doubles
+from duplo.testcase import DoublesTestCase, override
+
+def make_manager(size, counts):
+    module = types.ModuleType('bench_targets')
+    sys.modules[module.__name__] = module
+    manager = doubles.DoubleManager()
+    for i in range(size):
+        setattr(module, 'thing{0}'.format(i), i)
+        double = doubles.PatchingDoubler('double{0}'.format(i), -i, 'bench_targets:thing{0}'.format(i))
+        for action in ('apply', 'unapply'):
+            def counted(targets=None, action=action, method=getattr(double, action)):
+                counts[action] += 1
+                return method(targets)
+            setattr(double, action, counted)
+        manager.register_double(double)
+    return manager
+
+def make_suite(manager, names, classes, methods, mixin):
+    suite = unittest.TestSuite()
+    for c in range(classes):
+        attrs = {}
+        for m in range(methods):
+            def test(self):
+                pass
+            if m == 0:
+                # one test per class changes the selection.
+                test = override(unapply=names[:1])(test)
+            attrs['test_{0}'.format(m)] = test
+        if mixin:
+            bases = (DoublesTestCase, unittest.TestCase)
+            attrs.update(double_manager=manager, class_doubles=names)
+        else:
+            bases = (unittest.TestCase,)
+            def setUp(self):
+                manager.apply_doubles(names)
+                if getattr(getattr(self, self._testMethodName), 'double_overrides', None):
+                    manager.unapply_doubles(names[:1])
+                    self.addCleanup(manager.revert)
+            attrs.update(setUp=setUp, tearDown=lambda self: manager.revert())
+        case = type('Case{0}'.format(c), bases, attrs)
+        suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(case))
+    return suite
+
+def main(size=10, classes=50, methods=20, number=5):
+    counts = {'apply': 0, 'unapply': 0}
+    manager = make_manager(size, counts)
+    names = ['double{0}'.format(i) for i in range(size)]
+    print("{0} classes x {1} tests, {2} doubles each".format(classes, methods, size))
+    for label, mixin in [('setUp/tearDown', False), ('DoublesTestCase', True)]:
+        def run():
+            result = unittest.TestResult()
+            make_suite(manager, names, classes, methods, mixin).run(result)
+            assert result.wasSuccessful(), result.errors + result.failures
+        counts.update(apply=0, unapply=0)
+        run()
+        calls = counts['apply'] + counts['unapply']
+        seconds = min(timeit.repeat(run, number=number, repeat=3)) / number
+        print("{0:<16} {1:6} apply/unapply calls {2:8.2f} ms".format(label, calls, seconds * 1000))
+
+if __name__ == '__main__':
+    main()
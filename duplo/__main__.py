@@ -0,0 +1,5 @@
+import sys
+
+from .importtime import main
+
+sys.exit(main())
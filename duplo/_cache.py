@@ -0,0 +1,67 @@
+"""
+Small JSON caches kept in a per-user directory.
+
+Only plain data (strings, numbers, lists) is cached, so a cache file
+someone else planted can at worst hold wrong data, never run code.
+"""
+import errno, json, os
+
+def user_cache_dir():
+    """
+    Returns the directory duplo caches in for the current user.
+    """
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'duplo')
+
+def _normalized(key):
+    # as it reads back, e.g. with tuples as lists.
+    return json.loads(json.dumps(key))
+
+def read(path, key):
+    """
+    Returns the value cached at path under key, or None if there's no
+    such value (or the file can't be read).
+    """
+    try:
+        with open(path) as fh:
+            cached = json.load(fh)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get('key') != _normalized(key):
+        return None
+    return cached.get('value')
+
+def _replace(src, dst):
+    replace = getattr(os, 'replace', None)
+    if replace is not None:
+        replace(src, dst)
+        return
+    # python 2, where rename won't replace a file on Windows.
+    if os.name == 'nt' and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+def write(path, key, value):
+    """
+    Caches value at path under key, replacing the file atomically.
+    Failing to write is ignored; it's only a cache.
+    """
+    directory = os.path.dirname(path)
+    tmp_path = "{0}.{1}.tmp".format(path, os.getpid())
+    try:
+        try:
+            os.makedirs(directory, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        with open(tmp_path, 'w') as fh:
+            fh.write(json.dumps({'key': _normalized(key), 'value': value}))
+        _replace(tmp_path, path)
+    except (IOError, OSError, TypeError, ValueError):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
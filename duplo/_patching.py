@@ -0,0 +1,108 @@
+"""
+Swaps objects at their canonical location and at every alias loaded
+modules hold to them (e.g. after `from time import sleep`).
+"""
+import inspect, sys
+
+class AliasPatch(object):
+    """
+    Replaces each (owner, attr) in replacements with its replacement,
+    then replaces the original wherever a loaded module's namespace
+    refers to it, skipping modules named by (or within) skip_modules.
+
+    If deep is true, the attributes of classes defined in each module,
+    and the default arguments of its functions and methods (e.g.
+    `def close(self, unlink=os.unlink)`), are swapped too.
+
+    The locations found to refer to an original in each module are
+    remembered, so applying again only scans modules loaded since.
+    """
+    def __init__(self, replacements, skip_modules=(), deep=False):
+        self.replacements = replacements
+        self.skip_modules = tuple(skip_modules)
+        self._skip_prefixes = tuple(name + '.' for name in self.skip_modules)
+        self.deep = deep
+        self.patched = []
+        # module name -> (module, [(owner, attr)] referring to an original)
+        self._scanned = {}
+
+    def _skipped(self, module_name):
+        return module_name in self.skip_modules or module_name.startswith(self._skip_prefixes)
+
+    def _set(self, owner, attr, original, replacement):
+        setattr(owner, attr, replacement)
+        self.patched.append((owner, attr, original))
+
+    def _namespaces(self, module_name, module):
+        namespace = vars(module)
+        yield module, namespace
+        if not self.deep:
+            return
+        for value in list(namespace.values()):
+            if inspect.isclass(value) and getattr(value, '__module__', None) == module_name:
+                yield value, vars(value)
+
+    def _scan(self, module_name, module, swaps):
+        locations = []
+        for owner, namespace in self._namespaces(module_name, module):
+            for attr, value in list(namespace.items()):
+                swap = swaps.get(id(value))
+                if swap is not None and swap[0] is value:
+                    locations.append((owner, attr))
+                elif self.deep and inspect.isfunction(value) and value.__defaults__:
+                    if any(id(default) in swaps for default in value.__defaults__):
+                        locations.append((value, '__defaults__'))
+        return locations
+
+    def _locations(self, module_name, module, swaps):
+        scanned = self._scanned.get(module_name)
+        if scanned is not None and scanned[0] is module:
+            return scanned[1]
+        try:
+            locations = self._scan(module_name, module, swaps)
+        except TypeError: # no __dict__
+            return ()
+        self._scanned[module_name] = (module, locations)
+        return locations
+
+    def apply(self):
+        if self.patched:
+            raise ValueError("Already applied.")
+
+        swaps = {}
+        for owner, attr, replacement in self.replacements:
+            original = getattr(owner, attr)
+            swaps[id(original)] = (original, replacement)
+            self._set(owner, attr, original, replacement)
+
+        def swapped(value):
+            swap = swaps.get(id(value))
+            if swap is not None and swap[0] is value:
+                return swap[1]
+            return value
+
+        for module_name, module in list(sys.modules.items()):
+            if module is None or self._skipped(module_name):
+                continue
+            for owner, attr in self._locations(module_name, module, swaps):
+                if attr == '__defaults__':
+                    value = owner.__defaults__ or ()
+                    defaults = tuple(swapped(default) for default in value)
+                    if any(new is not old for new, old in zip(defaults, value)):
+                        self._set(owner, attr, value, defaults)
+                    continue
+                value = vars(owner).get(attr)
+                replacement = swapped(value)
+                if replacement is not value:
+                    self._set(owner, attr, value, replacement)
+
+    def aliases(self):
+        """
+        Returns the (owner, attr) locations currently patched.
+        """
+        return [(owner, attr) for owner, attr, original in self.patched]
+
+    def restore(self):
+        while self.patched:
+            owner, attr, original = self.patched.pop()
+            setattr(owner, attr, original)
@@ -0,0 +1,34 @@
+"""
+Helpers which need Python 3.5+ syntax, kept apart so that the rest of
+the package still imports on Python 2.
+"""
+import functools
+
+def plan_coroutine_function(plan, func):
+    @functools.wraps(func)
+    async def planned(*args, **kwargs):
+        with plan:
+            return await func(*args, **kwargs)
+    return planned
+
+def plan_generator_function(plan, func):
+    @functools.wraps(func)
+    def planned(*args, **kwargs):
+        with plan:
+            return (yield from func(*args, **kwargs))
+    return planned
+
+def virtual_sleep(clock, real_sleep, virtual_loop_class):
+    """
+    Returns an asyncio.sleep which, on loops that don't already run on
+    clock, advances clock by delay and yields just once.
+    """
+    import asyncio
+
+    @functools.wraps(real_sleep)
+    async def sleep(delay, result=None):
+        if isinstance(asyncio.get_running_loop(), virtual_loop_class):
+            return await real_sleep(delay, result)
+        clock.advance(max(0, delay))
+        return await real_sleep(0, result)
+    return sleep
@@ -0,0 +1,103 @@
+"""
+A minimal pool of daemon worker threads.
+
+Unlike multiprocessing.pool.ThreadPool, a task which never returns
+doesn't keep the pool (or the interpreter) from shutting down, which
+matters when callers give up on tasks after a timeout.
+"""
+import sys, threading
+from timeit import default_timer
+
+from .six.moves import queue
+
+class Task(object):
+    def __init__(self, func, args, kwargs):
+        self.func, self.args, self.kwargs = func, args, kwargs
+        self.started = None
+        self.elapsed = None
+        self.result = None
+        self.exc_info = None
+        self._done = threading.Event()
+
+    def run(self):
+        self.started = default_timer()
+        try:
+            self.result = self.func(*self.args, **self.kwargs)
+        except Exception:
+            self.exc_info = sys.exc_info()
+        finally:
+            self.elapsed = default_timer() - self.started
+            self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None, deadline=None):
+        """
+        Waits for the task to finish, where timeout counts from when the
+        task started running rather than from when it was submitted.
+        deadline (a default_timer() value), if given, is when to give
+        up on the task if it's still queued, e.g. behind tasks which
+        will never return.
+
+        Returns whether the task finished.
+        """
+        if timeout is None and deadline is None:
+            self._done.wait()
+            return True
+
+        while not self._done.is_set():
+            started = self.started
+            now = default_timer()
+            if started is None:
+                # still queued behind other tasks.
+                if deadline is not None and now >= deadline:
+                    break
+                self._done.wait(0.01)
+                continue
+            if timeout is None:
+                self._done.wait()
+                break
+            remaining = started + timeout - now
+            if remaining <= 0:
+                break
+            self._done.wait(remaining)
+        return self._done.is_set()
+
+class WorkerPool(object):
+    def __init__(self, concurrency):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+        self._queue = queue.Queue()
+        self._threads = []
+        for i in range(concurrency):
+            thread = threading.Thread(target=self._work, name="duplo-worker-{0}".format(i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            task.run()
+
+    def submit(self, func, *args, **kwargs):
+        task = Task(func, args, kwargs)
+        self._queue.put(task)
+        return task
+
+    def close(self):
+        """
+        Lets the workers exit once queued tasks are done, without waiting.
+        """
+        for thread in self._threads:
+            self._queue.put(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
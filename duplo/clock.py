@@ -0,0 +1,197 @@
+"""
+A doubler which swaps the clock for a virtual one, so that code which
+sleeps (retry backoff, polling, rate limiting) runs instantly.
+
+While a ClockDoubler is applied, time.time, time.monotonic and
+time.sleep (and their _ns variants), and asyncio.sleep, are replaced by
+a VirtualClock's, both in their own modules and wherever a loaded
+module imported them by name.  Sleeping advances the virtual clock
+rather than blocking, and tests can advance it by hand to trip
+timeouts.
+
+Event loops created while it's applied (e.g. by asyncio.run) are
+VirtualEventLoops: when the loop would block waiting for its next timer
+they advance the clock to it instead, so call_later, wait_for timeouts
+and the like fire without waiting.
+"""
+import sys, threading, time
+
+from .doubles import DoublerBase, UnexpectedUnapply
+from ._patching import AliasPatch
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+_real_time = time.time
+_real_monotonic = getattr(time, 'monotonic', time.time)
+
+# Modules which time their own waits (lock and queue timeouts, the test
+#  runner's durations) and would spin or misreport on a virtual clock, so
+#  their aliases are left alone.
+DEFAULT_SKIP_MODULES = (
+    'threading', 'queue', 'Queue', 'multiprocessing', 'concurrent',
+    'selectors', 'subprocess', 'socket', 'ssl', 'logging', 'sched',
+    'unittest', '_pytest', 'pytest', 'pluggy', 'duplo',
+)
+
+class VirtualClock(object):
+    """
+    A clock which only moves when advanced (or slept on).
+
+    time() starts at start (the real time by default) and monotonic()
+    at the real monotonic time.  If tick is true, real elapsed time is
+    added too, so the clock runs but sleeps still return at once.
+    """
+    def __init__(self, start=None, tick=False):
+        self._epoch = _real_time() if start is None else start
+        self._monotonic_base = self._real_base = _real_monotonic()
+        self._offset = 0.0
+        self.tick = tick
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<VirtualClock: {0!r}>".format(self.time())
+
+    def _elapsed(self):
+        elapsed = self._offset
+        if self.tick:
+            elapsed += _real_monotonic() - self._real_base
+        return elapsed
+
+    def time(self):
+        return self._epoch + self._elapsed()
+
+    def monotonic(self):
+        return self._monotonic_base + self._elapsed()
+
+    def time_ns(self):
+        return int(self.time() * 1e9)
+
+    def monotonic_ns(self):
+        return int(self.monotonic() * 1e9)
+
+    def advance(self, seconds):
+        if seconds < 0:
+            raise ValueError("Cannot advance the clock backwards.")
+        with self._lock:
+            self._offset += seconds
+
+    def sleep(self, seconds):
+        if seconds < 0:
+            raise ValueError("sleep length must be non-negative")
+        self.advance(seconds)
+
+if asyncio is not None:
+    import selectors
+
+    class _CollapsingSelector(object):
+        """
+        Wraps a selector so that, rather than blocking until the next
+        timer is due, select polls and advances the clock to the timer.
+        """
+        def __init__(self, selector, clock):
+            self._selector = selector
+            self._clock = clock
+
+        def select(self, timeout=None):
+            if timeout is None:
+                # no timers pending: only I/O (or another thread) can
+                #  wake the loop.
+                return self._selector.select(None)
+            events = self._selector.select(0)
+            if not events and timeout > 0:
+                self._clock.advance(timeout)
+            return events
+
+        def __getattr__(self, name):
+            return getattr(self._selector, name)
+
+    class VirtualEventLoop(asyncio.SelectorEventLoop):
+        """
+        An event loop whose time is clock's, which jumps the clock to
+        the next timer instead of waiting for it.
+        """
+        def __init__(self, clock, selector=None):
+            if selector is None:
+                selector = selectors.DefaultSelector()
+            self.clock = clock
+            super(VirtualEventLoop, self).__init__(_CollapsingSelector(selector, clock))
+
+        def time(self):
+            return self.clock.monotonic()
+
+    class VirtualEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+        def __init__(self, clock):
+            super(VirtualEventLoopPolicy, self).__init__()
+            self.clock = clock
+
+        def new_event_loop(self):
+            return VirtualEventLoop(self.clock)
+
+class ClockDoubler(DoublerBase):
+    """
+    Swaps the clock for a VirtualClock while applied::
+
+        clock_doubler = ClockDoubler()
+        manager.register_double(clock_doubler)
+
+        with doubles.applied(manager, 'clock'):
+            client.fetch_with_retries()   # backs off without sleeping
+            clock_doubler.clock.advance(3600)
+            assert session.expired
+
+    The clock keeps its time between applications.  Aliases in modules
+    named by (or within) skip_modules are left alone.  If use_asyncio is
+    true, asyncio.sleep and the event loop policy are swapped too.
+    """
+    def __init__(self, name='clock', clock=None, skip_modules=DEFAULT_SKIP_MODULES,
+                 use_asyncio=True, tags=(), requires=(), conflicts=()):
+        super(ClockDoubler, self).__init__(name, tags, requires, conflicts)
+        self.clock = VirtualClock() if clock is None else clock
+        self.skip_modules = skip_modules
+        self.use_asyncio = use_asyncio and asyncio is not None and sys.version_info >= (3, 7)
+        self._patch = None
+        self._policy = None
+
+    def _replacements(self):
+        replacements = [
+            (time, 'time', self.clock.time),
+            (time, 'sleep', self.clock.sleep),
+        ]
+        for attr in ('monotonic', 'time_ns', 'monotonic_ns'):
+            if hasattr(time, attr):
+                replacements.append((time, attr, getattr(self.clock, attr)))
+        if self.use_asyncio:
+            from . import _py3
+            import asyncio.tasks
+            sleep = _py3.virtual_sleep(self.clock, asyncio.tasks.sleep, VirtualEventLoop)
+            replacements.append((asyncio.tasks, 'sleep', sleep))
+            replacements.append((asyncio, 'sleep', sleep))
+        return replacements
+
+    def apply(self):
+        if self._patch is None:
+            # kept, so that alias scans are only repeated for new modules.
+            self._patch = AliasPatch(self._replacements(), self.skip_modules)
+        self._patch.apply()
+        if self.use_asyncio:
+            self._policy = asyncio.get_event_loop_policy()
+            asyncio.set_event_loop_policy(VirtualEventLoopPolicy(self.clock))
+
+    def unapply(self):
+        if self._patch is None or not self._patch.patched:
+            raise UnexpectedUnapply
+        if self._policy is not None:
+            asyncio.set_event_loop_policy(self._policy)
+            self._policy = None
+        self._patch.restore()
+
+    def patched(self):
+        """
+        Returns the (module, name) locations swapped while applied.
+        """
+        if self._patch is None:
+            return []
+        return self._patch.aliases()
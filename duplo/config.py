@@ -0,0 +1,120 @@
+"""
+Declares PatchingDoublers in a config file rather than in code.
+
+A JSON file maps each double's name to its variant, targets and
+(optionally) tags, requires and conflicts::
+
+    {
+        "mailing_list": {
+            "variant": "myproject.fakes:FakeMailingList",
+            "targets": ["myproject.mail:mailing_list", "myproject.views:mailing_list"],
+            "tags": ["email"]
+        }
+    }
+
+Any other file is read as INI, with a section per double, and targets,
+tags, requires and conflicts separated by whitespace::
+
+    [mailing_list]
+    variant = myproject.fakes:FakeMailingList
+    targets =
+        myproject.mail:mailing_list
+        myproject.views:mailing_list
+    tags = email
+
+load_config registers a DoubleSpec per double, so no PatchingDoubler is
+built until the double is first selected.  The parsed file is cached,
+as JSON in a per-user directory (keyed by its path, mtime and size), so
+later runs skip parsing it.
+"""
+import hashlib, json, os
+from collections import namedtuple, OrderedDict
+from functools import partial
+
+from . import _cache, six
+from .six.moves import configparser
+from .doubles import DoubleSpec, PatchingDoubler
+
+class ConfigError(ValueError):
+    pass
+
+# a double, as declared; all but name and variant are tuples.
+Declaration = namedtuple('Declaration', 'name variant targets tags requires conflicts')
+
+# bumped whenever the cached form changes.
+_CACHE_VERSION = 3
+
+def _names(entry, key):
+    names = entry.get(key) or ()
+    if isinstance(names, six.string_types):
+        names = names.split()
+    return tuple(names)
+
+def _declare(path, name, entry):
+    variant, targets = entry.get('variant'), _names(entry, 'targets')
+    if variant is None or variant == '' or not targets:
+        raise ConfigError("{0} declares {1} without a variant and targets.".format(path, name))
+    return Declaration(name, variant, targets, _names(entry, 'tags'),
+                       _names(entry, 'requires'), _names(entry, 'conflicts'))
+
+def parse_config(path):
+    """
+    Returns the Declarations in the file at path, in file order.
+    """
+    if path.endswith('.json'):
+        with open(path) as fh:
+            try:
+                entries = json.load(fh, object_pairs_hook=OrderedDict)
+            except ValueError as e:
+                raise ConfigError("{0} isn't valid JSON: {1}".format(path, e))
+        if not isinstance(entries, dict):
+            raise ConfigError("{0} should hold an object mapping names to doubles.".format(path))
+        items = entries.items()
+    else:
+        parser = configparser.RawConfigParser()
+        try:
+            parser.read(path)
+        except configparser.Error as e:
+            raise ConfigError("{0} isn't valid INI: {1}".format(path, e))
+        items = [(name, dict(parser.items(name))) for name in parser.sections()]
+    return [_declare(path, name, entry) for name, entry in items]
+
+def _cache_path(path, cache_dir):
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir or _cache.user_cache_dir(), "config-{0}.json".format(digest))
+
+def _declaration(name, variant, targets, tags, requires, conflicts):
+    return Declaration(name, variant, tuple(targets), tuple(tags), tuple(requires), tuple(conflicts))
+
+def read_config(path, cache_dir=None):
+    """
+    Returns the Declarations in the file at path, parsing it only if
+    its cache (in cache_dir, by default the user's cache directory) is
+    missing or stale.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (_CACHE_VERSION, path, stat.st_mtime, stat.st_size)
+    cache_path = _cache_path(path, cache_dir)
+    cached = _cache.read(cache_path, key)
+    if cached is not None:
+        try:
+            return [_declaration(*declaration) for declaration in cached]
+        except TypeError: # not what was cached
+            pass
+
+    declarations = parse_config(path)
+    _cache.write(cache_path, key, [list(declaration) for declaration in declarations])
+    return declarations
+
+def load_config(manager, path, cache_dir=None):
+    """
+    Registers a DoubleSpec with manager for each double declared in the
+    file at path, and returns their names.
+    """
+    names = []
+    for name, variant, targets, tags, requires, conflicts in read_config(path, cache_dir):
+        build = partial(PatchingDoubler, name, variant, list(targets), tags, requires, conflicts)
+        manager.register_double(DoubleSpec(name, build, tags, requires, conflicts))
+        names.append(name)
+    return names
@@ -0,0 +1,134 @@
+"""
+Finds doubles advertised by installed packages through entry points.
+
+A package advertises a double with an entry point in the duplo.doubles
+group, named for the double, pointing at the double or at a callable
+which returns it, e.g. in setup.py::
+
+    entry_points={
+        'duplo.doubles': [
+            'payments = payments.testing:make_payments_double [payments, network]',
+        ],
+    }
+
+Extras (in brackets) are taken as the double's tags, sorted.  Nothing from the
+providing package is imported until the double is selected.
+
+Scanning package metadata is slow, so the entry points found are kept
+for the rest of the process, per group and sys.path, and cached as JSON
+in a per-user directory, keyed by the group, the mtimes of the
+directories on sys.path (which change as packages are installed) and
+the sizes and mtimes of the packages' metadata in them (which change as
+e.g. editable installs are reinstalled).
+"""
+import hashlib, importlib, os, sys
+from collections import namedtuple
+
+from . import _cache
+
+GROUP = 'duplo.doubles'
+
+# value is 'module:attribute.path'.
+Advertised = namedtuple('Advertised', 'name value tags')
+
+# bumped whenever the cached form changes.
+_CACHE_VERSION = 3
+
+# (group, sys.path) -> Advertised list, for this process.
+_found = {}
+
+def _parse(name, value):
+    value, _, extras = value.partition('[')
+    tags = tuple(sorted(extra.strip() for extra in extras.rstrip(' ]').split(',') if extra.strip()))
+    return Advertised(name, value.strip(), tags)
+
+def _scan(group):
+    try:
+        from importlib import metadata
+    except ImportError:
+        metadata = None
+    if metadata is not None:
+        entry_points = metadata.entry_points()
+        if hasattr(entry_points, 'select'):
+            entry_points = entry_points.select(group=group)
+        else:
+            entry_points = entry_points.get(group, ())
+        return [_parse(ep.name, ep.value) for ep in entry_points]
+
+    import pkg_resources
+    # a fresh working set, since the global one only reflects sys.path
+    #  and the metadata as they were when pkg_resources was imported.
+    working_set = pkg_resources.WorkingSet()
+    # extras sorted, as pkg_resources doesn't keep their order.
+    return [Advertised(ep.name, "{0}:{1}".format(ep.module_name, '.'.join(ep.attrs)), tuple(sorted(ep.extras)))
+            for ep in working_set.iter_entry_points(group)]
+
+_METADATA = ('.dist-info', '.egg-info')
+
+def _stamp(path):
+    # size as well as mtime, which some filesystems only keep to the
+    #  second (or two).
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, getattr(stat, 'st_mtime_ns', stat.st_mtime))
+
+def _cache_key(group):
+    paths = []
+    for path in sys.path:
+        directory = path or '.'
+        try:
+            paths.append((path, _stamp(directory)))
+            names = sorted(os.listdir(directory))
+        except OSError: # missing, or not a directory (e.g. a zip)
+            continue
+        for name in names:
+            if name.endswith(_METADATA):
+                metadata = os.path.join(directory, name)
+                paths.append((metadata, _stamp(metadata),
+                              _stamp(os.path.join(metadata, 'entry_points.txt'))))
+    return (_CACHE_VERSION, group, tuple(paths))
+
+def _cache_path(group, cache_dir):
+    # one file per group and sys.path, replaced as packages change.
+    digest = hashlib.sha1(repr((group, sys.path)).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir or _cache.user_cache_dir(), "entry-points-{0}.json".format(digest))
+
+def advertised(group=GROUP, cache_dir=None):
+    """
+    Returns the Advertised doubles in group, scanning package metadata
+    only if neither this process (for the same sys.path) nor the cache
+    in cache_dir (by default the user's cache directory) has seen the
+    current packages.
+    """
+    found_key = (group, tuple(sys.path))
+    try:
+        return _found[found_key]
+    except KeyError:
+        pass
+
+    key = _cache_key(group)
+    cache_path = _cache_path(group, cache_dir)
+    found = _cache.read(cache_path, key)
+    try:
+        found = [Advertised(name, value, tuple(tags)) for name, value, tags in found]
+    except (TypeError, ValueError): # nothing (or not what was) cached
+        found = _scan(group)
+        _cache.write(cache_path, key, [list(entry) for entry in found])
+    _found[found_key] = found
+    return found
+
+def load(value):
+    """
+    Imports the object at value ('module:attribute.path') and returns
+    the double it is, or the double it returns if it's callable.
+    """
+    module_name, _, path = value.partition(':')
+    obj = importlib.import_module(module_name)
+    for attr in path.split('.') if path else ():
+        obj = getattr(obj, attr)
+    from .doubles import DoublerBase
+    if not isinstance(obj, DoublerBase) and callable(obj):
+        obj = obj()
+    return obj
@@ -1,7 +1,17 @@
-import importlib, operator, sys
-from collections import defaultdict
-from contextlib import contextmanager
+import fnmatch, functools, importlib, inspect, operator, re, sys, unittest
+from collections import defaultdict, namedtuple, OrderedDict
+from timeit import default_timer
 from . import six
+from ._workers import WorkerPool
+
+if sys.version_info >= (3, 5):
+    from . import _py3
+    _is_coroutine_function = inspect.iscoroutinefunction
+else:
+    _py3 = None
+    _is_coroutine_function = lambda func: False
+
+_GLOB_CHARS = re.compile(r'[*?[]')
 
 class EmptyContext(ValueError):
     pass
@@ -10,10 +20,21 @@ class Context(object):
     """
     A stack of dictionaries, which provides an abstraction of shadowing
     for applying and unapplying.
+
+    Empty frames are only counted, not stored.  If max_depth is given,
+    pushing beyond it merges the oldest frame into the base frame, so
+    the stack stays bounded, though compacted frames can't be popped.
     """
-    def __init__(self, default):
+    def __init__(self, default, max_depth=None):
+        if max_depth is not None and max_depth < 1:
+            raise ValueError("max_depth must be at least 1.")
         self._default = default
+        self.max_depth = max_depth
         self.stack = [defaultdict(default)]
+        # the number of empty frames pushed on top of each frame.
+        self._empties = [0]
+        self.empty_frames = 0
+        self.compacted = 0
 
     def __getitem__(self, name):
         for frame in reversed(self.stack):
@@ -27,17 +48,51 @@ class Context(object):
 
     @property
     def depth(self):
-        return len(self.stack)
+        return len(self.stack) + self.empty_frames
 
     def push(self):
         self.stack.append({})
+        self._empties.append(0)
+        if self.max_depth is not None and len(self.stack) > self.max_depth + 1:
+            self._compact()
+
+    def record(self, values):
+        """
+        Pushes a frame holding values, or only counts it if it's empty.
+        """
+        if values:
+            self.push()
+            # keeping the order of values, if it has one.
+            self.stack[-1] = values
+        else:
+            self._empties[-1] += 1
+            self.empty_frames += 1
+
+    def _compact(self):
+        base = self.stack[0]
+        base.update(self.stack.pop(1))
+        self._empties[0] += self._empties.pop(1)
+        # values equal to the default say nothing once at the bottom.
+        default = self._default()
+        for name in [name for name, value in base.items() if value == default]:
+            del base[name]
+        self.compacted += 1
 
     def pop(self):
+        if self._empties[-1]:
+            self._empties[-1] -= 1
+            self.empty_frames -= 1
+            return {}
         if len(self.stack) == 1:
             raise EmptyContext("Context stack empty")
 
+        self._empties.pop()
         return self.stack.pop()
 
+    @property
+    def entries(self):
+        return sum(len(frame) for frame in self.stack)
+
     def keys(self):
         all_keys = set()
         for frame in self.stack:
@@ -53,12 +108,28 @@ class Context(object):
     def update(self, values):
         self.stack[-1].update(values)
 
+def _name_set(names):
+    if isinstance(names, six.string_types):
+        names = [names]
+    return frozenset(names)
+
 class DoublerBase(object):
     """
     An "interface" for managing doubles.
+
+    tags are arbitrary labels (e.g. 'network', 'slow') used to select
+    groups of doubles.
+
+    requires names doubles which must be applied along with this one,
+    and conflicts names doubles which mustn't be.
     """
-    def __init__(self, name):
+    tags = requires = conflicts = frozenset()
+
+    def __init__(self, name, tags=(), requires=(), conflicts=()):
         self.name = name
+        self.tags = _name_set(tags)
+        self.requires = _name_set(requires)
+        self.conflicts = _name_set(conflicts)
 
     def __unicode__(self):
         return u"<Double: {0}>".format(self.name)
@@ -78,15 +149,24 @@ class MissingPatchTarget(ValueError):
 class UnexpectedUnapply(TypeError):
     pass
 
+_MODULE_NAME = re.compile(r'^[A-Za-z_]\w*(\.[A-Za-z_]\w*)*$')
+
+# owner returns the object an attribute target is on (None for modules).
+_Resolution = namedtuple('_Resolution', 'getter setter snapshot owner')
+
+# snapshot of an attribute its owner only inherits.
+_INHERITED = object()
+
 class PatchingDoubler(DoublerBase):
     """
     A doubler which is applied through monkey patches.
 
     Targets is a list of importable names to be patched, e.g.
-    ['some.module:name']
+    ['some.module:name'], or dotted paths to attributes of objects in
+    modules, e.g. ['some.module:Class.method', 'some.module:registry.client'].
     """
-    def __init__(self, name, variant, targets):
-        super(PatchingDoubler, self).__init__(name)
+    def __init__(self, name, variant, targets, tags=(), requires=(), conflicts=()):
+        super(PatchingDoubler, self).__init__(name, tags, requires, conflicts)
         if isinstance(targets, six.string_types):
             targets = [targets]
 
@@ -95,8 +175,24 @@ class PatchingDoubler(DoublerBase):
 
         self.targets = targets
 
-        self.normals = [] # set when first applied, same order as targets
+        # target -> the object it held before it was patched, for the
+        #  targets currently applied.
+        self.originals = {}
         self.variant = variant
+        # the (wrapped) variant patched in, while any target is applied.
+        self._patched = None
+
+        # callables taking (doubler, variant) and returning the object to
+        #  patch in instead, e.g. to instrument the variant.
+        self.variant_wrappers = []
+
+        # target -> its raw value before patching, for targets whose
+        #  resolution takes snapshots.
+        self._snapshots = {}
+
+        # resolution caches, filled as targets and variants are resolved.
+        self._resolutions = {}
+        self._variants = {}
 
     def patching_attribute(self, name_maybe):
         return name_maybe is not None
@@ -132,31 +228,98 @@ class PatchingDoubler(DoublerBase):
     def _resolve_variant(self, variant):
         if isinstance(variant, six.string_types):
             try:
-                return self._resolve_target(variant)[0]()
+                return self._variants[variant]
+            except KeyError:
+                pass
+            try:
+                resolved = self._resolve_target(variant)[0]()
             except MissingPatchTarget: # assume it's a literal value
-                return variant
+                # but only remember that if it couldn't name a module,
+                #  so a variant module which failed to import once (e.g.
+                #  while prefetching) is tried again.
+                if _MODULE_NAME.match(self._parse_target(variant)[0]):
+                    return variant
+                resolved = variant
+            self._variants[variant] = resolved
+            return resolved
         return variant
 
-
     def _resolve_target(self, target):
         """
-        Returns a getter and setter for the given target.
+        Returns a _Resolution (getter, setter, snapshot, or None if the
+        getter's value restores the target, and owner) for the given
+        target.
+
+        Resolutions are cached, so each target is only imported once.
         """
+        try:
+            return self._resolutions[target]
+        except KeyError:
+            resolution = self._resolutions[target] = self._build_resolution(target)
+            return resolution
+
+    def _build_resolution(self, target):
         module_name, name_maybe = self._parse_target(target)
         module = self._resolve_module(module_name, name_maybe)
 
         if self.patching_attribute(name_maybe):
+            # module:owner.path.attr patches attr on the object the path
+            #  leads to, followed again only if the module is swapped
+            #  (e.g. by a double targeting the module) in sys.modules.
+            links = name_maybe.split('.')
+            name = links[-1]
+            found = [module, self._resolve_chain(module, module_name, links[:-1])]
+
+            def current_owner():
+                current = sys.modules.get(module_name, found[0])
+                if current is not found[0]:
+                    found[:] = [current, self._resolve_chain(current, module_name, links[:-1])]
+                return found[1]
+
             def make_attr_getter():
                 def getter():
                     try:
-                        return getattr(module, name_maybe)
+                        return getattr(current_owner(), name)
                     except AttributeError:
                         formatted_name = self._format_target(module_name, name_maybe)
                         raise MissingPatchTarget("Unable to find {0}".format(formatted_name))
                 return getter
 
-            return make_attr_getter(), lambda value: setattr(module, name_maybe, value)
+            if len(links) == 1:
+                return _Resolution(make_attr_getter(),
+                                   lambda value: setattr(current_owner(), name, value), None,
+                                   current_owner)
+
+            def make_snapshot():
+                def snapshot():
+                    # the raw value, so descriptors (e.g. staticmethods)
+                    #  are restored as they were, and inherited attributes
+                    #  are deleted rather than copied onto the owner.
+                    owner = current_owner()
+                    try:
+                        return vars(owner).get(name, _INHERITED)
+                    except TypeError: # no __dict__, e.g. __slots__
+                        return getattr(owner, name)
+                return snapshot
+
+            def make_chain_setter():
+                def setter(value):
+                    if value is _INHERITED:
+                        delattr(current_owner(), name)
+                    else:
+                        setattr(current_owner(), name, value)
+                return setter
+
+            return _Resolution(make_attr_getter(), make_chain_setter(), make_snapshot(), current_owner)
         else:
+            def make_module_getter():
+                def getter():
+                    # the module may have been swapped since resolution.
+                    if module_name in sys.modules:
+                        return sys.modules[module_name]
+                    return self._resolve_module(module_name, name_maybe)
+                return getter
+
             def make_module_setter():
                 def setter(value):
                     if value is None:
@@ -165,25 +328,130 @@ class PatchingDoubler(DoublerBase):
                         sys.modules[module_name] = value
                 return setter
 
-            return lambda: module, make_module_setter()
+            return _Resolution(make_module_getter(), make_module_setter(), None, None)
 
-    def apply(self):
+    def _resolve_chain(self, module, module_name, links):
+        """
+        Follows links (attribute names) from module, naming the first
+        link which can't be followed if any.
+        """
+        obj = module
+        for i, link in enumerate(links):
+            try:
+                obj = getattr(obj, link)
+            except AttributeError:
+                followed = self._format_target(module_name, '.'.join(links[:i]) or None)
+                raise MissingPatchTarget("Unable to find {0}: {1} has no attribute {2!r}".format(
+                    self._format_target(module_name, '.'.join(links[:i + 1])), followed, link))
+        return obj
+
+    def module_names(self):
+        """
+        Returns the names of the modules referenced by the targets and
+        variant, as (module name, role) pairs, where role is 'target'
+        or 'variant'.
+        """
+        names = [(self._parse_target(target)[0], 'target') for target in self.targets]
+        if isinstance(self.variant, six.string_types):
+            names.append((self._parse_target(self.variant)[0], 'variant'))
+        return names
+
+    def resolve(self):
+        """
+        Resolves the targets and variant ahead of application.
+        """
         for target in self.targets:
-            getter, setter = self._resolve_target(target)
+            self._resolve_target(target)
+        self._resolve_variant(self.variant)
 
-            self.normals.append(getter())
+    @property
+    def normals(self):
+        """
+        The originals of the applied targets, in the same order as targets.
+        """
+        return [self.originals[target] for target in self.targets if target in self.originals]
+
+    def _conform_targets(self, targets):
+        if targets is None:
+            return self.targets
+        if isinstance(targets, six.string_types):
+            targets = [targets]
+        unknown = [target for target in targets if target not in self.targets]
+        if unknown:
+            raise MissingPatchTarget("{0} are not targets of {1}".format(unknown, self.name))
+        return targets
+
+    def apply(self, targets=None):
+        """
+        Patches targets (by default, all of them) with the variant.
 
+        Targets already holding the variant are left alone; a target
+        which was applied but has since been rebound (e.g. by a late
+        import) is patched again, keeping its first original.
+        """
+        targets = self._conform_targets(targets)
+        if not self.originals:
             variant = self._resolve_variant(self.variant)
+            for wrapper in self.variant_wrappers:
+                variant = wrapper(self, variant)
+            self._patched = variant
+        variant = self._patched
+
+        for target in targets:
+            getter, setter, snapshot, owner = self._resolve_target(target)
+            if target in self.originals:
+                if getter() is variant:
+                    continue
+            else:
+                if snapshot is not None:
+                    self._snapshots[target] = snapshot()
+                self.originals[target] = getter()
             setter(variant)
 
-    def unapply(self):
-        if not len(self.normals):
+    def unapply(self, targets=None):
+        """
+        Restores targets (by default, all of them) to their originals.
+        Targets which aren't applied are left alone, though unapplying
+        all targets when none are applied is an error.
+        """
+        if targets is None and not self.originals:
             raise UnexpectedUnapply
 
-        for target in self.targets:
-            getter, setter = self._resolve_target(target)
-            original = self.normals.pop()
-            setter(original)
+        # in reverse, so that targets naming the same place end up with
+        #  the first original.
+        for target in reversed(self._conform_targets(targets)):
+            if target not in self.originals:
+                continue
+            setter = self._resolve_target(target).setter
+            original = self.originals.pop(target)
+            setter(self._snapshots.pop(target, original))
+
+        if not self.originals:
+            self._patched = None
+
+class WrappingDoubler(PatchingDoubler):
+    """
+    A doubler whose variant wraps the normal implementation, e.g. to
+    cache or record calls to it.
+
+    Targets are the aliases of one normal implementation.  Subclasses
+    implement wrap, which is given the normal implementation on first
+    application and returns the variant; that variant is kept across
+    applications.
+    """
+    def __init__(self, name, targets, tags=(), requires=(), conflicts=()):
+        super(WrappingDoubler, self).__init__(name, None, targets, tags, requires, conflicts)
+        self.wrapper = None
+
+    def wrap(self, normal):
+        raise NotImplementedError
+
+    def apply(self, targets=None):
+        if self.wrapper is None:
+            getter = self._resolve_target(self.targets[0]).getter
+            self.wrapper = self.wrap(getter())
+        self.variant = self.wrapper
+        super(WrappingDoubler, self).apply(targets)
 
 class MissingDouble(ValueError):
     """
@@ -198,12 +466,188 @@ class UnappliedDouble(ValueError):
 
     pass
 
+class ConflictingDoubles(ValueError):
+    """
+    Raised when doubles which conflict would be applied together.
+    """
+    pass
+
 class DuplicateRegistration(ValueError):
     """
     A double with the given name was already registered.
     """
     pass
 
+class DoubleSpec(object):
+    """
+    Stands in for a double in a registry until the double is first
+    looked up, when build() is called to make it.  The tags, requires
+    and conflicts are known up front, so selecting by tag doesn't build
+    anything, and they're added to those of the double built.
+    """
+    __slots__ = ('name', 'build', 'tags', 'requires', 'conflicts')
+
+    def __init__(self, name, build, tags=(), requires=(), conflicts=()):
+        self.name = name
+        self.build = build
+        self.tags = _name_set(tags)
+        self.requires = _name_set(requires)
+        self.conflicts = _name_set(conflicts)
+
+    def __repr__(self):
+        return "<DoubleSpec: {0}>".format(self.name)
+
+    def materialize(self):
+        double = self.build()
+        if not isinstance(double, DoublerBase) or double.name != self.name:
+            raise MissingDouble("Building {0} gave {1!r}, not a double named {0}.".format(self.name, double))
+        double.tags = double.tags | self.tags
+        double.requires = double.requires | self.requires
+        double.conflicts = double.conflicts | self.conflicts
+        return double
+
+class Registry(object):
+    """
+    Maps double names to doublers, falling back to a parent registry
+    for names not registered here.
+
+    Names found through the parent are remembered, so lookups cost the
+    same however long the chain of parents.  Since registrations are
+    never replaced or removed, remembered entries can't go stale.
+
+    A DoubleSpec registered here is replaced by the double it builds
+    when its name is first looked up.
+    """
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.own = {}
+        self._inherited = {}
+
+    def __getitem__(self, name):
+        try:
+            double = self.own[name]
+        except KeyError:
+            pass
+        else:
+            if isinstance(double, DoubleSpec):
+                double = self.own[name] = double.materialize()
+            return double
+        try:
+            return self._inherited[name]
+        except KeyError:
+            pass
+        if self.parent is None:
+            raise KeyError(name)
+        double = self._inherited[name] = self.parent[name]
+        return double
+
+    def __setitem__(self, name, double):
+        self.own[name] = double
+
+    def __contains__(self, name):
+        # without building specs.
+        if name in self.own or name in self._inherited:
+            return True
+        return self.parent is not None and name in self.parent
+
+    def built(self, name):
+        """
+        Returns the double registered as name, or None if there's none
+        or it's a DoubleSpec not yet built, without building it.
+        """
+        double = self.own.get(name)
+        if double is None:
+            double = self._inherited.get(name)
+        if double is None and self.parent is not None:
+            return self.parent.built(name)
+        return None if isinstance(double, DoubleSpec) else double
+
+    def unbuilt(self):
+        """
+        Returns the names of the DoubleSpecs not yet built.
+        """
+        names = [name for name, double in self.own.items() if isinstance(double, DoubleSpec)]
+        if self.parent is None:
+            return names
+        return self.parent.unbuilt() + names
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def keys(self):
+        if self.parent is None:
+            return list(self.own.keys())
+        return self.parent.keys() + list(self.own.keys())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def values(self):
+        return [self[name] for name in self.keys()]
+
+    def items(self):
+        return [(name, self[name]) for name in self.keys()]
+
+# already_imported modules were in sys.modules before the prefetch, and
+#  error is the exception raised by a failed import.
+ModuleImport = namedtuple('ModuleImport', 'module seconds already_imported error doubles')
+
+# action is 'apply', 'unapply' or 'revert', and applied is whether the
+#  double is applied afterwards.
+DoubleEvent = namedtuple('DoubleEvent', 'action name targets applied')
+
+# what the application stack holds: frames stored, empty frames counted,
+#  frames compacted, entries across frames, and (name, target, original)
+#  for each original kept by a double on the stack.
+MemoryReport = namedtuple('MemoryReport', 'frames empty_frames compacted entries originals')
+
+_Subscription = namedtuple('_Subscription', 'callback actions targets')
+
+# selections and patterns each manager remembers the results for.
+SELECTION_CACHE_SIZE = 256
+
+class _SelectionCache(object):
+    """
+    Remembers up to maxsize values worked out for one generation of a
+    manager family, evicting the least recently used.  Values from
+    earlier generations are dropped as soon as a later one is seen.
+    """
+    def __init__(self, maxsize=SELECTION_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._generation = None
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _move_to(self, generation):
+        if generation != self._generation:
+            self._entries.clear()
+            self._generation = generation
+
+    def get(self, key, generation):
+        self._move_to(generation)
+        value = self._entries.pop(key, None)
+        if value is not None:
+            # re-inserted to mark as most recently used.
+            self._entries[key] = value
+        return value
+
+    def set(self, key, generation, value):
+        self._move_to(generation)
+        self._entries[key] = value
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
 class DoubleManager(object):
     """
     Applies each double once (and only once).
@@ -215,51 +659,307 @@ class DoubleManager(object):
 
     .revert returns the doubles to the state they were in before
     the previous call to apply or unapply.
+
+    A child manager (see .child) sees its parent's doubles as well as
+    its own, and shares its parent's application stack.
+
+    max_depth bounds the application stack (see Context); reverting
+    more times than it keeps raises UnappliedDouble.
+
+    With refcount, each apply_doubles counts the doubles it selects,
+    and reverting it uncounts them; a double is only applied when its
+    count leaves 0 and unapplied when it returns to 0.  unapply_doubles
+    unapplies regardless of the count, until reverted.
     """
-    def __init__(self):
-        self._applieds = Context(bool)
-        self.registry = {}
+    def __init__(self, parent=None, max_depth=None, refcount=False):
+        self.parent = parent
+        self._subscribed = []
+        self._tag_index = defaultdict(set)
+        # pattern -> the names it matches.
+        self._pattern_cache = _SelectionCache()
+        # (action, names) -> doubles in the order to act on.
+        self._order_cache = _SelectionCache()
+        self._discovered = set()
+        if parent is None:
+            self.registry = Registry()
+            self._applieds = Context(int if refcount else bool, max_depth)
+            self._refcounted = refcount
+            # name -> names of the doubles it conflicts with, either way.
+            self._conflicts = defaultdict(set)
+            # name -> names of the doubles which require it.
+            self._dependents = defaultdict(set)
+            # bumped on each registration anywhere in the family, so
+            #  selections can be cached.
+            self._generation = [0]
+        else:
+            self.registry = Registry(parent.registry)
+            self._applieds = parent._applieds
+            self._refcounted = parent._refcounted
+            self._conflicts = parent._conflicts
+            self._dependents = parent._dependents
+            self._generation = parent._generation
+
+    def child(self):
+        """
+        Returns a manager which inherits this one's doubles (without
+        copying them) and can register doubles of its own.  Applying or
+        reverting through either manager affects the same stack.
+        """
+        return DoubleManager(parent=self)
+
+    @property
+    def generation(self):
+        return self._generation[0]
 
     def register_double(self, double):
-        if not isinstance(double, DoublerBase):
+        """
+        Registers a double, or a DoubleSpec to build it when it's first
+        selected.
+        """
+        if not isinstance(double, (DoublerBase, DoubleSpec)):
             raise MissingDouble("Unable to register {0}.".format(double))
         if double.name in self.registry:
             raise DuplicateRegistration("{0} was registered twice. Duplicate import?".format(double.name))
         self.registry[double.name] = double
+        for tag in double.tags:
+            self._tag_index[tag].add(double.name)
+        self._index_relations(double)
+        self._generation[0] += 1
+        # related managers' caches are dropped on their next lookup.
+        self._order_cache.clear()
+        self._pattern_cache.clear()
+
+    def _index_relations(self, double):
+        """
+        Indexes the conflicts and requirements of double, and returns
+        whether any were new.
+        """
+        new = False
+        for name in double.conflicts:
+            if name not in self._conflicts[double.name]:
+                new = True
+                self._conflicts[double.name].add(name)
+                self._conflicts[name].add(double.name)
+        for name in double.requires:
+            if double.name not in self._dependents[name]:
+                new = True
+                self._dependents[name].add(double.name)
+        return new
+
+    def discover(self, group='duplo.doubles', cache_dir=None):
+        """
+        Registers a DoubleSpec for each double advertised through entry
+        points in group by installed packages (see duplo.discovery), so
+        the providing module is only imported when the double is
+        selected.  Returns the names registered; discovering a group
+        again registers nothing.
+        """
+        from . import discovery
+
+        if group in self._discovered:
+            return []
+        names = []
+        for name, value, tags in discovery.advertised(group, cache_dir):
+            self.register_double(DoubleSpec(name, functools.partial(discovery.load, value), tags))
+            names.append(name)
+        self._discovered.add(group)
+        return names
+
+    def _tag_indexes(self):
+        manager = self
+        while manager is not None:
+            yield manager._tag_index
+            manager = manager.parent
+
+    def _tagged(self, tag):
+        for index in self._tag_indexes():
+            for name in index.get(tag, ()):
+                yield name
+
+    def tagged(self, tag):
+        """
+        Returns the names of the doubles carrying tag.
+        """
+        return set(self._tagged(tag))
+
+    def referenced_modules(self):
+        """
+        Maps the name of each module referenced by the registered
+        PatchingDoublers to a list of (double name, role) pairs, where
+        role is 'target' or 'variant'.
+        """
+        modules = OrderedDict()
+        for name in sorted(self.registry.keys()):
+            double = self.registry[name]
+            if not isinstance(double, PatchingDoubler):
+                continue
+            for module_name, role in double.module_names():
+                modules.setdefault(module_name, []).append((double.name, role))
+        return modules
+
+    def prefetch(self, concurrency=None):
+        """
+        Imports every target and variant module referenced by the
+        registered PatchingDoublers and fills their resolution caches,
+        so that the cost isn't paid by the first apply_doubles.
 
-    def _resolve_included(self, include, exclude):
+        With a concurrency greater than 1, modules are imported on that
+        many worker threads.  Only do that if the modules are safe to
+        import concurrently (e.g. no import-time side effects which depend
+        on import order).  Python 2 serializes imports regardless.
+
+        Returns a list of ModuleImport, most expensive first.  Times for
+        concurrent imports overlap and include waiting on shared imports.
         """
-        Expands include and exclude into a concrete list of doubles
-        to work upon.
+        modules = self.referenced_modules()
+
+        timings = {}
+        pending = [name for name in modules if name not in sys.modules]
+        if concurrency is not None and concurrency > 1 and not six.PY2:
+            with WorkerPool(concurrency) as pool:
+                tasks = [(name, pool.submit(importlib.import_module, name)) for name in pending]
+                for name, task in tasks:
+                    task.wait()
+                    error = task.exc_info[1] if task.exc_info else None
+                    timings[name] = (task.elapsed, error)
+        else:
+            for name in pending:
+                started = default_timer()
+                try:
+                    importlib.import_module(name)
+                    error = None
+                except Exception as e:
+                    error = e
+                timings[name] = (default_timer() - started, error)
+
+        for double in self.registry.values():
+            if not isinstance(double, PatchingDoubler):
+                continue
+            try:
+                double.resolve()
+            except Exception:
+                # reported through the failed import, or at application.
+                pass
+
+        report = []
+        for name, referrers in modules.items():
+            seconds, error = timings.get(name, (0.0, None))
+            report.append(ModuleImport(
+                name, seconds, name not in timings, error,
+                sorted(set(double_name for double_name, role in referrers)),
+            ))
+        report.sort(key=lambda module_import: -module_import.seconds)
+        return report
+
+    def _resolve_included(self, include, exclude, tags=None, exclude_tags=None):
+        """
+        Expands include and exclude (names or glob patterns) and tags and
+        exclude_tags into a concrete set of double names to work upon.
+
+        Doubles named by include or carrying any of tags are selected;
+        if neither is given, all doubles are.  Those named by exclude or
+        carrying any of exclude_tags are then left out.
         """
         include, exclude = self._conform_double_names(include), self._conform_double_names(exclude)
+        tags, exclude_tags = self._conform_tags(tags), self._conform_tags(exclude_tags)
 
-        if include is None and exclude is None:
+        if include is not None and exclude is not None:
+            raise ValueError("Unable to both include and exclude.")
+
+        if include is None and tags is None:
             included = set(self.registry.keys())
-        elif include is None:
-            included = set(self.registry.keys()) - set(exclude)
-        elif exclude is None:
-            included = set(include)
         else:
-            raise ValueError("Unable to both include and exclude.")
+            included = set(include or ())
+            for tag in tags or ():
+                included.update(self._tagged(tag))
 
-        # check that there weren't any bad names
-        missing = set()
-        if include is not None:
-            missing = set(include) - included
-        elif exclude is not None:
-            missing = included & set(exclude)
+        if exclude is not None:
+            included.difference_update(exclude)
+        for tag in exclude_tags or ():
+            included.difference_update(self._tagged(tag))
 
         return included
 
-    def _resolve_doubles(self, included):
+    def _resolve_doubles(self, included, action_attr='apply'):
         """
-        Maps the given double names to double instances.
+        Maps the given double names to double instances, in the order to
+        act on them: doubles before those requiring them when applying,
+        and the reverse when unapplying.  Applying also selects the
+        doubles required, transitively, and raises ConflictingDoubles if
+        any of the selection conflict; unapplying also selects the
+        doubles requiring them, transitively, so none is left applied
+        without its requirements.
+
+        The most recently used orders are cached until the next
+        registration.
         """
+        key = (action_attr, frozenset(included))
+        doubles = self._order_cache.get(key, self.generation)
+        if doubles is not None:
+            return doubles
+
         try:
-            return [self.registry[name] for name in included]
+            selected = dict((name, self.registry[name]) for name in included)
         except KeyError:
             raise MissingDouble
+        pending = list(selected.values())
+        if action_attr == 'apply':
+            while pending:
+                double = pending.pop()
+                for name in double.requires:
+                    if name in selected:
+                        continue
+                    try:
+                        required = selected[name] = self.registry[name]
+                    except KeyError:
+                        raise MissingDouble("{0} requires {1}, which isn't registered.".format(double.name, name))
+                    pending.append(required)
+            # doubles built since registration may declare more (see
+            #  DoubleSpec), which changes other selections' orders.
+            if any([self._index_relations(double) for double in selected.values()]):
+                self._generation[0] += 1
+            for name in sorted(selected):
+                for other in self._conflicts.get(name, ()):
+                    if other in selected:
+                        raise ConflictingDoubles("{0} and {1} can't be applied together.".format(name, other))
+        else:
+            while pending:
+                double = pending.pop()
+                for name in self._dependents.get(double.name, ()):
+                    # dependents registered with a child aren't visible here.
+                    if name not in selected and name in self.registry:
+                        selected[name] = self.registry[name]
+                        pending.append(selected[name])
+
+        doubles = []
+        visited = set()
+        def visit(double):
+            # marked before its requirements, so cycles end.
+            if double.name in visited:
+                return
+            visited.add(double.name)
+            for name in sorted(double.requires):
+                if name in selected:
+                    visit(selected[name])
+            doubles.append(double)
+        for name in sorted(selected):
+            visit(selected[name])
+        if action_attr == 'unapply':
+            doubles.reverse()
+
+        self._order_cache.set(key, self.generation, doubles)
+        return doubles
+
+    def _check_conflicts(self, doubles):
+        """
+        Raises ConflictingDoubles if any of doubles conflict with a
+        double which is applied and isn't one of them.
+        """
+        names = set(double.name for double in doubles)
+        for double in doubles:
+            for other in self._conflicts.get(double.name, ()):
+                if other not in names and self.is_applied(other):
+                    raise ConflictingDoubles("{0} conflicts with {1}, which is applied.".format(double.name, other))
 
     def _conform_double_names(self, doubles):
         if doubles is None:
@@ -268,42 +968,131 @@ class DoubleManager(object):
         if isinstance(doubles, six.string_types):
             doubles = [doubles]
 
+        if any(_GLOB_CHARS.search(d) for d in doubles):
+            doubles = self._expand_patterns(doubles)
+
         if not all(d in self.registry for d in doubles):
             raise MissingDouble
         return doubles
 
+    def _expand_patterns(self, doubles):
+        expanded = []
+        for name in doubles:
+            if not _GLOB_CHARS.search(name):
+                expanded.append(name)
+                continue
+            matches = self._pattern_cache.get(name, self.generation)
+            if matches is None:
+                matches = fnmatch.filter(self.registry.keys(), name)
+                self._pattern_cache.set(name, self.generation, matches)
+            if not matches:
+                raise MissingDouble("No double matches {0}".format(name))
+            expanded.extend(matches)
+        return expanded
+
+    def _conform_tags(self, tags):
+        if tags is None:
+            return
+
+        if isinstance(tags, six.string_types):
+            tags = [tags]
+
+        for tag in tags:
+            if not any(tag in index for index in self._tag_indexes()):
+                raise MissingDouble("No double is tagged {0}".format(tag))
+        return tags
+
     @property
     def applied(self):
         """
         Returns the names of all currently-applied doubles.
         """
-        return [name for name, applied in self._applieds.items() if applied]
+        # the stack is shared with related managers; only report doubles
+        #  visible from this one.
+        return [double.name for double, applied in self._applieds.items()
+                if applied and self.registry.built(double.name) is double]
+
+    @property
+    def depth(self):
+        """
+        Returns the depth of the application stack: one more than the
+        number of calls revert can undo.
+        """
+        return self._applieds.depth
+
+    def select(self, include=None, exclude=None, tags=None, exclude_tags=None, action='apply'):
+        """
+        Returns the names of the doubles apply_doubles (or, if action is
+        'unapply', unapply_doubles) would act on given the same
+        selection, in the order it would act on them.  Requirements (or,
+        when unapplying, dependents) are included; whether each double
+        is applied isn't considered.
+        """
+        if action not in _ACTIONS:
+            raise ValueError("action must be 'apply' or 'unapply', not {0!r}.".format(action))
+        included = self._resolve_included(include, exclude, tags, exclude_tags)
+        return [double.name for double in self._resolve_doubles(included, action)]
 
     def is_applied(self, name):
-        return name in self.applied
+        # a DoubleSpec can't have been applied before it's built.
+        double = self.registry.built(name)
+        return double is not None and bool(self._applieds[double])
 
-    def apply_doubles(self, include=None, exclude=None):
-        return self._manage_doubles(operator.not_, 'apply', include, exclude)
+    def application_count(self, name):
+        """
+        Returns how many applications of the named double are in
+        effect: its count if the manager is refcounted, else 0 or 1.
+        """
+        double = self.registry.built(name)
+        return 0 if double is None else int(self._applieds[double])
 
-    def unapply_doubles(self, include=None, exclude=None):
-        return self._manage_doubles(operator.truth, 'unapply', include, exclude)
+    def apply_doubles(self, include=None, exclude=None, tags=None, exclude_tags=None):
+        return self._manage_doubles(operator.not_, 'apply', include, exclude, tags, exclude_tags)
 
-    def _manage_doubles(self, operator, action_attr, include=None, exclude=None):
-        included = self._resolve_included(include, exclude)
+    def unapply_doubles(self, include=None, exclude=None, tags=None, exclude_tags=None):
+        return self._manage_doubles(operator.truth, 'unapply', include, exclude, tags, exclude_tags)
 
-        doubles = self._resolve_doubles(included)
+    def _manage_doubles(self, operator, action_attr, include=None, exclude=None,
+                        tags=None, exclude_tags=None):
+        included = self._resolve_included(include, exclude, tags, exclude_tags)
 
-        self._applieds.push()
+        doubles = self._resolve_doubles(included, action_attr)
 
+        return self._run_plan(operator, action_attr, doubles)
+
+    def _run_plan(self, operator, action_attr, doubles):
+        """
+        Applies or unapplies the given (already resolved) doubles.
+        """
+        if action_attr == 'apply' and self._conflicts:
+            self._check_conflicts(doubles)
+        subscriptions = self._subscriptions()
+
+        changes = OrderedDict()
         applied = []
-        for double in doubles:
-            status = self._applieds[double.name]
-            # only do if not already done:
-            if operator(status):
-                # actually apply or unapply
-                getattr(double, action_attr)()
-                self._applieds[double.name] = not status
-                applied.append(double.name)
+        try:
+            for double in doubles:
+                status = changes.get(double, self._applieds[double])
+                if self._refcounted and action_attr == 'apply':
+                    # count each application, but only apply the first.
+                    changes[double] = status + 1
+                    if not status:
+                        double.apply()
+                        applied.append(double.name)
+                        if subscriptions:
+                            self._notify(subscriptions, action_attr, double, True)
+                    continue
+                # only do if not already done:
+                if operator(status):
+                    # actually apply or unapply
+                    getattr(double, action_attr)()
+                    changes[double] = not status
+                    applied.append(double.name)
+                    if subscriptions:
+                        self._notify(subscriptions, action_attr, double, not status)
+        finally:
+            # recorded even if a double failed, so revert undoes the rest.
+            self._applieds.record(changes)
         return applied
 
     def revert(self):
@@ -316,28 +1105,179 @@ class DoubleManager(object):
         except EmptyContext:
             raise UnappliedDouble
 
-        for double_name, applied in previous_doubles.items():
+        subscriptions = self._subscriptions()
+        # undone in the reverse of the order they were done in.
+        for double, applied in reversed(list(previous_doubles.items())):
+            if bool(applied) == bool(self._applieds[double]):
+                # only a count changed.
+                continue
             if applied:
-                self.registry[double_name].unapply()
+                double.unapply()
             else:
-                self.registry[double_name].apply()
+                double.apply()
+            if subscriptions:
+                self._notify(subscriptions, 'revert', double, not applied)
+
+    def memory_report(self):
+        """
+        Returns a MemoryReport on the application stack shared by this
+        manager's family.
+        """
+        applieds = self._applieds
+        originals = []
+        for double in sorted(applieds.keys(), key=lambda double: double.name):
+            for target, original in sorted(getattr(double, 'originals', {}).items()):
+                originals.append((double.name, target, original))
+        return MemoryReport(len(applieds.stack), applieds.empty_frames, applieds.compacted,
+                            applieds.entries, originals)
+
+    def subscribe(self, callback, actions=None, targets=None):
+        """
+        Calls callback with a DoubleEvent each time a double is applied,
+        unapplied or reverted through this manager or its children.
+
+        actions limits the events to some of 'apply', 'unapply' and
+        'revert'.  targets limits them to doubles patching any of the
+        given targets, or any target within the given module names.
+        """
+        if isinstance(actions, six.string_types):
+            actions = [actions]
+        if isinstance(targets, six.string_types):
+            targets = [targets]
+        self._subscribed.append(_Subscription(
+            callback,
+            None if actions is None else frozenset(actions),
+            None if targets is None else frozenset(targets),
+        ))
+        return callback
+
+    def unsubscribe(self, callback):
+        self._subscribed[:] = [s for s in self._subscribed if s.callback != callback]
+
+    def _subscriptions(self):
+        subscriptions = []
+        manager = self
+        while manager is not None:
+            subscriptions.extend(manager._subscribed)
+            manager = manager.parent
+        return subscriptions
+
+    def _notify(self, subscriptions, action, double, applied):
+        targets = tuple(getattr(double, 'targets', ()))
+        event = DoubleEvent(action, double.name, targets, applied)
+        for subscription in subscriptions:
+            if subscription.actions is not None and action not in subscription.actions:
+                continue
+            if subscription.targets is not None and not any(
+                    target in subscription.targets or target.split(':')[0] in subscription.targets
+                    for target in targets):
+                continue
+            subscription.callback(event)
+
+_ACTIONS = {
+    'apply': (operator.not_, 'apply'),
+    'unapply': (operator.truth, 'unapply'),
+}
+
+class _Plan(object):
+    """
+    Applies (or unapplies) a selection of doubles on entry, and reverts
+    on exit.  Usable as a context manager, or as a decorator for
+    functions, generator functions, coroutine functions and TestCase
+    classes (whose test methods are each decorated).
+
+    The selection is resolved to doubles once, up front, so that
+    entering only runs the precomputed plan.  It's resolved again only
+    if doubles have been registered since (e.g. a name wasn't
+    registered yet when decorating).
+    """
+    def __init__(self, manager, action, doubles, tags=None, exclude_tags=None):
+        self.manager = manager
+        self.operator, self.action_attr = _ACTIONS[action]
+        if isinstance(doubles, six.string_types):
+            doubles = [doubles]
+        self.names = doubles
+        self.tags, self.exclude_tags = tags, exclude_tags
+        self._doubles = None
+        self._generation = None
+        try:
+            self._compile()
+        except MissingDouble:
+            pass
 
-def _take_action(manager, attr, doubles):
-    doubles = manager._conform_double_names(doubles)
-    getattr(manager, attr)(doubles)
-    yield
-    manager.revert()
+    def _compile(self):
+        included = self.manager._resolve_included(self.names, None, self.tags, self.exclude_tags)
+        self._doubles = self.manager._resolve_doubles(included, self.action_attr)
+        self._generation = self.manager.generation
+        return self._doubles
 
-@contextmanager
-def unapplied(manager, doubles):
+    @property
+    def selected(self):
+        """
+        Returns the names of the doubles the plan acts on, in order.
+        """
+        doubles = self._doubles
+        if self._generation != self.manager.generation:
+            doubles = self._compile()
+        return [double.name for double in doubles]
+
+    def __enter__(self):
+        doubles = self._doubles
+        if self._generation != self.manager.generation:
+            doubles = self._compile()
+        self.manager._run_plan(self.operator, self.action_attr, doubles)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.manager.revert()
+        return False
+
+    def __call__(self, obj):
+        if inspect.isclass(obj):
+            return self._decorate_class(obj)
+        if _is_coroutine_function(obj):
+            return _py3.plan_coroutine_function(self, obj)
+        if inspect.isgeneratorfunction(obj):
+            return self._decorate_generator_function(obj)
+        return self._decorate_function(obj)
+
+    def _decorate_function(self, func):
+        @functools.wraps(func)
+        def planned(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return planned
+
+    def _decorate_generator_function(self, func):
+        if _py3 is not None:
+            return _py3.plan_generator_function(self, func)
+
+        @functools.wraps(func)
+        def planned(*args, **kwargs):
+            with self:
+                for item in func(*args, **kwargs):
+                    yield item
+        return planned
+
+    def _decorate_class(self, klass):
+        # only the test methods klass defines: inherited ones may have
+        #  been decorated already, and static and class methods would
+        #  come out as plain functions.
+        prefix = unittest.TestLoader.testMethodPrefix
+        for attr, value in list(vars(klass).items()):
+            if attr.startswith(prefix) and inspect.isfunction(value):
+                setattr(klass, attr, self(value))
+        return klass
+
+def unapplied(manager, doubles=None, tags=None, exclude_tags=None):
     """
-    Unapply a double (if needed) within the block.
+    Unapply a double (if needed) within the block, or within each call
+    of the decorated function.
     """
-    return _take_action(manager, 'unapply_doubles', doubles)
+    return _Plan(manager, 'unapply', doubles, tags, exclude_tags)
 
-@contextmanager
-def applied(manager, doubles):
+def applied(manager, doubles=None, tags=None, exclude_tags=None):
     """
-    Apply a double (if needed) within the block.
+    Apply a double (if needed) within the block, or within each call of
+    the decorated function.
     """
-    return _take_action(manager, 'apply_doubles', doubles)
\ No newline at end of file
+    return _Plan(manager, 'apply', doubles, tags, exclude_tags)
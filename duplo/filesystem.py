@@ -0,0 +1,860 @@
+"""
+A doubler which swaps the filesystem for an in-memory tree.
+
+While an InMemoryFSDoubler is applied, open (and io.open), the os
+functions which stat, list, create, remove and rename paths (and so
+os.path, os.walk, glob, shutil and pathlib, which are built on them),
+and the os functions which work on file descriptors opened by os.open
+(so tempfile works too), operate on an InMemoryFS instead of the disk.
+
+Real directories can be seeded into the tree.  Seeds are copy-on-write:
+a seeded directory is listed, and a seeded file read, from disk only
+when first touched, and writes only ever change the tree.  On unapply
+the tree is thrown away and rebuilt from the seeds, which costs no more
+than the number of seeds.
+
+Paths under passthrough prefixes (the Python installation, by default)
+go to the real functions.  os functions the tree can't emulate (links,
+ownership, device files, ...) raise UnsupportedFSOperation rather than
+touching the disk.
+
+Python 3.7 or later is needed: open follows io.open (Python 2's file
+objects aren't emulated), and before 3.7 pathlib holds the os functions
+in closures which can't be swapped.
+"""
+import errno, io, itertools, locale, os, shutil, stat, sys, tempfile, time
+
+from . import six
+from .doubles import DoublerBase, UnexpectedUnapply
+from ._patching import AliasPatch
+
+class UnsupportedFSOperation(NotImplementedError):
+    pass
+
+# Captured at import, for seeding from (and passing through to) the disk.
+_real_open = io.open
+_real = dict((name, getattr(os, name)) for name in dir(os) if callable(getattr(os, name)))
+_real_rmtree = shutil.rmtree
+
+_DEVICE = 0xd0b1e
+_FAKE_FD_BASE = 1 << 30
+_O_ACCMODE = os.O_RDONLY | os.O_WRONLY | os.O_RDWR
+_O_TMPFILE = getattr(os, 'O_TMPFILE', 0)
+_O_DIRECTORY = getattr(os, 'O_DIRECTORY', 0)
+
+# os functions which act on paths or file descriptors and have no
+#  in-memory equivalent here.
+UNSUPPORTED = (
+    'chdir', 'chflags', 'chown', 'chroot', 'lchflags', 'lchmod', 'lchown',
+    'link', 'mkfifo', 'mknod', 'pathconf', 'readlink', 'statvfs', 'symlink',
+    'getxattr', 'setxattr', 'removexattr', 'dup', 'dup2',
+)
+
+DEFAULT_PASSTHROUGH = tuple(sorted(set([sys.prefix, sys.exec_prefix,
+                                        getattr(sys, 'base_prefix', sys.prefix)])))
+
+# posix (or nt) holds the very functions os exports, and the import
+#  system calls them directly, so its aliases must stay real.
+DEFAULT_SKIP_MODULES = (
+    'posix', 'nt', '_io', 'importlib', 'zipimport', '_frozen_importlib',
+    '_frozen_importlib_external', 'duplo', '_pytest', 'pytest', 'pluggy', 'py',
+    'coverage', 'logging',
+)
+
+def _error(code, path):
+    return OSError(code, os.strerror(code), path)
+
+def _fspath(path):
+    if hasattr(os, 'fspath'):
+        path = os.fspath(path)
+    if isinstance(path, bytes):
+        return os.fsdecode(path) if hasattr(os, 'fsdecode') else path.decode(sys.getfilesystemencoding()), True
+    return path, False
+
+def _parts(path):
+    drive, rest = os.path.splitdrive(path)
+    parts = [part for part in rest.split(os.sep) if part]
+    if drive:
+        parts.insert(0, drive)
+    return parts
+
+class _Node(object):
+    _inodes = itertools.count(1)
+
+    def __init__(self, mode, source=None, mtime=None):
+        self.mode = mode
+        self.source = source
+        self.mtime = time.time() if mtime is None else mtime
+        self.ino = next(self._inodes)
+
+class _File(_Node):
+    def __init__(self, source=None, size=0, mtime=None):
+        super(_File, self).__init__(stat.S_IFREG | 0o644, source, mtime)
+        self.data = None if source is not None else bytearray()
+        self._size = size
+
+    def content(self):
+        if self.data is None:
+            with _real_open(self.source, 'rb') as fh:
+                self.data = bytearray(fh.read())
+            self.source = None
+        return self.data
+
+    @property
+    def size(self):
+        return self._size if self.data is None else len(self.data)
+
+class _Dir(_Node):
+    size = 4096
+
+    def __init__(self, source=None, mtime=None):
+        super(_Dir, self).__init__(stat.S_IFDIR | 0o755, source, mtime)
+        self.children = {}
+
+    def entries(self):
+        """
+        Returns the children, first listing the seeded directory (if
+        any) into them.
+        """
+        if self.source is not None:
+            source, self.source = self.source, None
+            try:
+                names = _real['listdir'](source)
+            except OSError:
+                names = []
+            for name in names:
+                if name not in self.children:
+                    node = _seed_node(os.path.join(source, name))
+                    if node is not None:
+                        self.children[name] = node
+        return self.children
+
+def _seed_node(real_path):
+    try:
+        st = _real['stat'](real_path)
+    except OSError:
+        return None
+    if stat.S_ISDIR(st.st_mode):
+        return _Dir(source=real_path, mtime=st.st_mtime)
+    return _File(source=real_path, size=st.st_size, mtime=st.st_mtime)
+
+class _Descriptor(object):
+    def __init__(self, node, flags):
+        self.node = node
+        self.flags = flags
+        self.position = 0
+
+class _OpenFile(io.BytesIO):
+    """
+    A binary file over a copy of a node's content, written back to the
+    node on flush and close.
+    """
+    def __init__(self, fs, node, name, mode, readable, writable, append, fd=None, closefd=True):
+        super(_OpenFile, self).__init__(bytes(node.content()))
+        self._fs = fs
+        self._node = node
+        self.name = name
+        self.mode = mode
+        self._readable = readable
+        self._writable = writable
+        self._append = append
+        self._fd = fd
+        self._closefd = closefd
+        if append:
+            self.seek(0, io.SEEK_END)
+
+    def __repr__(self):
+        return "<InMemoryFS file {0!r} mode={1!r}>".format(self.name, self.mode)
+
+    def _check(self, allowed, what):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        if not allowed:
+            raise io.UnsupportedOperation(what)
+
+    def readable(self):
+        self._check(True, None)
+        return self._readable
+
+    def writable(self):
+        self._check(True, None)
+        return self._writable
+
+    def fileno(self):
+        if self._fd is None:
+            raise io.UnsupportedOperation("fileno")
+        return self._fd
+
+    def isatty(self):
+        return False
+
+    def read(self, size=-1):
+        self._check(self._readable, "read")
+        return super(_OpenFile, self).read(size)
+
+    def read1(self, size=-1):
+        self._check(self._readable, "read")
+        return super(_OpenFile, self).read1(size)
+
+    def readinto(self, buffer):
+        self._check(self._readable, "read")
+        return super(_OpenFile, self).readinto(buffer)
+
+    def readline(self, size=-1):
+        self._check(self._readable, "read")
+        return super(_OpenFile, self).readline(size)
+
+    def readlines(self, hint=-1):
+        self._check(self._readable, "read")
+        return super(_OpenFile, self).readlines(hint)
+
+    def __next__(self):
+        self._check(self._readable, "read")
+        return super(_OpenFile, self).__next__()
+    next = __next__
+
+    def write(self, data):
+        self._check(self._writable, "write")
+        if self._append:
+            self.seek(0, io.SEEK_END)
+        return super(_OpenFile, self).write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def truncate(self, size=None):
+        self._check(self._writable, "truncate")
+        return super(_OpenFile, self).truncate(size)
+
+    def _sync(self):
+        if self._writable:
+            self._node.data = bytearray(self.getvalue())
+            self._node.mtime = time.time()
+
+    def flush(self):
+        super(_OpenFile, self).flush()
+        self._sync()
+
+    def close(self):
+        if not self.closed:
+            self._sync()
+            if self._fd is not None and self._closefd:
+                self._fs.close(self._fd)
+        super(_OpenFile, self).close()
+
+class _DirEntry(object):
+    def __init__(self, fs, directory, name, node, as_bytes):
+        self._fs = fs
+        self._node = node
+        path = os.path.join(directory, name)
+        if as_bytes:
+            name, path = os.fsencode(name), os.fsencode(path)
+        self.name = name
+        self.path = path
+
+    def __repr__(self):
+        return "<DirEntry {0!r}>".format(self.name)
+
+    def __fspath__(self):
+        return self.path
+
+    def inode(self):
+        return self._node.ino
+
+    def is_dir(self, follow_symlinks=True):
+        return isinstance(self._node, _Dir)
+
+    def is_file(self, follow_symlinks=True):
+        return isinstance(self._node, _File)
+
+    def is_symlink(self):
+        return False
+
+    def stat(self, follow_symlinks=True):
+        return self._fs._stat_result(self._node)
+
+class _ScandirIterator(object):
+    def __init__(self, entries):
+        self._entries = iter(entries)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._entries)
+    next = __next__
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._entries = iter(())
+
+def _parse_mode(mode):
+    modes = set(mode)
+    if (modes - set('rwaxbt+U') or len(mode) > len(modes)
+            or len(modes & set('rwax')) != 1 or ('b' in modes and 't' in modes)):
+        raise ValueError("invalid mode: {0!r}".format(mode))
+    updating = '+' in modes
+    return {
+        'readable': 'r' in modes or updating,
+        'writable': 'r' not in modes or updating,
+        'append': 'a' in modes,
+        'create': 'r' not in modes,
+        'exclusive': 'x' in modes,
+        'truncate': 'w' in modes,
+        'binary': 'b' in modes,
+    }
+
+def _mode_flags(parsed):
+    if parsed['readable'] and parsed['writable']:
+        flags = os.O_RDWR
+    elif parsed['writable']:
+        flags = os.O_WRONLY
+    else:
+        flags = os.O_RDONLY
+    if parsed['create']:
+        flags |= os.O_CREAT
+    if parsed['exclusive']:
+        flags |= os.O_EXCL
+    if parsed['truncate']:
+        flags |= os.O_TRUNC
+    if parsed['append']:
+        flags |= os.O_APPEND
+    return flags
+
+class InMemoryFS(object):
+    """
+    An in-memory directory tree, with functions mirroring open, os and
+    shutil.rmtree.
+
+    directories are created (empty) in the tree, and seeds are
+    (real path, path in the tree) pairs copied in on first use.
+    Absolute paths under passthrough prefixes are left to the disk.
+    """
+    def __init__(self, seeds=(), directories=(), passthrough=()):
+        self.seeds = []
+        self.directories = list(directories)
+        self.passthrough = tuple(os.path.abspath(prefix) for prefix in passthrough)
+        self._passthrough_dirs = tuple(prefix.rstrip(os.sep) + os.sep for prefix in self.passthrough)
+        self.reset()
+        for seed in seeds:
+            if isinstance(seed, six.string_types):
+                seed = (seed, seed)
+            self.seed(*seed)
+
+    def reset(self):
+        """
+        Throws away the tree (and any open descriptors) and rebuilds it
+        from the directories and seeds.
+        """
+        self.root = _Dir()
+        self._descriptors = {}
+        self._fds = itertools.count(_FAKE_FD_BASE)
+        for path in self.directories:
+            self._makedirs(os.path.abspath(path))
+        for real_path, path in self.seeds:
+            self._seed(real_path, path)
+
+    def seed(self, real_path, path=None):
+        """
+        Makes the real file or directory at real_path appear at path
+        (by default, the same path) in the tree, copy-on-write.
+        """
+        real_path = os.path.abspath(real_path)
+        path = real_path if path is None else os.path.abspath(path)
+        self.seeds.append((real_path, path))
+        self._seed(real_path, path)
+
+    def _seed(self, real_path, path):
+        node = _seed_node(real_path)
+        if node is None:
+            raise _error(errno.ENOENT, real_path)
+        parent = self._makedirs(os.path.dirname(path))
+        existing = parent.entries().get(os.path.basename(path))
+        if isinstance(node, _Dir) and isinstance(existing, _Dir):
+            existing.entries()
+            existing.source = real_path
+        else:
+            parent.children[os.path.basename(path)] = node
+
+    def _makedirs(self, path):
+        node = self.root
+        for part in _parts(path):
+            child = node.entries().get(part)
+            if child is None:
+                child = node.children[part] = _Dir()
+            elif not isinstance(child, _Dir):
+                raise _error(errno.ENOTDIR, path)
+            node = child
+        return node
+
+    # path resolution
+
+    def is_passthrough(self, path):
+        if isinstance(path, six.integer_types):
+            return path not in self._descriptors
+        path = os.path.abspath(_fspath(path)[0])
+        return path in self.passthrough or path.startswith(self._passthrough_dirs)
+
+    def _lookup(self, path):
+        node = self.root
+        for part in _parts(path):
+            if not isinstance(node, _Dir):
+                raise _error(errno.ENOTDIR, path)
+            node = node.entries().get(part)
+            if node is None:
+                return None
+        return node
+
+    def _get(self, path):
+        node = self._lookup(path)
+        if node is None:
+            raise _error(errno.ENOENT, path)
+        return node
+
+    def _parent(self, path):
+        head, name = os.path.split(path)
+        parent = self._lookup(head)
+        if parent is None:
+            raise _error(errno.ENOENT, path)
+        if not isinstance(parent, _Dir):
+            raise _error(errno.ENOTDIR, path)
+        return parent, name
+
+    def _check_dir_fd(self, dir_fd):
+        if dir_fd is not None:
+            raise UnsupportedFSOperation("dir_fd is not supported by InMemoryFS.")
+
+    def _descriptor(self, fd):
+        try:
+            return self._descriptors[fd]
+        except KeyError:
+            raise _error(errno.EBADF, None)
+
+    def _stat_result(self, node):
+        uid = os.getuid() if hasattr(os, 'getuid') else 0
+        gid = os.getgid() if hasattr(os, 'getgid') else 0
+        nlink = 2 if isinstance(node, _Dir) else 1
+        mtime_ns = int(node.mtime * 1e9)
+        return os.stat_result(
+            (node.mode, node.ino, _DEVICE, nlink, uid, gid, node.size,
+             node.mtime, node.mtime, node.mtime),
+            {'st_atime_ns': mtime_ns, 'st_mtime_ns': mtime_ns, 'st_ctime_ns': mtime_ns,
+             'st_blksize': 4096, 'st_blocks': (node.size + 511) // 512})
+
+    # open
+
+    def open(self, file, mode='r', buffering=-1, encoding=None, errors=None,
+             newline=None, closefd=True, opener=None):
+        if self.is_passthrough(file):
+            return _real_open(file, mode, buffering, encoding, errors, newline, closefd, opener)
+
+        parsed = _parse_mode(mode)
+        if isinstance(file, six.integer_types):
+            fd, name = file, file
+        elif opener is not None:
+            name = file
+            fd = opener(_fspath(file)[0], _mode_flags(parsed))
+            if fd not in self._descriptors:
+                return _real_open(fd, mode, buffering, encoding, errors, newline, closefd)
+        else:
+            fd, name = None, file
+            path = os.path.abspath(_fspath(file)[0])
+            node = self._open_node(path, parsed['create'], parsed['exclusive'], parsed['truncate'])
+        if fd is not None:
+            node = self._descriptor(fd).node
+
+        raw = _OpenFile(self, node, name, mode.replace('t', ''), parsed['readable'],
+                        parsed['writable'], parsed['append'], fd, closefd)
+        if parsed['binary']:
+            return raw
+        text = io.TextIOWrapper(raw, encoding or locale.getpreferredencoding(False),
+                                errors, newline, line_buffering=buffering == 1)
+        text.mode = mode
+        return text
+
+    def _open_node(self, path, create, exclusive, truncate):
+        node = self._lookup(path)
+        if node is None:
+            if not create:
+                raise _error(errno.ENOENT, path)
+            parent, name = self._parent(path)
+            node = parent.children[name] = _File()
+            parent.mtime = node.mtime
+        elif exclusive:
+            raise _error(errno.EEXIST, path)
+        if isinstance(node, _Dir):
+            raise _error(errno.EISDIR, path)
+        if truncate:
+            node.content()[:] = b''
+            node.mtime = time.time()
+        return node
+
+    # descriptors
+
+    def os_open(self, path, flags, mode=0o777, dir_fd=None):
+        if dir_fd is None and self.is_passthrough(path):
+            return _real['open'](path, flags, mode)
+        self._check_dir_fd(dir_fd)
+        path = os.path.abspath(_fspath(path)[0])
+        if _O_TMPFILE and flags & _O_TMPFILE == _O_TMPFILE:
+            if not isinstance(self._get(path), _Dir):
+                raise _error(errno.ENOTDIR, path)
+            node = _File()
+        elif flags & _O_DIRECTORY or isinstance(self._lookup(path), _Dir):
+            raise UnsupportedFSOperation(
+                "Opening directories ({0}) is not supported by InMemoryFS.".format(path))
+        else:
+            node = self._open_node(path, flags & os.O_CREAT, flags & os.O_EXCL, flags & os.O_TRUNC)
+        fd = next(self._fds)
+        self._descriptors[fd] = _Descriptor(node, flags)
+        return fd
+
+    def close(self, fd):
+        if fd not in self._descriptors:
+            return _real['close'](fd)
+        del self._descriptors[fd]
+
+    def read(self, fd, n):
+        if fd not in self._descriptors:
+            return _real['read'](fd, n)
+        descriptor = self._descriptors[fd]
+        if descriptor.flags & _O_ACCMODE == os.O_WRONLY:
+            raise _error(errno.EBADF, None)
+        start = descriptor.position
+        data = bytes(descriptor.node.content()[start:start + n])
+        descriptor.position += len(data)
+        return data
+
+    def write(self, fd, data):
+        if fd not in self._descriptors:
+            return _real['write'](fd, data)
+        descriptor = self._descriptors[fd]
+        if descriptor.flags & _O_ACCMODE == os.O_RDONLY:
+            raise _error(errno.EBADF, None)
+        content = descriptor.node.content()
+        if descriptor.flags & os.O_APPEND:
+            descriptor.position = len(content)
+        start = descriptor.position
+        if start > len(content):
+            content.extend(b'\0' * (start - len(content)))
+        content[start:start + len(data)] = data
+        descriptor.position += len(data)
+        descriptor.node.mtime = time.time()
+        return len(data)
+
+    def lseek(self, fd, position, how):
+        if fd not in self._descriptors:
+            return _real['lseek'](fd, position, how)
+        descriptor = self._descriptors[fd]
+        if how == os.SEEK_CUR:
+            position += descriptor.position
+        elif how == os.SEEK_END:
+            position += descriptor.node.size
+        if position < 0:
+            raise _error(errno.EINVAL, None)
+        descriptor.position = position
+        return position
+
+    def fstat(self, fd):
+        if fd not in self._descriptors:
+            return _real['fstat'](fd)
+        return self._stat_result(self._descriptors[fd].node)
+
+    def fsync(self, fd):
+        if fd not in self._descriptors:
+            return _real['fsync'](fd)
+
+    def ftruncate(self, fd, length):
+        if fd not in self._descriptors:
+            return _real['ftruncate'](fd, length)
+        self._truncate(self._descriptors[fd].node, length)
+
+    def isatty(self, fd):
+        if fd not in self._descriptors:
+            return _real['isatty'](fd)
+        return False
+
+    # paths
+
+    def stat(self, path, dir_fd=None, follow_symlinks=True):
+        if isinstance(path, six.integer_types):
+            return self.fstat(path)
+        if dir_fd is None and self.is_passthrough(path):
+            return _real['stat'](path, follow_symlinks=follow_symlinks)
+        self._check_dir_fd(dir_fd)
+        return self._stat_result(self._get(os.path.abspath(_fspath(path)[0])))
+
+    def lstat(self, path, dir_fd=None):
+        return self.stat(path, dir_fd, follow_symlinks=False)
+
+    def access(self, path, mode, dir_fd=None, effective_ids=False, follow_symlinks=True):
+        if dir_fd is None and self.is_passthrough(path):
+            return _real['access'](path, mode)
+        self._check_dir_fd(dir_fd)
+        return self._lookup(os.path.abspath(_fspath(path)[0])) is not None
+
+    def _listed(self, path):
+        if path is None:
+            path = '.'
+        path, as_bytes = _fspath(path)
+        path = os.path.abspath(path)
+        node = self._get(path)
+        if not isinstance(node, _Dir):
+            raise _error(errno.ENOTDIR, path)
+        return path, as_bytes, list(node.entries().items())
+
+    def listdir(self, path=None):
+        if isinstance(path, six.integer_types):
+            raise UnsupportedFSOperation("Listing a directory by descriptor is not supported by InMemoryFS.")
+        if self.is_passthrough('.' if path is None else path):
+            return _real['listdir']('.' if path is None else path)
+        path, as_bytes, entries = self._listed(path)
+        if as_bytes:
+            return [os.fsencode(name) for name, node in entries]
+        return [name for name, node in entries]
+
+    def scandir(self, path=None):
+        if isinstance(path, six.integer_types):
+            raise UnsupportedFSOperation("Scanning a directory by descriptor is not supported by InMemoryFS.")
+        if self.is_passthrough('.' if path is None else path):
+            return _real['scandir']('.' if path is None else path)
+        absolute, as_bytes, entries = self._listed(path)
+        directory = '.' if path is None else _fspath(path)[0]
+        return _ScandirIterator(
+            _DirEntry(self, directory, name, node, as_bytes) for name, node in entries)
+
+    def mkdir(self, path, mode=0o777, dir_fd=None):
+        if dir_fd is None and self.is_passthrough(path):
+            return _real['mkdir'](path, mode)
+        self._check_dir_fd(dir_fd)
+        path = os.path.abspath(_fspath(path)[0])
+        parent, name = self._parent(path)
+        if name in parent.entries():
+            raise _error(errno.EEXIST, path)
+        node = parent.children[name] = _Dir()
+        parent.mtime = node.mtime
+
+    def remove(self, path, dir_fd=None):
+        if dir_fd is None and self.is_passthrough(path):
+            return _real['remove'](path)
+        self._check_dir_fd(dir_fd)
+        path = os.path.abspath(_fspath(path)[0])
+        parent, name = self._parent(path)
+        node = parent.entries().get(name)
+        if node is None:
+            raise _error(errno.ENOENT, path)
+        if isinstance(node, _Dir):
+            raise _error(errno.EISDIR, path)
+        del parent.children[name]
+        parent.mtime = time.time()
+
+    unlink = remove
+
+    def rmdir(self, path, dir_fd=None):
+        if dir_fd is None and self.is_passthrough(path):
+            return _real['rmdir'](path)
+        self._check_dir_fd(dir_fd)
+        path = os.path.abspath(_fspath(path)[0])
+        parent, name = self._parent(path)
+        node = parent.entries().get(name)
+        if node is None:
+            raise _error(errno.ENOENT, path)
+        if not isinstance(node, _Dir):
+            raise _error(errno.ENOTDIR, path)
+        if node.entries():
+            raise _error(errno.ENOTEMPTY, path)
+        del parent.children[name]
+        parent.mtime = time.time()
+
+    def rename(self, src, dst, src_dir_fd=None, dst_dir_fd=None):
+        if src_dir_fd is None and dst_dir_fd is None:
+            src_through, dst_through = self.is_passthrough(src), self.is_passthrough(dst)
+            if src_through and dst_through:
+                return _real['rename'](src, dst)
+            if src_through or dst_through:
+                raise UnsupportedFSOperation(
+                    "Renaming between the disk and InMemoryFS ({0} to {1}) is not supported.".format(src, dst))
+        self._check_dir_fd(src_dir_fd)
+        self._check_dir_fd(dst_dir_fd)
+        src = os.path.abspath(_fspath(src)[0])
+        dst = os.path.abspath(_fspath(dst)[0])
+        src_parent, src_name = self._parent(src)
+        node = src_parent.entries().get(src_name)
+        if node is None:
+            raise _error(errno.ENOENT, src)
+        if isinstance(node, _Dir) and (dst + os.sep).startswith(src + os.sep):
+            if dst == src:
+                return
+            raise _error(errno.EINVAL, dst)
+        dst_parent, dst_name = self._parent(dst)
+        existing = dst_parent.entries().get(dst_name)
+        if existing is node:
+            return
+        if isinstance(existing, _Dir):
+            if not isinstance(node, _Dir):
+                raise _error(errno.EISDIR, dst)
+            if existing.entries():
+                raise _error(errno.ENOTEMPTY, dst)
+        elif existing is not None and isinstance(node, _Dir):
+            raise _error(errno.ENOTDIR, dst)
+        del src_parent.children[src_name]
+        dst_parent.children[dst_name] = node
+        src_parent.mtime = dst_parent.mtime = time.time()
+
+    replace = rename
+
+    def _truncate(self, node, length):
+        if not isinstance(node, _File):
+            raise _error(errno.EISDIR, None)
+        content = node.content()
+        if length < len(content):
+            del content[length:]
+        else:
+            content.extend(b'\0' * (length - len(content)))
+        node.mtime = time.time()
+
+    def truncate(self, path, length):
+        if isinstance(path, six.integer_types):
+            return self.ftruncate(path, length)
+        if self.is_passthrough(path):
+            return _real['truncate'](path, length)
+        self._truncate(self._get(os.path.abspath(_fspath(path)[0])), length)
+
+    def chmod(self, path, mode, dir_fd=None, follow_symlinks=True):
+        if isinstance(path, six.integer_types):
+            node = self._descriptor(path).node
+        elif dir_fd is None and self.is_passthrough(path):
+            return _real['chmod'](path, mode)
+        else:
+            self._check_dir_fd(dir_fd)
+            node = self._get(os.path.abspath(_fspath(path)[0]))
+        node.mode = stat.S_IFMT(node.mode) | stat.S_IMODE(mode)
+
+    def utime(self, path, times=None, ns=None, dir_fd=None, follow_symlinks=True):
+        if isinstance(path, six.integer_types):
+            node = self._descriptor(path).node
+        elif dir_fd is None and self.is_passthrough(path):
+            return _real['utime'](path, times, ns=ns) if ns is not None else _real['utime'](path, times)
+        else:
+            self._check_dir_fd(dir_fd)
+            node = self._get(os.path.abspath(_fspath(path)[0]))
+        if ns is not None and ns[1] is not None:
+            node.mtime = ns[1] / 1e9
+        elif times is not None:
+            node.mtime = times[1]
+        else:
+            node.mtime = time.time()
+
+    def listxattr(self, path=None, follow_symlinks=True):
+        if path is not None and self.is_passthrough(path):
+            return _real['listxattr'](path, follow_symlinks=follow_symlinks)
+        return []
+
+    def rmtree(self, path, ignore_errors=False, onerror=None, **kwargs):
+        if self.is_passthrough(path):
+            return _real_rmtree(path, ignore_errors, onerror, **kwargs)
+        onexc = kwargs.get('onexc')
+        try:
+            path = os.path.abspath(_fspath(path)[0])
+            parent, name = self._parent(path)
+            node = parent.entries().get(name)
+            if node is None:
+                raise _error(errno.ENOENT, path)
+            if not isinstance(node, _Dir):
+                raise _error(errno.ENOTDIR, path)
+            del parent.children[name]
+            parent.mtime = time.time()
+        except OSError as e:
+            if ignore_errors:
+                return
+            if onexc is not None:
+                onexc(os.rmdir, path, e)
+            elif onerror is not None:
+                onerror(os.rmdir, path, sys.exc_info())
+            else:
+                raise
+
+    def unsupported(self, name):
+        """
+        Returns a stand-in for os.<name> which passes disk paths through
+        and refuses paths in the tree.
+        """
+        real = _real[name]
+        def refuse(path=None, *args, **kwargs):
+            if path is not None and self.is_passthrough(path) and not kwargs.get('dir_fd'):
+                return real(path, *args, **kwargs)
+            raise UnsupportedFSOperation(
+                "os.{0} is not supported by InMemoryFS (called for {1!r}).".format(name, path))
+        refuse.__name__ = name
+        return refuse
+
+# os function name -> InMemoryFS method name
+_OS_FUNCTIONS = {
+    'open': 'os_open', 'close': 'close', 'read': 'read', 'write': 'write', 'lseek': 'lseek',
+    'fstat': 'fstat', 'fsync': 'fsync', 'fdatasync': 'fsync', 'ftruncate': 'ftruncate',
+    'isatty': 'isatty', 'stat': 'stat', 'lstat': 'lstat', 'access': 'access',
+    'listdir': 'listdir', 'scandir': 'scandir', 'mkdir': 'mkdir', 'remove': 'remove',
+    'unlink': 'unlink', 'rmdir': 'rmdir', 'rename': 'rename', 'replace': 'replace',
+    'truncate': 'truncate', 'chmod': 'chmod', 'utime': 'utime', 'listxattr': 'listxattr',
+}
+
+class InMemoryFSDoubler(DoublerBase):
+    """
+    Swaps the filesystem for an InMemoryFS while applied::
+
+        fs_doubler = InMemoryFSDoubler(seeds=['tests/fixtures'])
+        manager.register_double(fs_doubler)
+
+        with doubles.applied(manager, 'filesystem'):
+            export_report('/tmp/report.csv')
+            with open('/tmp/report.csv') as fh:
+                ...
+
+    seeds are real paths (or (real path, path in the tree) pairs) to
+    copy in on first use.  directories are created empty in the tree;
+    by default, the temp directory and the working directory.  Paths
+    under passthrough prefixes go to the disk.  The tree is reset on
+    each unapply.
+    """
+    def __init__(self, name='filesystem', seeds=(), directories=None,
+                 passthrough=DEFAULT_PASSTHROUGH, skip_modules=DEFAULT_SKIP_MODULES,
+                 tags=(), requires=(), conflicts=()):
+        super(InMemoryFSDoubler, self).__init__(name, tags, requires, conflicts)
+        if directories is None:
+            directories = [tempfile.gettempdir(), os.getcwd()]
+        self.fs = InMemoryFS(seeds, directories, passthrough)
+        self.skip_modules = skip_modules
+        self._patch = None
+
+    def _replacements(self):
+        replacements = [
+            (six.moves.builtins, 'open', self.fs.open),
+            (io, 'open', self.fs.open),
+            (shutil, 'rmtree', self.fs.rmtree),
+        ]
+        for name, method in sorted(_OS_FUNCTIONS.items()):
+            if name in _real:
+                replacements.append((os, name, getattr(self.fs, method)))
+        for name in UNSUPPORTED:
+            if name in _real:
+                replacements.append((os, name, self.fs.unsupported(name)))
+        return replacements
+
+    def apply(self):
+        if sys.version_info < (3, 7):
+            raise UnsupportedFSOperation("InMemoryFSDoubler needs Python 3.7 or later.")
+        if self._patch is None:
+            self._patch = AliasPatch(self._replacements(), self.skip_modules, deep=True)
+        self._patch.apply()
+
+    def unapply(self):
+        if self._patch is None or not self._patch.patched:
+            raise UnexpectedUnapply
+        self._patch.restore()
+        self.fs.reset()
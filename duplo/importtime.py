@@ -0,0 +1,209 @@
+"""
+Measures how long each module referenced by a registry takes to import,
+and attributes that cost to the doubles which reference it.
+
+Each module is imported in a fresh interpreter, so modules shared with
+other doubles (or already imported by the registry itself) don't hide
+the cost.
+
+Usage::
+
+    python -m duplo [--json] [--jobs N] path.to.module:manager
+"""
+import argparse, importlib, json, os, site, subprocess, sys, sysconfig
+from collections import namedtuple
+
+from ._workers import WorkerPool
+from .doubles import DoubleManager
+
+_MEASURE = """
+import importlib, json, sys
+from timeit import default_timer
+started = default_timer()
+try:
+    importlib.import_module(sys.argv[1])
+except Exception as e:
+    result = {'seconds': default_timer() - started, 'error': '{0}: {1}'.format(type(e).__name__, e)}
+else:
+    result = {'seconds': default_timer() - started, 'error': None}
+sys.stdout.write('\\n' + sys.argv[2] + json.dumps(result))
+"""
+
+# written before the result, so output printed by the module imported
+#  isn't mistaken for it.
+_MARKER = '--duplo-importtime-result--'
+
+ModuleCost = namedtuple('ModuleCost', 'module role seconds error')
+
+DoubleCost = namedtuple('DoubleCost', 'name seconds modules')
+
+class RegistryLoadError(ValueError):
+    pass
+
+def load_manager(path):
+    """
+    Loads a DoubleManager from an importable path such as
+    'myproject.tests.doubles:manager'.  The object found may also be a
+    callable which returns a DoubleManager.
+    """
+    try:
+        module_name, attr_path = path.split(':')
+    except ValueError:
+        raise RegistryLoadError("Expected a path like 'module:manager', not {0}".format(path))
+
+    obj = importlib.import_module(module_name)
+    for attr in attr_path.split('.'):
+        try:
+            obj = getattr(obj, attr)
+        except AttributeError:
+            raise RegistryLoadError("Unable to find {0}".format(path))
+
+    if not isinstance(obj, DoubleManager) and callable(obj):
+        obj = obj()
+    if not isinstance(obj, DoubleManager):
+        raise RegistryLoadError("{0} is not a DoubleManager".format(path))
+    return obj
+
+def _interpreter_paths():
+    """
+    Returns the directories this interpreter's sys.path gets from its
+    installation (the standard library and site directories).
+    """
+    paths = set(sysconfig.get_paths().values())
+    paths.update(getattr(site, 'getsitepackages', lambda: [])())
+    if getattr(site, 'getusersitepackages', None) is not None:
+        paths.add(site.getusersitepackages())
+    stdlib = sysconfig.get_paths()['stdlib']
+    return [os.path.abspath(path) for path in paths], os.path.dirname(os.path.abspath(stdlib))
+
+def project_path():
+    """
+    Returns the sys.path entries which aren't part of this interpreter's
+    installation, to pass on to interpreters measuring imports (which
+    may be other versions, with their own standard library).
+    """
+    installed, stdlib_parent = _interpreter_paths()
+    entries = []
+    for entry in sys.path:
+        if not entry:
+            continue
+        path = os.path.abspath(entry)
+        if any(path == p or path.startswith(p + os.sep) for p in installed):
+            continue
+        # e.g. lib/python27.zip
+        if os.path.dirname(path) == stdlib_parent and path.endswith('.zip'):
+            continue
+        entries.append(entry)
+    return entries
+
+def measure_import(module_name, python=None, path=None):
+    """
+    Returns the seconds taken to import module_name in a fresh
+    interpreter, and the import error (as a string), if any.
+
+    path (a list of directories) is added to the interpreter's
+    PYTHONPATH; by default it's project_path().
+    """
+    if path is None:
+        path = project_path()
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(path)
+    process = subprocess.Popen(
+        [python or sys.executable, '-c', _MEASURE, module_name, _MARKER],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+    )
+    stdout, stderr = process.communicate()
+    _, marker, result = stdout.decode('utf-8', 'replace').rpartition(_MARKER)
+    try:
+        if not marker:
+            raise ValueError
+        result = json.loads(result)
+    except ValueError:
+        return 0.0, stderr.decode('utf-8', 'replace').strip() or 'interpreter failed'
+    return result['seconds'], result['error']
+
+def profile(manager, jobs=1, python=None, path=None):
+    """
+    Measures the import time of each module referenced by manager's
+    PatchingDoublers, and returns a list of DoubleCost, most expensive
+    first.  A double's cost is the sum of its modules' import times.
+    """
+    references = manager.referenced_modules()
+    if path is None:
+        path = project_path()
+
+    timings = {}
+    if jobs > 1:
+        with WorkerPool(jobs) as pool:
+            tasks = [(name, pool.submit(measure_import, name, python, path)) for name in references]
+            for name, task in tasks:
+                task.wait()
+                timings[name] = task.result
+    else:
+        for name in references:
+            timings[name] = measure_import(name, python, path)
+
+    by_double = {}
+    for module_name, referrers in references.items():
+        seconds, error = timings[module_name]
+        for double_name, role in referrers:
+            by_double.setdefault(double_name, []).append(
+                ModuleCost(module_name, role, seconds, error))
+
+    costs = []
+    for double_name, modules in by_double.items():
+        modules.sort(key=lambda cost: -cost.seconds)
+        unique = dict((cost.module, cost.seconds) for cost in modules)
+        costs.append(DoubleCost(double_name, sum(unique.values()), modules))
+    costs.sort(key=lambda cost: (-cost.seconds, cost.name))
+    return costs
+
+def format_report(costs):
+    lines = ["{0:>10}  {1}".format('seconds', 'double')]
+    for cost in costs:
+        lines.append("{0:>10.4f}  {1}".format(cost.seconds, cost.name))
+        for module in cost.modules:
+            line = "{0:>22.4f}  {1} ({2})".format(module.seconds, module.module, module.role)
+            if module.error:
+                line += " FAILED: {0}".format(module.error)
+            lines.append(line)
+    return "\n".join(lines)
+
+def as_json(costs):
+    return json.dumps([
+        {
+            'name': cost.name,
+            'seconds': cost.seconds,
+            'modules': [module._asdict() for module in cost.modules],
+        }
+        for cost in costs
+    ], indent=2)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m duplo',
+        description="Measure the import time of each double's target and variant modules.")
+    parser.add_argument('registry', help="importable DoubleManager, e.g. myproject.tests.doubles:manager")
+    parser.add_argument('--json', action='store_true', help="emit JSON instead of a text report")
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help="interpreters to run at once (concurrent runs skew timings)")
+    parser.add_argument('--python', help="interpreter to measure with (default: this one)")
+    parser.add_argument('--path', help="{0}-separated directories to import from (default: "
+                        "this interpreter's sys.path, less its standard library and "
+                        "site directories)".format(os.pathsep))
+    args = parser.parse_args(argv)
+
+    if os.getcwd() not in sys.path and '' not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    try:
+        manager = load_manager(args.registry)
+    except (ImportError, RegistryLoadError) as e:
+        parser.error(str(e))
+
+    path = args.path.split(os.pathsep) if args.path is not None else None
+    costs = profile(manager, jobs=args.jobs, python=args.python, path=path)
+    if args.json:
+        sys.stdout.write(as_json(costs) + "\n")
+    else:
+        sys.stdout.write(format_report(costs) + "\n")
+    return 0
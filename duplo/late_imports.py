@@ -0,0 +1,194 @@
+"""
+Repairs aliases which doubles miss because of when modules import them.
+
+A module which runs `from ham import spam` before ham.spam is first
+doubled, or between applications, keeps the normal when the double is
+applied; one which runs it while ham.spam is doubled captures the
+variant, and keeps it after the double is unapplied.  While installed,
+a LateImportRepair finds such aliases of the callables its manager's
+doubles swap, and adds them to the double's targets, so that they're
+patched and restored with the rest::
+
+    repair = LateImportRepair(manager)
+    repair.install()
+
+Imports themselves are left alone: a finder at the front of
+sys.meta_path only notes the name of each module imported.  Those
+modules are checked when a double is next applied or unapplied, with
+one dict lookup per name.  The first time a double is applied, every
+loaded module is checked for its normal.
+"""
+import sys
+from collections import namedtuple
+
+from .doubles import PatchingDoubler
+
+# a target added to a double, which found the given object in it.
+Repair = namedtuple('Repair', 'name target found')
+
+NORMAL = 'normal'
+VARIANT = 'variant'
+
+DEFAULT_SKIP_MODULES = ('duplo',)
+
+class _Finder(object):
+    """
+    A meta path finder which finds nothing, but notes the name of each
+    module imported.
+    """
+    def __init__(self, imported):
+        self._imported = imported
+
+    def find_spec(self, fullname, path, target=None):
+        self._imported.append(fullname)
+        return None
+
+    def find_module(self, fullname, path=None): # python 2
+        self._imported.append(fullname)
+        return None
+
+class LateImportRepair(object):
+    """
+    Tracks the callables swapped by manager's PatchingDoublers as
+    they're applied, and adds the aliases of them which other modules
+    hold to the doubles' targets.  Each addition is kept in repairs,
+    and taken back out on uninstall.
+
+    Only doubles visible from manager (registered with it or an
+    ancestor) are tracked, and modules named by (or within)
+    skip_modules aren't checked.
+    """
+    def __init__(self, manager, skip_modules=DEFAULT_SKIP_MODULES):
+        self.manager = manager
+        self.skip_modules = tuple(skip_modules)
+        self._skip_prefixes = tuple(name + '.' for name in self.skip_modules)
+        self.repairs = []
+        # id -> (object, double, NORMAL or VARIANT), for the normals of
+        #  doubles which have been applied, and the variants of doubles
+        #  which are applied.
+        self._index = {}
+        # double -> its normal, for doubles which have been applied.
+        self._normals = {}
+        # names of the modules imported since the last check.
+        self._imported = []
+        self._finder = _Finder(self._imported)
+
+    @property
+    def installed(self):
+        return self._finder in sys.meta_path
+
+    def install(self):
+        if not self.installed:
+            sys.meta_path.insert(0, self._finder)
+            self.manager.subscribe(self._on_event)
+        return self
+
+    def uninstall(self):
+        """
+        Stops repairing, and removes the targets added from their
+        doubles, restoring them first if they're applied.
+        """
+        if not self.installed:
+            return
+        # so that aliases captured since the last check are restored.
+        self._check_imported()
+        sys.meta_path.remove(self._finder)
+        self.manager.unsubscribe(self._on_event)
+        while self.repairs:
+            repair = self.repairs.pop()
+            double = self.manager.registry.get(repair.name)
+            if double is None:
+                continue
+            if repair.target in double.originals:
+                double.unapply([repair.target])
+            double.targets = [target for target in double.targets if target != repair.target]
+        self._index.clear()
+        self._normals.clear()
+        del self._imported[:]
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.uninstall()
+        return False
+
+    def _skipped(self, module_name):
+        return module_name in self.skip_modules or module_name.startswith(self._skip_prefixes)
+
+    def _on_event(self, event):
+        double = self.manager.registry.get(event.name)
+        if not isinstance(double, PatchingDoubler):
+            return
+        if event.applied:
+            # before tracking the variant: modules imported until now
+            #  (e.g. the one defining it) can't have captured it.
+            self._check_imported()
+            if double not in self._normals and double.normals:
+                self._normals[double] = double.normals[0]
+                normals = {}
+                for normal in double.normals:
+                    self._track(normals, normal, double, NORMAL)
+                self._index.update(normals)
+                # including those loaded before it was first applied.
+                for module in list(sys.modules.values()):
+                    if module is not None:
+                        self._check(module, normals)
+            self._track(self._index, double._patched, double, VARIANT)
+        else:
+            # modules imported while it was applied may hold its variant.
+            self._check_imported()
+            for key, (obj, owner, role) in list(self._index.items()):
+                if owner is double and role == VARIANT:
+                    del self._index[key]
+
+    def _track(self, index, obj, double, role):
+        # identity only means an alias for objects with their own
+        #  identity, not e.g. small ints and interned strings.
+        if callable(obj):
+            index[id(obj)] = (obj, double, role)
+
+    def _check_imported(self):
+        imported = self._imported
+        while imported:
+            module = sys.modules.get(imported.pop())
+            if module is not None:
+                self.check(module)
+
+    def check(self, module):
+        """
+        Adds module's aliases of tracked objects to their doubles'
+        targets, and sets each to the normal or variant to match its
+        double.
+        """
+        self._check(module, self._index)
+
+    def _check(self, module, index):
+        module_name = getattr(module, '__name__', None)
+        if not index or module_name is None or self._skipped(module_name):
+            return
+        try:
+            namespace = list(vars(module).items())
+        except TypeError: # no __dict__
+            return
+        for name, value in namespace:
+            entry = index.get(id(value))
+            if entry is None or entry[0] is not value:
+                continue
+            obj, double, role = entry
+            target = "{0}:{1}".format(module_name, name)
+            if target in double.targets:
+                continue
+            double.targets = list(double.targets) + [target]
+            self.repairs.append(Repair(double.name, target, role))
+            applied = bool(double.originals)
+            if role == NORMAL:
+                if applied:
+                    double.apply([target])
+                # else patched along with the rest next time.
+            elif applied:
+                # captured while applied; restored to the normal on unapply.
+                double.originals[target] = self._normals[double]
+            else:
+                # captured while applied, and found once unapplied.
+                setattr(module, name, self._normals[double])
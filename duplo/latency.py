@@ -0,0 +1,284 @@
+"""
+Finds which normal implementations are slow enough to be worth
+doubling, by timing them over a test run.
+
+While a LatencyProfiler is started, each candidate target (as a
+PatchingDoubler target, 'module:attr' or 'module:Class.attr') is
+swapped for a wrapper which times its calls, at its canonical location
+and at each alias loaded modules hold to it.  Tests are marked out as
+scopes, as with duplo.usage, and the report ranks the targets by the
+time spent in them, with their call counts and the tests which called
+them.  format_config writes the slowest as duplo.config declarations,
+whose variants are left to fill in.
+
+Only the outermost of nested (e.g. recursive) calls in each thread is
+timed, so concurrent calls from several threads are each timed.  Calls
+returning generators or coroutines are timed until they return, not
+until they're consumed.
+"""
+import functools, inspect, threading, types
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
+
+from . import six
+from .doubles import MissingPatchTarget, PatchingDoubler, _INHERITED
+from ._patching import AliasPatch
+
+# tests are (label, seconds) pairs, slowest first; aliases are targets
+#  found to refer to the same object.
+TargetLatency = namedtuple('TargetLatency', 'target seconds calls tests aliases')
+
+DEFAULT_SKIP_MODULES = ('duplo',)
+
+class _ThreadTiming(object):
+    # one thread's calls to a target; depth counts those in progress,
+    #  and tests maps scope labels to the seconds spent within them.
+    __slots__ = ('seconds', 'calls', 'depth', 'tests')
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.depth = 0
+        self.tests = {}
+
+class _Timing(object):
+    """
+    The calls to a target, kept per thread so that threads neither
+    share depths nor race to update the totals.
+    """
+    def __init__(self):
+        self.local = threading.local()
+        self.threads = []
+        self._lock = threading.Lock()
+
+    def mine(self):
+        # the current thread's, made on its first call.
+        thread_timing = self.local.timing = _ThreadTiming()
+        with self._lock:
+            self.threads.append(thread_timing)
+        return thread_timing
+
+    @property
+    def seconds(self):
+        return sum(thread_timing.seconds for thread_timing in list(self.threads))
+
+    @property
+    def calls(self):
+        return sum(thread_timing.calls for thread_timing in list(self.threads))
+
+    def tests(self):
+        tests = {}
+        for thread_timing in list(self.threads):
+            for label, seconds in list(thread_timing.tests.items()):
+                tests[label] = tests.get(label, 0.0) + seconds
+        return tests
+
+def _class_lookup(klass, attr):
+    # the raw value klass inherits, e.g. a staticmethod.
+    for base in inspect.getmro(klass):
+        if attr in vars(base):
+            return vars(base)[attr]
+    return getattr(klass, attr)
+
+class LatencyProfiler(object):
+    """
+    Times calls to the objects at targets while started::
+
+        profiler = latency.LatencyProfiler(['billing.gateway:charge', 'search.client:Client.query'])
+        profiler.start()
+        ...
+        with profiler.scope('tests.test_orders.OrderTests.test_total'):
+            run the test
+        ...
+        profiler.stop()
+        print(profiler.format_report())
+    """
+    def __init__(self, targets, skip_modules=DEFAULT_SKIP_MODULES, clock=default_timer):
+        if isinstance(targets, six.string_types):
+            targets = [targets]
+        self.targets = list(targets)
+        self.skip_modules = skip_modules
+        self.clock = clock
+        self._timings = OrderedDict((target, _Timing()) for target in self.targets)
+        self._current = None
+        self._aliases = {}
+        self._patch = None
+        # resolves targets as a PatchingDoubler would patch them.
+        self._resolver = PatchingDoubler('latency', None, self.targets)
+        # (setter, raw original) for targets on classes and instances.
+        self._set = []
+
+    def _timed(self, target, func):
+        timing = self._timings[target]
+        local, clock = timing.local, self.clock
+
+        def timed(*args, **kwargs):
+            try:
+                mine = local.timing
+            except AttributeError:
+                mine = timing.mine()
+            mine.calls += 1
+            if mine.depth:
+                return func(*args, **kwargs)
+            mine.depth = 1
+            started = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = clock() - started
+                mine.depth = 0
+                mine.seconds += elapsed
+                label = self._current
+                if label is not None:
+                    mine.tests[label] = mine.tests.get(label, 0.0) + elapsed
+        try:
+            return functools.wraps(func)(timed)
+        except AttributeError: # python 2 and callables without a __name__
+            return timed
+
+    @property
+    def started(self):
+        return self._patch is not None
+
+    def start(self):
+        if self.started:
+            raise ValueError("Already started.")
+        replacements = []
+        # id(replacement) -> target, to name the aliases found.
+        replaced = {}
+        # (setter, raw original, replacement) for targets on classes and
+        #  instances; every target is resolved before anything is swapped.
+        swaps = []
+        for target in self.targets:
+            path = target.partition(':')[2]
+            if not path:
+                raise MissingPatchTarget("{0} doesn't name an attribute to time.".format(target))
+            attr = path.rpartition('.')[2]
+            getter, setter, snapshot, owner = self._resolver._resolve_target(target)
+            func = getter()
+            if snapshot is None:
+                # a module attribute, swapped along with its aliases.
+                replacement = self._timed(target, func)
+                replacements.append((owner(), attr, replacement))
+                replaced[id(replacement)] = target
+                continue
+            # classes and instances: swap the raw value, keeping static
+            #  and class methods what they are.
+            raw = snapshot()
+            if raw is not _INHERITED:
+                func = raw
+            elif inspect.isclass(owner()):
+                func = _class_lookup(owner(), attr)
+            if isinstance(func, (staticmethod, classmethod)):
+                replacement = type(func)(self._timed(target, func.__func__))
+            else:
+                replacement = self._timed(target, func)
+            swaps.append((setter, raw, replacement))
+        patch = AliasPatch(replacements, self.skip_modules)
+        try:
+            for setter, raw, replacement in swaps:
+                setter(replacement)
+                self._set.append((setter, raw))
+            patch.apply()
+        except Exception:
+            patch.restore()
+            self._restore_set()
+            raise
+        self._patch = patch
+        canonical = set((id(owner), attr) for owner, attr, replacement in replacements)
+        for owner, attr in self._patch.aliases():
+            if (id(owner), attr) in canonical or not isinstance(owner, types.ModuleType):
+                continue
+            target = replaced.get(id(vars(owner).get(attr)))
+            if target is None:
+                continue
+            alias = "{0}:{1}".format(owner.__name__, attr)
+            aliases = self._aliases.setdefault(target, [])
+            if alias not in aliases:
+                aliases.append(alias)
+
+    def stop(self):
+        if not self.started:
+            raise ValueError("Not started.")
+        self._patch.restore()
+        self._patch = None
+        self._restore_set()
+
+    def _restore_set(self):
+        while self._set:
+            setter, raw = self._set.pop()
+            # deletes attributes the owner only inherits.
+            setter(raw)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def begin(self, label):
+        if self._current is not None:
+            raise ValueError("A scope has not ended.")
+        self._current = label
+
+    def end(self):
+        self._current = None
+
+    @contextmanager
+    def scope(self, label):
+        self.begin(label)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def report(self):
+        """
+        Returns a TargetLatency for each target called, most time first.
+        """
+        report = []
+        for target, timing in self._timings.items():
+            calls = timing.calls
+            if not calls:
+                continue
+            tests = sorted(timing.tests().items(), key=lambda test: (-test[1], test[0]))
+            report.append(TargetLatency(target, timing.seconds, calls, tests,
+                                        sorted(self._aliases.get(target, ()))))
+        report.sort(key=lambda latency: -latency.seconds)
+        return report
+
+    def format_report(self, limit=None):
+        lines = []
+        for latency in self.report()[:limit]:
+            lines.append("{0}: {1:.3f}s in {2} call(s) from {3} test(s)".format(
+                latency.target, latency.seconds, latency.calls, len(latency.tests)))
+            for label, seconds in latency.tests[:3]:
+                lines.append("    {0:.3f}s {1}".format(seconds, label))
+        return "\n".join(lines)
+
+    def format_config(self, min_seconds=0.0, limit=None):
+        """
+        Returns duplo.config INI declarations for the slowest targets
+        (and their aliases), with the variants left blank to fill in.
+        """
+        sections = []
+        names = set()
+        for latency in [l for l in self.report() if l.seconds >= min_seconds][:limit]:
+            name = base = latency.target.rpartition(':')[2].replace('.', '_').lower()
+            count = 1
+            while name in names:
+                count += 1
+                name = "{0}_{1}".format(base, count)
+            names.add(name)
+            targets = [latency.target] + latency.aliases
+            sections.append("\n".join([
+                "# {0:.3f}s in {1} call(s) from {2} test(s)".format(
+                    latency.seconds, latency.calls, len(latency.tests)),
+                "[{0}]".format(name),
+                "variant =",
+                "targets =",
+            ] + ["    {0}".format(target) for target in targets]))
+        return "\n\n".join(sections) + "\n" if sections else ""
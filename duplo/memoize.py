@@ -0,0 +1,162 @@
+"""
+A doubler which swaps an expensive, deterministic function for a
+memoized version of itself.
+"""
+import os, pickle, threading
+from collections import namedtuple, OrderedDict
+
+from . import six
+from .doubles import WrappingDoubler
+
+CacheStats = namedtuple('CacheStats', 'hits misses evictions maxsize currsize')
+
+_MISSING = object()
+
+def _describe(func):
+    module = getattr(func, '__module__', None)
+    name = getattr(func, '__qualname__', None) or getattr(func, '__name__', None)
+    return "{0}:{1}".format(module, name)
+
+class Memoized(object):
+    """
+    Wraps a callable with a bounded LRU cache keyed on the (hashable)
+    call arguments.
+
+    Calls with unhashable arguments are passed through to the wrapped
+    callable and counted as misses.  A maxsize of None leaves the cache
+    unbounded.
+    """
+    def __init__(self, func, maxsize=128):
+        self.__wrapped__ = func
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<Memoized: {0}>".format(_describe(self.__wrapped__))
+
+    def __get__(self, instance, owner):
+        # so that memoizing a method still binds self (which becomes part
+        #  of the key).
+        if instance is None:
+            return self
+        return six.create_bound_method(self, instance)
+
+    def _make_key(self, args, kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return _MISSING
+        return key
+
+    def __call__(self, *args, **kwargs):
+        key = self._make_key(args, kwargs)
+        if key is not _MISSING:
+            with self._lock:
+                result = self.cache.pop(key, _MISSING)
+                if result is not _MISSING:
+                    # re-insert to mark as most recently used.
+                    self.cache[key] = result
+                    self.hits += 1
+                    return result
+        with self._lock:
+            self.misses += 1
+
+        result = self.__wrapped__(*args, **kwargs)
+
+        if key is not _MISSING and self.maxsize != 0:
+            with self._lock:
+                self.cache[key] = result
+                self._trim()
+        return result
+
+    def _trim(self):
+        if self.maxsize is None:
+            return
+        while len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return CacheStats(self.hits, self.misses, self.evictions,
+                          self.maxsize, len(self.cache))
+
+    def clear(self):
+        with self._lock:
+            self.cache.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def load(self, path):
+        """
+        Fills the cache from a file written by save.
+
+        A missing or unreadable file, or one written for a different
+        function, leaves the cache as it was.
+        """
+        try:
+            with open(path, 'rb') as fh:
+                data = pickle.load(fh)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError,
+                AttributeError, ImportError, IndexError, TypeError, ValueError):
+            return False
+
+        if not isinstance(data, dict) or data.get('function') != _describe(self.__wrapped__):
+            return False
+
+        with self._lock:
+            for key, value in data['entries']:
+                self.cache[key] = value
+            self._trim()
+        return True
+
+    def save(self, path):
+        """
+        Writes the cache entries to path, replacing it atomically.
+        """
+        with self._lock:
+            data = {
+                'function': _describe(self.__wrapped__),
+                'entries': list(self.cache.items()),
+            }
+        tmp_path = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(tmp_path, 'wb') as fh:
+            pickle.dump(data, fh, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+
+class MemoizingDoubler(WrappingDoubler):
+    """
+    A doubler whose variant is the normal implementation, memoized.
+
+    Targets are the aliases of one deterministic function, e.g.
+    ['pricing.quotes:quote', 'shop.swappables:quote'].  The cache is
+    created on first application and kept (along with its stats) across
+    apply and unapply.  If cache_file is given, the cache is loaded from
+    it on first application and written back on each unapply.
+    """
+    def __init__(self, name, targets, maxsize=128, cache_file=None, tags=(), requires=(), conflicts=()):
+        super(MemoizingDoubler, self).__init__(name, targets, tags, requires, conflicts)
+        self.maxsize = maxsize
+        self.cache_file = cache_file
+
+    def wrap(self, normal):
+        memoized = Memoized(normal, self.maxsize)
+        if self.cache_file is not None:
+            memoized.load(self.cache_file)
+        return memoized
+
+    def unapply(self, targets=None):
+        super(MemoizingDoubler, self).unapply(targets)
+        if self.cache_file is not None and not self.originals:
+            self.memoized.save(self.cache_file)
+
+    @property
+    def memoized(self):
+        return self.wrapper
+
+    @property
+    def stats(self):
+        if self.memoized is None:
+            return CacheStats(0, 0, 0, self.maxsize, 0)
+        return self.memoized.stats()
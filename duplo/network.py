@@ -0,0 +1,276 @@
+"""
+A doubler which cuts tests off from the network, routing connections to
+in-process handlers instead.
+
+While a SocketDoubler is applied, socket.socket, getaddrinfo and
+gethostbyname (and their aliases in loaded modules) are swapped.
+Connecting to a registered (host, port) hands one end of a socketpair
+to the registered handler, on its own thread, and swaps the other end
+in under the caller's socket, so no DNS lookup or network connection
+happens.  Looking up or connecting to any other host fails at once with
+NetworkBlocked, unless the host is allowed.  Non-internet sockets (e.g.
+AF_UNIX) are left alone.
+
+Every attempt is counted, so a report shows which destinations tests
+tried to reach, and how often.
+"""
+import errno, os, socket, threading
+from collections import namedtuple
+
+from . import six
+from .doubles import DoublerBase, UnexpectedUnapply
+from ._patching import AliasPatch
+
+class NetworkBlocked(socket.error):
+    pass
+
+ROUTED = 'routed'
+ALLOWED = 'allowed'
+BLOCKED = 'blocked'
+
+# how many times host:port was attempted, with what outcome.
+Attempt = namedtuple('Attempt', 'host port outcome count')
+
+HTTPRequest = namedtuple('HTTPRequest', 'method target headers body')
+
+_real_socket = socket.socket
+_real_getaddrinfo = socket.getaddrinfo
+_real_gethostbyname = socket.gethostbyname
+_INET_FAMILIES = (socket.AF_INET, getattr(socket, 'AF_INET6', socket.AF_INET))
+
+DEFAULT_SKIP_MODULES = ('_socket', 'duplo', '_pytest', 'pytest', 'pluggy')
+
+class _RoutedSocket(_real_socket):
+    """
+    A socket whose connections to internet addresses go through the
+    network (a SocketDoubler) it was created under.
+    """
+    network = None
+    _peer = None
+
+    def connect(self, address):
+        handler = None
+        if self.family in _INET_FAMILIES:
+            handler = self.network._route(address[0], address[1])
+        if handler is None:
+            return super(_RoutedSocket, self).connect(address)
+        self._attach(handler, address)
+
+    def connect_ex(self, address):
+        try:
+            self.connect(address)
+        except NetworkBlocked:
+            return errno.ECONNREFUSED
+        except socket.error as e:
+            return e.errno
+        return 0
+
+    def sendto(self, data, *args):
+        address = args[-1]
+        if self.family in _INET_FAMILIES and self.network._route(address[0], address[1]) is not None:
+            raise NetworkBlocked("Datagrams can't be routed to handlers ({0}:{1}).".format(*address[:2]))
+        return super(_RoutedSocket, self).sendto(data, *args)
+
+    def _attach(self, handler, address):
+        ours, theirs = socket.socketpair()
+        os.dup2(ours.fileno(), self.fileno())
+        ours.close()
+        # the new descriptor is blocking; restore what the caller asked for.
+        self.settimeout(self.gettimeout())
+        self._peer = address
+        thread = threading.Thread(target=_serve, args=(handler, theirs, address),
+                                  name="duplo handler for {0}:{1}".format(*address[:2]))
+        thread.daemon = True
+        thread.start()
+
+    def setsockopt(self, *args):
+        try:
+            return super(_RoutedSocket, self).setsockopt(*args)
+        except socket.error as e:
+            # socketpairs don't take TCP options (e.g. TCP_NODELAY).
+            if self._peer is None or e.errno not in (errno.EOPNOTSUPP, errno.ENOPROTOOPT):
+                raise
+
+    def getpeername(self):
+        if self._peer is not None:
+            return self._peer
+        return super(_RoutedSocket, self).getpeername()
+
+def _serve(handler, sock, address):
+    try:
+        handler(sock, address)
+    finally:
+        sock.close()
+
+class HTTPResponder(object):
+    """
+    A handler which serves HTTP/1.1, answering each request with a fixed
+    response, or with respond(request) -> (status, headers, body).
+    Requests are recorded as HTTPRequests, with lowercased header names.
+    """
+    def __init__(self, status=200, body=b'', headers=None, respond=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+        self.respond = respond
+        self.requests = []
+
+    def __call__(self, sock, address):
+        reader = sock.makefile('rb')
+        try:
+            while True:
+                request = self._read_request(reader)
+                if request is None:
+                    break
+                self.requests.append(request)
+                if self.respond is not None:
+                    status, headers, body = self.respond(request)
+                else:
+                    status, headers, body = self.status, self.headers, self.body
+                sock.sendall(self._format(request, status, headers, body))
+                if request.headers.get('connection', '').lower() == 'close':
+                    break
+        finally:
+            reader.close()
+
+    def _read_request(self, reader):
+        line = reader.readline()
+        if not line.strip():
+            return None
+        method, target = line.decode('latin-1').split()[:2]
+        headers = {}
+        while True:
+            line = reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length') or 0)
+        return HTTPRequest(method, target, headers, reader.read(length) if length else b'')
+
+    def _format(self, request, status, headers, body):
+        if isinstance(body, six.text_type):
+            body = body.encode('utf-8')
+        lines = ["HTTP/1.1 {0} {1}".format(status, six.moves.http_client.responses.get(status, ''))]
+        headers = dict(headers)
+        headers.setdefault('Content-Length', str(len(body)))
+        lines.extend("{0}: {1}".format(name, value) for name, value in sorted(headers.items()))
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+        return head if request.method == 'HEAD' else head + body
+
+class SocketDoubler(DoublerBase):
+    """
+    Blocks the network while applied, routing connections to registered
+    handlers::
+
+        network = SocketDoubler(allow=['localhost'])
+        network.register('api.example.com', 443, HTTPResponder(body=b'{}'))
+        manager.register_double(network)
+
+    A handler is called as handler(sock, address) on its own thread with
+    the far end of the connection, and the socket is closed when it
+    returns.  A port of None matches any port.  Hosts in allow (exact
+    names or addresses) reach the real network.
+    """
+    def __init__(self, name='network', allow=(), skip_modules=DEFAULT_SKIP_MODULES,
+                 tags=(), requires=(), conflicts=()):
+        super(SocketDoubler, self).__init__(name, tags, requires, conflicts)
+        self.allow = set(host.lower() for host in allow)
+        # addresses allowed hosts resolved to.
+        self._allowed_addresses = set()
+        self.skip_modules = skip_modules
+        self.handlers = {}
+        self._hosts = set()
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self._patch = None
+        self.socket_class = type('RoutedSocket', (_RoutedSocket,), {'network': self})
+
+    def register(self, host, port, handler):
+        host = host.lower()
+        self.handlers[(host, port)] = handler
+        self._hosts.add(host)
+
+    def _record(self, host, port, outcome):
+        key = (host, port, outcome)
+        with self._lock:
+            self._attempts[key] = self._attempts.get(key, 0) + 1
+
+    def _route(self, host, port):
+        """
+        Returns the handler for host:port, or None if the host is
+        allowed, and raises NetworkBlocked otherwise.
+        """
+        host = host.lower()
+        handler = self.handlers.get((host, port)) or self.handlers.get((host, None))
+        if handler is not None:
+            self._record(host, port, ROUTED)
+            return handler
+        if host in self.allow or host in self._allowed_addresses:
+            self._record(host, port, ALLOWED)
+            return None
+        self._record(host, port, BLOCKED)
+        raise NetworkBlocked("Blocked connection to {0}:{1}; register a handler or allow the host.".format(host, port))
+
+    def _resolvable(self, host, port):
+        """
+        Returns true if host should be looked up for real, false if it
+        has handlers, and raises NetworkBlocked otherwise.
+        """
+        if host is None or host.lower() in self.allow:
+            return True
+        if host.lower() in self._hosts:
+            return False
+        self._record(host.lower(), port, BLOCKED)
+        raise NetworkBlocked("Blocked lookup of {0}; register a handler or allow the host.".format(host))
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        if isinstance(host, bytes):
+            host = host.decode('idna')
+        if self._resolvable(host, port):
+            infos = _real_getaddrinfo(host, port, family, type, proto, flags)
+            if host is not None:
+                self._allowed_addresses.update(info[4][0].lower() for info in infos)
+            return infos
+        if not isinstance(port, six.integer_types):
+            port = socket.getservbyname(port) if port else 0
+        family = family or socket.AF_INET
+        address = (host, port) if family == socket.AF_INET else (host, port, 0, 0)
+        return [(family, type or socket.SOCK_STREAM, proto, '', address)]
+
+    def gethostbyname(self, host):
+        if self._resolvable(host, None):
+            address = _real_gethostbyname(host)
+            self._allowed_addresses.add(address)
+            return address
+        return host
+
+    def report(self):
+        """
+        Returns the Attempts made, most frequent first.
+        """
+        with self._lock:
+            attempts = [Attempt(host, port, outcome, count)
+                        for (host, port, outcome), count in self._attempts.items()]
+        return sorted(attempts, key=lambda attempt: (-attempt.count, attempt.host, str(attempt.port)))
+
+    def format_report(self):
+        return "\n".join("{0}:{1} {2} {3}".format(*attempt) for attempt in self.report())
+
+    def clear(self):
+        with self._lock:
+            self._attempts.clear()
+
+    def apply(self):
+        if self._patch is None:
+            self._patch = AliasPatch([
+                (socket, 'socket', self.socket_class),
+                (socket, 'getaddrinfo', self.getaddrinfo),
+                (socket, 'gethostbyname', self.gethostbyname),
+            ], self.skip_modules)
+        self._patch.apply()
+
+    def unapply(self):
+        if self._patch is None or not self._patch.patched:
+            raise UnexpectedUnapply
+        self._patch.restore()
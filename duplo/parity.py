@@ -0,0 +1,212 @@
+"""
+Checks that registered doubles behave like the implementations they
+replace.
+
+Each PatchingDoubler can declare input cases (either with a
+parity_cases attribute or through the cases mapping given to the
+runner).  Every case is run against both the normal implementation and
+the variant on a pool of worker threads, and the outcomes compared.
+"""
+import inspect, math, operator
+from collections import namedtuple, OrderedDict
+
+from timeit import default_timer
+
+from ._workers import WorkerPool
+from .doubles import PatchingDoubler, WrappingDoubler
+
+MATCH, MISMATCH, TIMEOUT, ERROR = 'match', 'mismatch', 'timeout', 'error'
+
+ParityCase = namedtuple('ParityCase', 'args kwargs')
+
+def case(*args, **kwargs):
+    """
+    Declares the arguments for one parity check.
+    """
+    return ParityCase(args, kwargs)
+
+# value and exception are None unless the call returned or raised,
+#  respectively.  elapsed is None if the call timed out.
+Outcome = namedtuple('Outcome', 'value exception elapsed')
+
+ParityResult = namedtuple('ParityResult', 'double case status normal variant')
+
+LatencySummary = namedtuple('LatencySummary', 'cases normal variant')
+
+class ParityReport(object):
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def mismatches(self):
+        """
+        Results which didn't match, including timeouts and errors.
+        """
+        return [result for result in self.results if result.status != MATCH]
+
+    @property
+    def ok(self):
+        return not self.mismatches
+
+    def latency(self):
+        """
+        Total time spent on each side, per double.
+        """
+        summaries = OrderedDict()
+        for result in self.results:
+            cases, normal, variant = summaries.get(result.double, (0, 0.0, 0.0))
+            summaries[result.double] = (
+                cases + 1,
+                normal + (result.normal.elapsed or 0.0),
+                variant + (result.variant.elapsed or 0.0),
+            )
+        return OrderedDict(
+            (name, LatencySummary(*summary)) for name, summary in summaries.items()
+        )
+
+    def format(self):
+        lines = []
+        for name, summary in self.latency().items():
+            lines.append("{0}: {1} case(s), normal {2:.4f}s, variant {3:.4f}s".format(
+                name, summary.cases, summary.normal, summary.variant))
+        for result in self.mismatches:
+            lines.append("{0} {1}{2}: normal={3!r} variant={4!r}".format(
+                result.status.upper(), result.double, _format_case(result.case),
+                _describe_outcome(result.normal), _describe_outcome(result.variant)))
+        return "\n".join(lines)
+
+def _format_case(parity_case):
+    args = [repr(arg) for arg in parity_case.args]
+    args.extend("{0}={1!r}".format(k, v) for k, v in sorted(parity_case.kwargs.items()))
+    return "({0})".format(", ".join(args))
+
+def _describe_outcome(outcome):
+    if outcome.elapsed is None:
+        return TIMEOUT
+    if outcome.exception is not None:
+        return outcome.exception
+    return outcome.value
+
+class ParityRunner(object):
+    """
+    Runs parity cases for the PatchingDoublers registered with manager.
+
+    cases maps double names to a list of cases, and takes precedence
+    over a doubler's parity_cases attribute.  Doublers without cases,
+    and those without a variant of their own (such as WrappingDoublers,
+    whose variant wraps the normal), are skipped.  At most concurrency
+    calls run at once, and a call running longer than timeout seconds
+    is reported as a timeout (the call itself can't be interrupted and
+    is left to finish in the background).  Calls which haven't started
+    by the time every call could have run to its timeout, because calls
+    which never return hold the workers, are reported as timeouts too.
+
+    compare is called with the normal and variant return values and
+    should return whether they match.  Calls which raise match if both
+    sides raise the same exception type.  A case for which either side
+    couldn't be called at all (it isn't callable, or doesn't take the
+    case's arguments) is reported as an error, since it exercises
+    nothing.
+    """
+    def __init__(self, manager, cases=None, concurrency=8, timeout=None,
+                 compare=operator.eq):
+        self.manager = manager
+        self.cases = cases or {}
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.compare = compare
+
+    def _cases_for(self, double):
+        declared = self.cases.get(double.name)
+        if declared is None:
+            declared = getattr(double, 'parity_cases', None) or ()
+        return [c if isinstance(c, ParityCase) else ParityCase(tuple(c), {})
+                for c in declared]
+
+    def _sides(self, double):
+        """
+        Returns the normal and variant implementations for double,
+        whether or not it's currently applied.
+        """
+        if double.normals:
+            normal = double.normals[0]
+        else:
+            normal = double._resolve_target(double.targets[0]).getter()
+        return normal, double._resolve_variant(double.variant)
+
+    def _outcome(self, task, deadline):
+        if not task.wait(self.timeout, deadline):
+            return Outcome(None, None, None)
+        if task.exc_info is not None:
+            return Outcome(None, task.exc_info[1], task.elapsed)
+        return Outcome(task.result, None, task.elapsed)
+
+    def _uncalled(self, side, task):
+        # a TypeError raised by the call itself, before entering the
+        #  callee; builtins raise their own TypeErrors from there too.
+        if task.exc_info is None or not isinstance(task.exc_info[1], TypeError):
+            return False
+        return task.exc_info[2].tb_next is None and not inspect.isbuiltin(side)
+
+    def _status(self, normal, variant):
+        if normal.elapsed is None or variant.elapsed is None:
+            return TIMEOUT
+        if normal.exception is not None or variant.exception is not None:
+            if type(normal.exception) is type(variant.exception):
+                return MATCH
+            return MISMATCH
+        return MATCH if self.compare(normal.value, variant.value) else MISMATCH
+
+    def run(self, include=None):
+        """
+        Runs the declared cases, optionally only for the named doubles,
+        and returns a ParityReport.
+        """
+        include = self.manager._conform_double_names(include)
+        if include is None:
+            names = sorted(self.manager.registry.keys())
+        else:
+            names = include
+
+        pending = []
+        with WorkerPool(self.concurrency) as pool:
+            for name in names:
+                double = self.manager.registry[name]
+                if not isinstance(double, PatchingDoubler) or isinstance(double, WrappingDoubler):
+                    continue
+                if double.variant is None:
+                    continue
+                cases = self._cases_for(double)
+                if not cases:
+                    continue
+                normal, variant = self._sides(double)
+                for parity_case in cases:
+                    pending.append((
+                        name, parity_case, normal, variant,
+                        pool.submit(normal, *parity_case.args, **parity_case.kwargs),
+                        pool.submit(variant, *parity_case.args, **parity_case.kwargs),
+                    ))
+
+            deadline = None
+            if self.timeout is not None:
+                # long enough for each worker to run its share of the
+                #  calls, each up to the timeout.
+                rounds = math.ceil(2.0 * len(pending) / self.concurrency)
+                deadline = default_timer() + rounds * self.timeout
+
+            results = []
+            for name, parity_case, normal_side, variant_side, normal_task, variant_task in pending:
+                normal = self._outcome(normal_task, deadline)
+                variant = self._outcome(variant_task, deadline)
+                status = self._status(normal, variant)
+                if status != TIMEOUT and (self._uncalled(normal_side, normal_task) or
+                                          self._uncalled(variant_side, variant_task)):
+                    status = ERROR
+                results.append(ParityResult(name, parity_case, status, normal, variant))
+        return ParityReport(results)
+
+def check_parity(manager, cases=None, **kwargs):
+    """
+    Shortcut for ParityRunner(manager, cases, **kwargs).run().
+    """
+    return ParityRunner(manager, cases, **kwargs).run()
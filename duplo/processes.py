@@ -0,0 +1,314 @@
+"""
+A doubler which answers subprocess calls with scripted output instead of
+running anything.
+
+While a SubprocessDoubler is applied, subprocess.Popen (and its aliases
+in loaded modules) is swapped for a class which looks the command up in
+the registered rules and plays back their stdout, stderr and return
+code.  subprocess.run, call, check_call, check_output and os.popen are
+all built on Popen, so they're answered too.
+
+Rules are looked up in this order:
+
+- exact rules, by the whole argument list, in a dict;
+- prefix rules, by the first argument, then the longest matching
+  prefix;
+- regex rules, matched against the arguments joined by spaces, all
+  compiled into one pattern so that one match call finds the first
+  registered rule that matches.
+
+A command no rule matches raises UnmatchedCommand, rather than running.
+"""
+import io, itertools, locale, os, re, shlex, subprocess
+from collections import namedtuple
+
+from . import six
+from .doubles import DoublerBase, UnexpectedUnapply
+from ._patching import AliasPatch
+
+class UnmatchedCommand(ValueError):
+    pass
+
+# stdout may also be an iterable of chunks, streamed to Popen.stdout.
+Response = namedtuple('Response', 'stdout stderr returncode')
+
+EXACT = 'exact'
+PREFIX = 'prefix'
+REGEX = 'regex'
+
+_real_popen = subprocess.Popen
+_DEVNULL = getattr(subprocess, 'DEVNULL', -3)
+
+# Popen's positional parameters after args.
+_POPEN_PARAMETERS = (
+    'bufsize', 'executable', 'stdin', 'stdout', 'stderr', 'preexec_fn', 'close_fds',
+    'shell', 'cwd', 'env', 'universal_newlines', 'startupinfo', 'creationflags',
+)
+
+DEFAULT_SKIP_MODULES = ('duplo', '_pytest', 'pytest', 'pluggy')
+
+def _tokens(args):
+    if isinstance(args, six.string_types):
+        args = shlex.split(args)
+    elif isinstance(args, bytes) or hasattr(args, '__fspath__'):
+        args = [args]
+    tokens = []
+    for arg in args:
+        if hasattr(os, 'fspath'):
+            arg = os.fspath(arg)
+        if isinstance(arg, bytes):
+            arg = arg.decode(locale.getpreferredencoding(False))
+        tokens.append(arg)
+    return tuple(tokens)
+
+class _Rule(object):
+    def __init__(self, kind, pattern, response, respond):
+        self.kind = kind
+        self.pattern = pattern
+        self.response = response
+        self.respond = respond
+
+    def __repr__(self):
+        return "<Rule {0}: {1!r}>".format(self.kind, self.pattern)
+
+class _Stream(io.RawIOBase):
+    """
+    A readable stream over an iterable of byte chunks, consumed only as
+    it's read.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            try:
+                self._pending = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+class _StdinPipe(io.BytesIO):
+    def __init__(self, process):
+        super(_StdinPipe, self).__init__()
+        self._process = process
+
+    def close(self):
+        if not self.closed:
+            self._process.input += self.getvalue()
+        super(_StdinPipe, self).close()
+
+class ScriptedPopen(_real_popen):
+    """
+    A Popen which doesn't start a process, but plays back the response
+    of the rule its command matched.  The process has finished as soon
+    as it's created, though a streamed stdout is only produced as read.
+
+    input collects what was written to stdin.
+    """
+    doubler = None
+    _pids = itertools.count(1 << 22)
+
+    def __init__(self, args, *positional, **kwargs):
+        kwargs.update(zip(_POPEN_PARAMETERS, positional))
+        self._child_created = False
+        self.args = args
+        self.kwargs = kwargs
+        self.pid = next(self._pids)
+        self.input = b''
+        self.text_mode = bool(kwargs.get('text') or kwargs.get('universal_newlines')
+                              or kwargs.get('encoding') or kwargs.get('errors'))
+        self.encoding = kwargs.get('encoding') or locale.getpreferredencoding(False)
+        self.errors = kwargs.get('errors') or 'strict'
+
+        self.rule = self.doubler.match(args)
+        response = self.rule.response
+        if self.rule.respond is not None:
+            response = Response(*self.rule.respond(self))
+        self.returncode = response.returncode
+        self.doubler.processes.append(self)
+
+        self.stdin = self.stdout = self.stderr = None
+        if kwargs.get('stdin') == subprocess.PIPE:
+            self.stdin = self._wrap(_StdinPipe(self), write=True)
+
+        stdout = self._chunks(response.stdout)
+        stderr = self._chunks(response.stderr)
+        if kwargs.get('stderr') == subprocess.STDOUT:
+            stdout, stderr = itertools.chain(stdout, stderr), ()
+        self.stdout = self._output(kwargs.get('stdout'), stdout)
+        self.stderr = self._output(kwargs.get('stderr'), stderr)
+
+    def _chunks(self, output):
+        if output is None:
+            return ()
+        if isinstance(output, (bytes, bytearray, six.text_type)):
+            output = [output]
+        return (chunk.encode(self.encoding) if isinstance(chunk, six.text_type) else bytes(chunk)
+                for chunk in output)
+
+    def _wrap(self, stream, write=False):
+        if not self.text_mode:
+            return stream
+        if not write:
+            stream = io.BufferedReader(stream)
+        return io.TextIOWrapper(stream, self.encoding, self.errors, write_through=write)
+
+    def _output(self, target, chunks):
+        if target == subprocess.PIPE:
+            return self._wrap(_Stream(chunks))
+        if target is None or target == _DEVNULL:
+            # not captured: the output would have gone to the test
+            #  runner's own stdout/stderr.
+            return None
+        fd = target if isinstance(target, six.integer_types) else target.fileno()
+        for chunk in chunks:
+            os.write(fd, chunk)
+        return None
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+    def communicate(self, input=None, timeout=None):
+        if self.stdin is not None and not self.stdin.closed:
+            if input:
+                self.stdin.write(input)
+            self.stdin.close()
+        stdout = stderr = None
+        if self.stdout is not None:
+            stdout = self.stdout.read()
+            self.stdout.close()
+        if self.stderr is not None:
+            stderr = self.stderr.read()
+            self.stderr.close()
+        return stdout, stderr
+
+    def send_signal(self, sig):
+        pass
+
+    def terminate(self):
+        pass
+
+    def kill(self):
+        pass
+
+class SubprocessDoubler(DoublerBase):
+    """
+    Answers subprocess calls from registered rules while applied::
+
+        commands = SubprocessDoubler()
+        commands.register(['git', 'rev-parse', 'HEAD'], stdout=b'0123abcd\\n')
+        commands.register_prefix(['convert'], returncode=0)
+        commands.register_regex(r'identify .*\\.png$', stdout=b'PNG 16x16\\n')
+        manager.register_double(commands)
+
+    stdout and stderr are bytes or text (encoded as the process would
+    be decoded), and stdout may be an iterable of chunks to stream.  If
+    respond is given, it's called with the process (see ScriptedPopen)
+    and returns (stdout, stderr, returncode) instead.
+
+    Each process started is kept in processes, with its args, kwargs,
+    the rule it matched and the input written to it.
+    """
+    def __init__(self, name='subprocess', skip_modules=DEFAULT_SKIP_MODULES,
+                 tags=(), requires=(), conflicts=()):
+        super(SubprocessDoubler, self).__init__(name, tags, requires, conflicts)
+        self.skip_modules = skip_modules
+        self.processes = []
+        self._exact = {}
+        self._prefixes = {}
+        self._regex_rules = []
+        self._regex = None
+        self._patch = None
+        self.popen_class = type('ScriptedPopen', (ScriptedPopen,), {'doubler': self})
+
+    def _rule(self, kind, pattern, stdout, stderr, returncode, respond):
+        return _Rule(kind, pattern, Response(stdout, stderr, returncode), respond)
+
+    def register(self, command, stdout=b'', stderr=b'', returncode=0, respond=None):
+        """
+        Answers exactly command (an argument list, or a string split as
+        by a shell).
+        """
+        tokens = _tokens(command)
+        self._exact[tokens] = self._rule(EXACT, tokens, stdout, stderr, returncode, respond)
+
+    def register_prefix(self, command, stdout=b'', stderr=b'', returncode=0, respond=None):
+        """
+        Answers commands starting with the arguments of command.
+        """
+        tokens = _tokens(command)
+        if not tokens:
+            raise ValueError("A prefix needs at least one argument.")
+        rules = self._prefixes.setdefault(tokens[0], [])
+        rules[:] = [rule for rule in rules if rule.pattern != tokens]
+        rules.append(self._rule(PREFIX, tokens, stdout, stderr, returncode, respond))
+        rules.sort(key=lambda rule: -len(rule.pattern))
+
+    def register_regex(self, pattern, stdout=b'', stderr=b'', returncode=0, respond=None):
+        """
+        Answers commands whose arguments, joined by spaces, match pattern
+        from the start.  Patterns are combined into one, so they can't
+        use numbered backreferences or share group names, and inline
+        flags must be scoped, e.g. (?i:...).
+        """
+        re.compile(pattern)
+        self._regex_rules.append(self._rule(REGEX, pattern, stdout, stderr, returncode, respond))
+        self._regex = None
+
+    def _compiled_regex(self):
+        if self._regex is None:
+            alternatives = []
+            rules_by_group = {}
+            group = 1
+            for rule in self._regex_rules:
+                alternatives.append("({0})".format(rule.pattern))
+                rules_by_group[group] = rule
+                group += 1 + re.compile(rule.pattern).groups
+            self._regex = re.compile("|".join(alternatives)), rules_by_group
+        return self._regex
+
+    def match(self, args):
+        """
+        Returns the rule answering args, or raises UnmatchedCommand.
+        """
+        tokens = _tokens(args)
+        rule = self._exact.get(tokens)
+        if rule is not None:
+            return rule
+        for rule in self._prefixes.get(tokens[0] if tokens else None, ()):
+            if tokens[:len(rule.pattern)] == rule.pattern:
+                return rule
+        if self._regex_rules:
+            regex, rules_by_group = self._compiled_regex()
+            match = regex.match(" ".join(tokens))
+            if match is not None:
+                # the outermost group closes last, so lastindex is the
+                #  wrapper around the alternative that matched.
+                return rules_by_group[match.lastindex]
+        raise UnmatchedCommand("No rule answers {0!r}.".format(" ".join(tokens)))
+
+    def commands(self):
+        """
+        Returns the argument lists of the processes started, in order.
+        """
+        return [list(_tokens(process.args)) for process in self.processes]
+
+    def apply(self):
+        if self._patch is None:
+            self._patch = AliasPatch([(subprocess, 'Popen', self.popen_class)], self.skip_modules)
+        self._patch.apply()
+
+    def unapply(self):
+        if self._patch is None or not self._patch.patched:
+            raise UnexpectedUnapply
+        self._patch.restore()
@@ -0,0 +1,164 @@
+"""
+A doubler which forwards to the normal implementation while recording
+each call.
+
+Spy records into preallocated, fixed-size buffers, so recording costs a
+handful of list stores and two uncontended locks per call (much less
+than mock.Mock(wraps=...)), and only the most recent calls, up to
+capacity, are kept.  Calls from several threads may be recorded at once.
+"""
+import itertools, threading
+from array import array
+from collections import namedtuple
+from timeit import default_timer
+
+from . import six
+from .doubles import WrappingDoubler
+
+# exception is None unless the call raised, in which case result is None.
+Call = namedtuple('Call', 'args kwargs result exception timestamp')
+
+_EMPTY = {}
+_MISSING = object()
+
+class Spy(object):
+    """
+    Wraps a callable, recording the arguments, return value (or
+    exception) and timestamp of each call in a ring buffer.
+    """
+    def __init__(self, func, capacity=1024):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1.")
+        self.__wrapped__ = func
+        self.capacity = capacity
+        self.reset()
+
+    def reset(self):
+        capacity = self.capacity
+        self._args = [None] * capacity
+        self._kwargs = [None] * capacity
+        self._results = [None] * capacity
+        self._exceptions = [None] * capacity
+        self._times = array('d', [0.0]) * capacity
+        # the index of the call each slot holds.
+        self._indexes = [-1] * capacity
+        self._counter = itertools.count()
+        self._recorded = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<Spy: {0!r}>".format(self.__wrapped__)
+
+    def __get__(self, instance, owner):
+        # so that spying on a function set as a class attribute still
+        #  binds self.
+        if instance is None:
+            return self
+        return six.create_bound_method(self, instance)
+
+    def __call__(self, *args, **kwargs):
+        # itertools.count is atomic under the GIL, so threads get
+        #  distinct slots without a lock.
+        index = next(self._counter)
+        slot = index % self.capacity
+        self._args[slot] = args
+        self._kwargs[slot] = kwargs or _EMPTY
+        self._times[slot] = default_timer()
+        lock = self._lock
+        with lock:
+            self._indexes[slot] = index
+            self._results[slot] = self._exceptions[slot] = None
+            # a thread with a lower index may get here after one with a
+            #  higher index.
+            if index >= self._recorded:
+                self._recorded = index + 1
+        try:
+            result = self.__wrapped__(*args, **kwargs)
+        except Exception as e:
+            # unless a later call has taken the slot over meanwhile.
+            with lock:
+                if self._indexes[slot] == index:
+                    self._exceptions[slot] = e
+            raise
+        with lock:
+            if self._indexes[slot] == index:
+                self._results[slot] = result
+        return result
+
+    @property
+    def count(self):
+        """
+        The number of calls made, including those no longer kept.
+        """
+        return self._recorded
+
+    def _slots(self, first=None):
+        start = max(0, self._recorded - self.capacity)
+        if first is not None:
+            start = max(start, first)
+        return (index % self.capacity for index in range(start, self._recorded))
+
+    def _call(self, slot):
+        return Call(self._args[slot], self._kwargs[slot] or {}, self._results[slot],
+                    self._exceptions[slot], self._times[slot])
+
+    def calls(self):
+        """
+        Returns the kept calls, oldest first.
+        """
+        return [self._call(slot) for slot in self._slots()]
+
+    def last(self, n=1):
+        """
+        Returns the n most recent calls, oldest first.
+        """
+        return [self._call(slot) for slot in self._slots(self._recorded - n)]
+
+    @property
+    def last_call(self):
+        if not self._recorded:
+            return None
+        return self._call((self._recorded - 1) % self.capacity)
+
+    def filter(self, *args, **kwargs):
+        """
+        Returns the kept calls whose positional arguments start with args
+        and whose keyword arguments include kwargs, oldest first.
+        """
+        n = len(args)
+        matches = []
+        for slot in self._slots():
+            call_args = self._args[slot]
+            if call_args[:n] != args:
+                continue
+            call_kwargs = self._kwargs[slot]
+            if any(call_kwargs.get(k, _MISSING) != v for k, v in six.iteritems(kwargs)):
+                continue
+            matches.append(self._call(slot))
+        return matches
+
+    def where(self, predicate):
+        """
+        Returns the kept calls for which predicate(call) is true.
+        """
+        return [call for call in self.calls() if predicate(call)]
+
+    def called_with(self, *args, **kwargs):
+        return bool(self.filter(*args, **kwargs))
+
+class SpyDoubler(WrappingDoubler):
+    """
+    A doubler whose variant is a Spy forwarding to the normal
+    implementation.  The spy (and what it recorded) is kept across
+    applications; call doubler.spy.reset() to forget.
+    """
+    def __init__(self, name, targets, capacity=1024, tags=(), requires=(), conflicts=()):
+        super(SpyDoubler, self).__init__(name, targets, tags, requires, conflicts)
+        self.capacity = capacity
+
+    def wrap(self, normal):
+        return Spy(normal, self.capacity)
+
+    @property
+    def spy(self):
+        return self.wrapper
@@ -0,0 +1,106 @@
+"""
+A unittest.TestCase mixin which applies doubles once per class rather
+than once per test.
+
+    class CheckoutTests(DoublesTestCase, unittest.TestCase):
+        double_manager = manager
+        class_doubles = ['payments', 'mailing_list']
+
+        def test_receipt(self):
+            ...
+
+        @override(unapply=['mailing_list'])
+        def test_real_mail(self):
+            ...
+
+class_doubles (names or patterns) and class_double_tags select the
+doubles applied in setUpClass and reverted in tearDownClass.  override
+changes the selection for one test: only the doubles it applies which
+the class hasn't, and those it unapplies (with the doubles requiring
+them) which the class has, are touched around that test.
+"""
+from .doubles import applied, unapplied
+
+def override(apply=None, unapply=None):
+    """
+    Marks a test method of a DoublesTestCase to run with the doubles
+    named by apply applied and those named by unapply unapplied, on top
+    of the class's doubles.
+    """
+    def mark(func):
+        func.double_overrides = (apply, unapply)
+        return func
+    return mark
+
+class DoublesTestCase(object):
+    """
+    Mix in before unittest.TestCase.  Subclasses overriding setUpClass,
+    tearDownClass or setUp must call the superclass's.
+    """
+    double_manager = None
+    class_doubles = None
+    class_double_tags = None
+
+    @classmethod
+    def setUpClass(cls):
+        super(DoublesTestCase, cls).setUpClass()
+        cls._class_plan = None
+        cls._class_applied = frozenset()
+        cls._deltas = {}
+        if cls.class_doubles is None and cls.class_double_tags is None:
+            return
+        manager = cls.double_manager
+        plan = applied(manager, cls.class_doubles, cls.class_double_tags)
+        depth = manager.depth
+        try:
+            plan.__enter__()
+        except Exception:
+            # undo what was applied before the failure, if anything was.
+            if manager.depth > depth:
+                manager.revert()
+            raise
+        cls._class_plan = plan
+        # with their requirements (see DoublerBase.requires).
+        cls._class_applied = frozenset(plan.selected)
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            if cls._class_plan is not None:
+                cls._class_plan.__exit__(None, None, None)
+                cls._class_plan = None
+        finally:
+            super(DoublesTestCase, cls).tearDownClass()
+
+    @classmethod
+    def _delta(cls, method_name):
+        """
+        Returns the plans (see duplo.doubles.applied) for a test's
+        overrides, worked out once per test method.
+        """
+        try:
+            return cls._deltas[method_name]
+        except KeyError:
+            pass
+        plans = []
+        overrides = getattr(getattr(cls, method_name, None), 'double_overrides', None)
+        if overrides is not None:
+            manager = cls.double_manager
+            apply, unapply = overrides
+            if apply is not None:
+                names = set(manager.select(apply)) - cls._class_applied
+                if names:
+                    plans.append(applied(manager, sorted(names)))
+            if unapply is not None:
+                # with their dependents (see DoublerBase.requires).
+                names = set(manager.select(unapply, action='unapply')) & cls._class_applied
+                if names:
+                    plans.append(unapplied(manager, sorted(names)))
+        cls._deltas[method_name] = plans
+        return plans
+
+    def setUp(self):
+        for plan in self._delta(self._testMethodName):
+            plan.__enter__()
+            self.addCleanup(plan.__exit__, None, None, None)
+        super(DoublesTestCase, self).setUp()
@@ -0,0 +1,164 @@
+"""
+Records a timeline of duplo's activity, exportable in the Chrome trace
+event format (viewable in chrome://tracing or Perfetto).
+
+While a Tracer is installed, begin and end events are recorded for
+DoubleManager.apply_doubles, unapply_doubles (including selecting the
+doubles) and revert, for each plan from applied or unapplied entered
+(whose selection was made up front), for each PatchingDoubler apply and
+unapply, and for each target resolution.
+Events go into a ring buffer allocated up front, so once it's full the
+oldest events are overwritten.
+"""
+import functools, itertools, json, os, threading
+from timeit import default_timer
+
+from .six.moves import _thread
+from .doubles import DoubleManager, PatchingDoubler, _Plan
+
+def _manager_span(method):
+    return lambda manager, *args, **kwargs: (method, None)
+
+_PLAN_SPANS = {'apply': 'applied', 'unapply': 'unapplied'}
+
+def _plan_span(plan, *args, **kwargs):
+    # named for the function which made the plan.
+    return _PLAN_SPANS[plan.action_attr], None
+
+def _double_span(action):
+    return lambda double, *args, **kwargs: ("{0}:{1}".format(action, double.name), None)
+
+def _resolution_span(double, target, *args, **kwargs):
+    return "resolve:{0}".format(target), {'double': double.name}
+
+# (class, method name, function returning the span name and args)
+_TRACED = [
+    (DoubleManager, 'apply_doubles', _manager_span('apply_doubles')),
+    (DoubleManager, 'unapply_doubles', _manager_span('unapply_doubles')),
+    (_Plan, '__enter__', _plan_span),
+    (DoubleManager, 'revert', _manager_span('revert')),
+    (PatchingDoubler, 'apply', _double_span('apply')),
+    (PatchingDoubler, 'unapply', _double_span('unapply')),
+    (PatchingDoubler, '_build_resolution', _resolution_span),
+]
+
+class TracerInstalled(RuntimeError):
+    pass
+
+_installed = [None]
+
+class Tracer(object):
+    """
+    Records duplo's activity while installed::
+
+        tracer = tracing.Tracer()
+        with tracer:
+            run tests
+        tracer.dump('duplo-trace.json')
+    """
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self._names = [None] * capacity
+        self._phases = [None] * capacity
+        self._times = [0.0] * capacity
+        self._threads = [0] * capacity
+        self._args = [None] * capacity
+        self._counter = itertools.count()
+        self._recorded = 0
+        self._lock = threading.Lock()
+        self._originals = []
+        self._started = default_timer()
+
+    def record(self, name, phase, args=None):
+        """
+        Records an event; phase is 'B' (begin) or 'E' (end).
+        """
+        # itertools.count is atomic under the GIL, so threads get
+        #  distinct slots without a lock.
+        index = next(self._counter)
+        slot = index % self.capacity
+        self._names[slot] = name
+        self._phases[slot] = phase
+        self._times[slot] = default_timer()
+        self._threads[slot] = _thread.get_ident()
+        self._args[slot] = args
+        # a thread with a lower index may get here after one with a
+        #  higher index.
+        with self._lock:
+            if index >= self._recorded:
+                self._recorded = index + 1
+
+    @property
+    def dropped(self):
+        """
+        The number of events overwritten since the buffer filled.
+        """
+        return max(0, self._recorded - self.capacity)
+
+    def clear(self):
+        self._counter = itertools.count()
+        self._recorded = 0
+        self._started = default_timer()
+
+    def _wrap(self, func, span):
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            name, span_args = span(*args, **kwargs)
+            self.record(name, 'B', span_args)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, 'E', span_args)
+        return traced
+
+    def install(self):
+        if _installed[0] is not None:
+            raise TracerInstalled("Another tracer is already installed.")
+        _installed[0] = self
+        for klass, attr, span in _TRACED:
+            original = klass.__dict__[attr]
+            self._originals.append((klass, attr, original))
+            setattr(klass, attr, self._wrap(original, span))
+
+    def uninstall(self):
+        while self._originals:
+            klass, attr, original = self._originals.pop()
+            setattr(klass, attr, original)
+        _installed[0] = None
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+    def events(self):
+        """
+        Returns the buffered events, oldest first, as Chrome trace event
+        dicts.
+        """
+        first = max(0, self._recorded - self.capacity)
+        pid = os.getpid()
+        events = []
+        for index in range(first, self._recorded):
+            slot = index % self.capacity
+            event = {
+                'name': self._names[slot],
+                'cat': 'duplo',
+                'ph': self._phases[slot],
+                'ts': (self._times[slot] - self._started) * 1e6,
+                'pid': pid,
+                'tid': self._threads[slot],
+            }
+            if self._args[slot] is not None:
+                event['args'] = self._args[slot]
+            events.append(event)
+        return events
+
+    def to_chrome_trace(self):
+        return {'traceEvents': self.events(), 'displayTimeUnit': 'ms'}
+
+    def dump(self, path):
+        with open(path, 'w') as fh:
+            json.dump(self.to_chrome_trace(), fh)
@@ -0,0 +1,163 @@
+"""
+Finds doubles which are applied but never exercised.
+
+While a UsageTracker is started, each PatchingDoubler's variant is
+wrapped with a hit counter when applied.  Tests (or modules, or any
+other unit) are marked out as scopes, and at the end of the run the
+tracker reports which doubles were applied within each scope but never
+called, e.g. so that include lists can be narrowed.
+
+Only callable variants (functions, methods, callable instances) can be
+counted.  Variants which are classes, modules or plain values are left
+unwrapped and reported as untracked.
+"""
+import functools, inspect, types
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+
+from .doubles import PatchingDoubler
+
+# applied, unused and untracked are sorted lists of double names.
+ScopeUsage = namedtuple('ScopeUsage', 'applied unused untracked')
+
+def _countable(variant):
+    return (callable(variant)
+            and not inspect.isclass(variant)
+            and not isinstance(variant, types.ModuleType))
+
+def _counting(variant, counter):
+    def counted(*args, **kwargs):
+        counter[0] += 1
+        return variant(*args, **kwargs)
+    try:
+        return functools.wraps(variant)(counted)
+    except AttributeError: # python 2 and callables without a __name__
+        return counted
+
+class UsageTracker(object):
+    """
+    Counts calls to the variants of manager's PatchingDoublers.
+
+    Call start once the doubles are registered, then wrap each test in
+    scope(label)::
+
+        tracker = usage.UsageTracker(manager)
+        tracker.start()
+        ...
+        with tracker.scope('tests.test_orders.OrderTests.test_total'):
+            run the test
+        ...
+        print(tracker.format_report(key=usage.module_of))
+    """
+    def __init__(self, manager):
+        self.manager = manager
+        self._counters = {}
+        self._untracked = set()
+        self._tracked = []
+        self._scopes = OrderedDict()
+        self._current = None
+
+    def start(self):
+        for double in self.manager.registry.values():
+            if isinstance(double, PatchingDoubler) and self._wrap not in double.variant_wrappers:
+                double.variant_wrappers.append(self._wrap)
+                self._tracked.append(double)
+
+    def stop(self):
+        """
+        Stops wrapping variants.  Doubles which are still applied keep
+        counting until they're unapplied.
+        """
+        for double in self._tracked:
+            double.variant_wrappers.remove(self._wrap)
+        self._tracked = []
+
+    def _wrap(self, double, variant):
+        if self._current is not None:
+            starts = self._current[1]
+            starts.setdefault(double.name, self.hits(double.name))
+
+        if not _countable(variant):
+            self._untracked.add(double.name)
+            return variant
+        self._untracked.discard(double.name)
+        counter = self._counters.setdefault(double.name, [0])
+        return _counting(variant, counter)
+
+    def hits(self, name):
+        """
+        Returns the number of calls made to the named double's variant.
+        """
+        return self._counters.get(name, (0,))[0]
+
+    def begin(self, label):
+        if self._current is not None:
+            raise ValueError("Scope {0} has not ended.".format(self._current[0]))
+        starts = dict((name, self.hits(name)) for name in self.manager.applied)
+        self._current = (label, starts)
+
+    def end(self):
+        label, starts = self._current
+        self._current = None
+        applied, used = self._scopes.setdefault(label, (set(), set()))
+        for name, start in starts.items():
+            applied.add(name)
+            if self.hits(name) > start:
+                used.add(name)
+
+    @contextmanager
+    def scope(self, label):
+        self.begin(label)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def report(self, key=None):
+        """
+        Returns an OrderedDict mapping each scope label (or key(label),
+        to group scopes, e.g. by module) to a ScopeUsage.
+
+        A double is unused in a group if it was applied in any of the
+        group's scopes and called in none of them.
+        """
+        groups = OrderedDict()
+        for label, (applied, used) in self._scopes.items():
+            group = label if key is None else key(label)
+            group_applied, group_used = groups.setdefault(group, (set(), set()))
+            group_applied.update(applied)
+            group_used.update(used)
+
+        report = OrderedDict()
+        for group, (applied, used) in groups.items():
+            untracked = set(name for name in applied
+                            if name in self._untracked or name not in self._counters)
+            report[group] = ScopeUsage(
+                sorted(applied), sorted(applied - used - untracked), sorted(untracked))
+        return report
+
+    def unused(self):
+        """
+        Returns the names of doubles applied in some scope but never
+        called during the run.
+        """
+        return self.report(key=lambda label: None).get(None, ScopeUsage([], [], [])).unused
+
+    def format_report(self, key=None):
+        lines = []
+        for group, usage in self.report(key).items():
+            if not usage.unused:
+                continue
+            lines.append("{0}: {1} of {2} applied double(s) unused: {3}".format(
+                group, len(usage.unused), len(usage.applied), ", ".join(usage.unused)))
+        return "\n".join(lines)
+
+def module_of(label):
+    """
+    Groups dotted test labels such as 'pkg.test_mod.Case.test_x' (or
+    pytest node ids such as 'pkg/test_mod.py::Case::test_x') by module.
+    """
+    if '::' in label:
+        return label.split('::', 1)[0]
+    parts = label.split('.')
+    return '.'.join(parts[:-2]) if len(parts) > 2 else parts[0]
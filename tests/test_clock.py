@@ -0,0 +1,124 @@
+from __future__ import absolute_import
+
+import sys, time, unittest
+from time import sleep as aliased_sleep
+from timeit import default_timer
+
+from duplo import doubles
+from duplo.clock import ClockDoubler, VirtualClock
+
+class VirtualClockTests(unittest.TestCase):
+    def test_only_moves_when_advanced(self):
+        clock = VirtualClock(start=1000.0)
+        self.assertEqual(clock.time(), 1000.0)
+        clock.sleep(5)
+        clock.advance(2.5)
+        self.assertEqual(clock.time(), 1007.5)
+        self.assertEqual(clock.time_ns(), 1007500000000)
+
+    def test_rejects_going_backwards(self):
+        clock = VirtualClock()
+        with self.assertRaises(ValueError):
+            clock.advance(-1)
+        with self.assertRaises(ValueError):
+            clock.sleep(-1)
+
+    def test_tick(self):
+        clock = VirtualClock(tick=True)
+        before = clock.monotonic()
+        time.sleep(0.01)
+        self.assertTrue(clock.monotonic() > before)
+
+class ClockDoublerTests(unittest.TestCase):
+    def setUp(self):
+        self.manager = doubles.DoubleManager()
+        self.doubler = ClockDoubler()
+        self.manager.register_double(self.doubler)
+
+    def test_sleeps_collapse(self):
+        with doubles.applied(self.manager, 'clock'):
+            started = time.time()
+            real_started = default_timer()
+            time.sleep(3600)
+            aliased_sleep(60)
+            self.assertEqual(time.time() - started, 3660)
+            self.assertTrue(default_timer() - real_started < 1)
+
+    def test_swaps_aliases(self):
+        module = sys.modules[__name__]
+        real_sleep = aliased_sleep
+        with doubles.applied(self.manager, 'clock'):
+            self.assertEqual(module.aliased_sleep, self.doubler.clock.sleep)
+            self.assertTrue((module, 'aliased_sleep') in self.doubler.patched())
+        self.assertTrue(module.aliased_sleep is real_sleep)
+        self.assertEqual(self.doubler.patched(), [])
+
+    def test_skips_modules(self):
+        import threading
+        real = threading._time
+        with doubles.applied(self.manager, 'clock'):
+            self.assertTrue(threading._time is real)
+
+    def test_advance_by_hand(self):
+        with doubles.applied(self.manager, 'clock'):
+            deadline = time.monotonic() + 30
+            self.assertFalse(time.monotonic() > deadline)
+            self.doubler.clock.advance(31)
+            self.assertTrue(time.monotonic() > deadline)
+
+    def test_keeps_time_between_applications(self):
+        with doubles.applied(self.manager, 'clock'):
+            time.sleep(10)
+            first = time.time()
+        with doubles.applied(self.manager, 'clock'):
+            self.assertEqual(time.time(), first)
+
+    def test_unexpected_unapply(self):
+        with self.assertRaises(doubles.UnexpectedUnapply):
+            self.doubler.unapply()
+
+@unittest.skipIf(sys.version_info < (3, 7), "asyncio.run needs Python 3.7")
+class AsyncioClockTests(unittest.TestCase):
+    def setUp(self):
+        self.manager = doubles.DoubleManager()
+        self.doubler = ClockDoubler()
+        self.manager.register_double(self.doubler)
+
+    def test_sleep_and_timers_collapse(self):
+        import asyncio
+        namespace = {'asyncio': asyncio}
+        exec(
+            "async def main():\n"
+            "    loop = asyncio.get_running_loop()\n"
+            "    started = loop.time()\n"
+            "    await asyncio.sleep(3600)\n"
+            "    try:\n"
+            "        await asyncio.wait_for(asyncio.Event().wait(), 60)\n"
+            "    except asyncio.TimeoutError:\n"
+            "        return loop.time() - started\n",
+            namespace)
+
+        with doubles.applied(self.manager, 'clock'):
+            real_started = default_timer()
+            elapsed = asyncio.run(namespace['main']())
+        # the clock lands on timers give or take float rounding.
+        self.assertTrue(elapsed > 3660 - 1e-6, elapsed)
+        self.assertTrue(default_timer() - real_started < 1)
+
+    def test_sleep_on_other_loops(self):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        try:
+            with doubles.applied(self.manager, 'clock'):
+                started = time.time()
+                loop.run_until_complete(asyncio.sleep(120))
+                self.assertEqual(time.time() - started, 120)
+        finally:
+            loop.close()
+
+    def test_restores_policy(self):
+        import asyncio
+        policy = asyncio.get_event_loop_policy()
+        with doubles.applied(self.manager, 'clock'):
+            self.assertFalse(asyncio.get_event_loop_policy() is policy)
+        self.assertTrue(asyncio.get_event_loop_policy() is policy)
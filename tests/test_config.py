@@ -0,0 +1,95 @@
+from __future__ import absolute_import
+
+from mock import patch
+import json, os, shutil, tempfile, unittest
+
+from duplo import config, doubles
+
+thing = 0
+other_thing = 0
+replacement = 1
+
+INI = """
+[thing]
+variant = {0}:replacement
+targets =
+    {0}:thing
+tags = fast numbers
+
+[other]
+variant = {0}:replacement
+targets = {0}:other_thing
+""".format(__name__)
+
+class ConfigTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.manager = doubles.DoubleManager()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, filename, body):
+        path = os.path.join(self.tmpdir, filename)
+        with open(path, 'w') as fh:
+            fh.write(body)
+        return path
+
+    def load(self, path):
+        return config.load_config(self.manager, path, cache_dir=self.tmpdir)
+
+    def test_ini(self):
+        self.assertEqual(self.load(self.write('doubles.ini', INI)), ['thing', 'other'])
+        self.assertEqual(self.manager.tagged('numbers'), set(['thing']))
+        with doubles.applied(self.manager, tags='fast'):
+            self.assertEqual((thing, other_thing), (1, 0))
+
+    def test_json(self):
+        path = self.write('doubles.json', json.dumps({
+            'thing': {'variant': 1, 'targets': [__name__ + ':thing'], 'tags': ['fast']},
+        }))
+        self.load(path)
+        double = self.manager.registry['thing']
+        self.assertEqual((double.variant, double.targets, double.tags), (1, [__name__ + ':thing'], frozenset(['fast'])))
+
+    def test_built_when_selected(self):
+        self.load(self.write('doubles.ini', INI))
+        self.assertTrue('thing' in self.manager.registry)
+        self.assertEqual(sorted(self.manager.registry.unbuilt()), ['other', 'thing'])
+        with doubles.applied(self.manager, 'thing'):
+            pass
+        self.assertEqual(self.manager.registry.unbuilt(), ['other'])
+        self.assertTrue(isinstance(self.manager.registry['thing'], doubles.PatchingDoubler))
+
+    def test_cached_until_changed(self):
+        path = self.write('doubles.ini', INI)
+        self.assertEqual(config.read_config(path, self.tmpdir)[0].targets, (__name__ + ':thing',))
+        with patch.object(config, 'parse_config') as parse:
+            config.read_config(path, self.tmpdir)
+        self.assertEqual(parse.call_count, 0)
+
+        self.write('doubles.ini', INI.replace('other_thing', 'thing'))
+        os.utime(path, (0, 0))
+        self.assertEqual(config.read_config(path, self.tmpdir)[1].targets, (__name__ + ':thing',))
+
+    def test_cache_is_json_in_user_directory(self):
+        path = self.write('doubles.ini', INI)
+        cache_home = os.path.join(self.tmpdir, 'cache')
+        with patch.dict(os.environ, {'XDG_CACHE_HOME': cache_home, 'LOCALAPPDATA': cache_home}):
+            declarations = config.read_config(path)
+            cache_path = config._cache_path(os.path.abspath(path), None)
+        self.assertEqual(os.path.dirname(cache_path), os.path.join(cache_home, 'duplo'))
+        with open(cache_path) as fh:
+            json.load(fh)
+        self.assertEqual(config.read_config(path, os.path.dirname(cache_path)), declarations)
+
+    def test_unreadable_cache_ignored(self):
+        path = self.write('doubles.ini', INI)
+        with open(config._cache_path(os.path.abspath(path), self.tmpdir), 'wb') as fh:
+            fh.write(b'\x80\x04not json')
+        self.assertEqual(len(config.read_config(path, self.tmpdir)), 2)
+
+    def test_incomplete_declaration(self):
+        path = self.write('doubles.json', json.dumps({'thing': {'variant': 1}}))
+        with self.assertRaises(config.ConfigError):
+            self.load(path)
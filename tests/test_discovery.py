@@ -0,0 +1,91 @@
+from __future__ import absolute_import
+
+from mock import patch
+import json, os, shutil, sys, tempfile, unittest
+
+from duplo import discovery, doubles
+
+thing = 0
+
+FAKES = """
+from duplo.doubles import PatchingDoubler
+
+def make_double():
+    return PatchingDoubler('discovered', 1, '{0}:thing')
+""".format(__name__)
+
+ENTRY_POINTS = """
+[duplo.doubles]
+discovered = duplo_discovered_fakes:make_double [fast, numbers]
+"""
+
+class DiscoveryTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dist_info = dist_info = os.path.join(self.tmpdir, 'duplo_discovered-1.0.dist-info')
+        os.mkdir(dist_info)
+        for path, body in [(os.path.join(dist_info, 'METADATA'),
+                            'Metadata-Version: 2.1\nName: duplo-discovered\nVersion: 1.0\n'),
+                           (os.path.join(dist_info, 'entry_points.txt'), ENTRY_POINTS),
+                           (os.path.join(self.tmpdir, 'duplo_discovered_fakes.py'), FAKES)]:
+            with open(path, 'w') as fh:
+                fh.write(body)
+        sys.path.insert(0, self.tmpdir)
+        # off sys.path, since writing to a directory changes its mtime.
+        self.cache_dir = tempfile.mkdtemp()
+        discovery._found.clear()
+        self.manager = doubles.DoubleManager()
+
+    def tearDown(self):
+        sys.path.remove(self.tmpdir)
+        shutil.rmtree(self.tmpdir)
+        shutil.rmtree(self.cache_dir)
+        sys.modules.pop('duplo_discovered_fakes', None)
+        discovery._found.clear()
+
+    def test_registered_lazily(self):
+        self.assertEqual(self.manager.discover(cache_dir=self.cache_dir), ['discovered'])
+        self.assertEqual(self.manager.tagged('numbers'), set(['discovered']))
+        self.assertFalse('duplo_discovered_fakes' in sys.modules)
+        with doubles.applied(self.manager, tags='fast'):
+            self.assertEqual(thing, 1)
+        self.assertTrue('duplo_discovered_fakes' in sys.modules)
+        self.assertEqual(self.manager.discover(cache_dir=self.cache_dir), [])
+
+    def test_cached(self):
+        found = discovery.advertised(cache_dir=self.cache_dir)
+        self.assertEqual(found, [discovery.Advertised(
+            'discovered', 'duplo_discovered_fakes:make_double', ('fast', 'numbers'))])
+        with patch.object(discovery, '_scan') as scan:
+            self.assertEqual(discovery.advertised(cache_dir=self.cache_dir), found)
+            discovery._found.clear()
+            self.assertEqual(discovery.advertised(cache_dir=self.cache_dir), found)
+        self.assertEqual(scan.call_count, 0)
+
+    def test_metadata_changes_invalidate(self):
+        discovery.advertised(cache_dir=self.cache_dir)
+        # as reinstalling an editable install rewrites its metadata in
+        #  place, perhaps within the mtime's resolution.
+        path = os.path.join(self.dist_info, 'entry_points.txt')
+        stat = os.stat(path)
+        with open(path, 'a') as fh:
+            fh.write('another = duplo_discovered_fakes:make_double\n')
+        os.utime(path, (stat.st_atime, stat.st_mtime))
+        discovery._found.clear()
+        self.assertEqual([a.name for a in discovery.advertised(cache_dir=self.cache_dir)],
+                         ['discovered', 'another'])
+
+    def test_found_before_checking_metadata(self):
+        found = discovery.advertised(cache_dir=self.cache_dir)
+        with patch.object(discovery, '_cache_key') as cache_key:
+            self.assertTrue(discovery.advertised(cache_dir=self.cache_dir) is found)
+        self.assertEqual(cache_key.call_count, 0)
+
+    def test_cached_as_json(self):
+        discovery.advertised(cache_dir=self.cache_dir)
+        with open(discovery._cache_path(discovery.GROUP, self.cache_dir)) as fh:
+            self.assertEqual(json.load(fh)['value'],
+                             [['discovered', 'duplo_discovered_fakes:make_double', ['fast', 'numbers']]])
+
+    def test_unknown_group(self):
+        self.assertEqual(self.manager.discover('duplo.nothing', cache_dir=self.cache_dir), [])
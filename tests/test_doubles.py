@@ -1,7 +1,7 @@
 from __future__ import absolute_import
 
 from mock import patch
-import sys, unittest
+import os, shutil, sys, tempfile, types, unittest
 
 from duplo import doubles
 
@@ -65,6 +65,25 @@ class ContextTests(unittest.TestCase):
     def test_default_value(self):
         self.assertEquals(self.c['a'], 0)
 
+    def test_empty_frames_are_counted(self):
+        self.c.record({})
+        self.assertEquals((self.c.depth, len(self.c.stack)), (2, 1))
+        self.assertEquals(self.c.pop(), {})
+        self.assertRaises(doubles.EmptyContext, self.c.pop)
+
+    def test_max_depth_compacts(self):
+        c = doubles.Context(lambda: 0, max_depth=2)
+        for name in 'abc':
+            c.record({name: 1})
+        c.record({'a': 0})
+        self.assertEquals((c.depth, c.compacted), (3, 2))
+        self.assertEquals(dict(c.stack[0]), {'a': 1, 'b': 1})
+        self.assertEquals([c['a'], c['b'], c['c']], [0, 1, 1])
+        c.pop()
+        c.pop()
+        self.assertRaises(doubles.EmptyContext, c.pop)
+        self.assertEquals([c['a'], c['b'], c['c']], [1, 1, 0])
+
 class ExampleDoubler(doubles.DoublerBase):
     def apply(self):
         pass
@@ -74,6 +93,11 @@ class ExampleDoubler(doubles.DoublerBase):
 class NotDoubler(object):
     name = 'x'
 
+class BareDoubler(doubles.DoublerBase):
+    # doesn't call DoublerBase.__init__.
+    def __init__(self, name):
+        self.name = name
+
 class DoubleManagerTests(unittest.TestCase):
     def setUp(self):
         self.dm = doubles.DoubleManager()
@@ -85,6 +109,10 @@ class DoubleManagerTests(unittest.TestCase):
         with self.assertRaises(doubles.MissingDouble):
             self.dm.register_double(NotDoubler())
 
+    def test_registers_without_base_init(self):
+        self.dm.register_double(BareDoubler('bare'))
+        self.assertEqual(self.dm.select('bare'), ['bare'])
+
     def test_duplicate_registration(self):
         self.dm.register_double(ExampleDoubler('example'))
         with self.assertRaises(doubles.DuplicateRegistration):
@@ -189,6 +217,243 @@ class DoubleManagerTests(unittest.TestCase):
         with self.assertRaises(doubles.UnappliedDouble):
             self.dm.revert()
 
+class SelectionTests(unittest.TestCase):
+    def setUp(self):
+        self.dm = doubles.DoubleManager()
+        self.dm.register_double(ExampleDoubler('billing.invoices', tags=['billing', 'slow']))
+        self.dm.register_double(ExampleDoubler('billing.stripe', tags=['billing', 'network']))
+        self.dm.register_double(ExampleDoubler('mail', tags='network'))
+        self.dm.register_double(ExampleDoubler('clock'))
+
+    def test_tags_are_frozen(self):
+        self.assertEqual(self.dm.registry['mail'].tags, frozenset(['network']))
+        self.assertEqual(self.dm.registry['clock'].tags, frozenset())
+
+    def test_tagged(self):
+        self.assertEqual(self.dm.tagged('network'), set(['billing.stripe', 'mail']))
+        self.assertEqual(self.dm.tagged('nope'), set())
+
+    def test_apply_by_tag(self):
+        self.dm.apply_doubles(tags='billing')
+        self.assertEqual(sorted(self.dm.applied), ['billing.invoices', 'billing.stripe'])
+
+    def test_tags_are_a_union(self):
+        self.dm.apply_doubles(tags=['slow', 'network'])
+        self.assertEqual(sorted(self.dm.applied), ['billing.invoices', 'billing.stripe', 'mail'])
+
+    def test_tags_and_include(self):
+        self.dm.apply_doubles(include='clock', tags='slow')
+        self.assertEqual(sorted(self.dm.applied), ['billing.invoices', 'clock'])
+
+    def test_exclude_tags(self):
+        self.dm.apply_doubles(exclude_tags='network')
+        self.assertEqual(sorted(self.dm.applied), ['billing.invoices', 'clock'])
+
+    def test_tags_with_exclusions(self):
+        self.dm.apply_doubles(tags='billing', exclude_tags='network')
+        self.assertEqual(self.dm.applied, ['billing.invoices'])
+        self.dm.revert()
+        self.dm.apply_doubles(tags='network', exclude='mail')
+        self.assertEqual(self.dm.applied, ['billing.stripe'])
+
+    def test_unknown_tag(self):
+        with self.assertRaises(doubles.MissingDouble):
+            self.dm.apply_doubles(tags='nope')
+
+    def test_glob_patterns(self):
+        self.dm.apply_doubles(include='billing.*')
+        self.assertEqual(sorted(self.dm.applied), ['billing.invoices', 'billing.stripe'])
+        self.dm.revert()
+        self.dm.apply_doubles(exclude=['billing.*', 'cl?ck'])
+        self.assertEqual(self.dm.applied, ['mail'])
+
+    def test_unmatched_glob(self):
+        with self.assertRaises(doubles.MissingDouble):
+            self.dm.apply_doubles(include='nope*')
+
+    def test_glob_sees_new_registrations(self):
+        self.assertEqual(self.dm._conform_double_names('m*'), ['mail'])
+        self.dm.register_double(ExampleDoubler('mailing_list'))
+        self.assertEqual(sorted(self.dm._conform_double_names('m*')), ['mail', 'mailing_list'])
+
+    def test_tag_selection_does_not_scan_registry(self):
+        for i in range(1000):
+            self.dm.register_double(ExampleDoubler('filler{0}'.format(i)))
+        with patch.object(self.dm, 'registry', {}):
+            self.assertEqual(self.dm._resolve_included(None, None, 'billing'),
+                             set(['billing.invoices', 'billing.stripe']))
+
+    def test_plan_with_tags(self):
+        with doubles.applied(self.dm, tags='network'):
+            self.assertEqual(sorted(self.dm.applied), ['billing.stripe', 'mail'])
+        self.assertEqual(self.dm.applied, [])
+
+    def test_plan_sees_new_registrations(self):
+        plan = doubles.applied(self.dm, tags='slow')
+        self.dm.register_double(ExampleDoubler('render', tags='slow'))
+        with plan:
+            self.assertEqual(sorted(self.dm.applied), ['billing.invoices', 'render'])
+
+class RegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.root = doubles.Registry()
+        self.root['a'] = 1
+        self.middle = doubles.Registry(self.root)
+        self.middle['b'] = 2
+        self.leaf = doubles.Registry(self.middle)
+        self.leaf['c'] = 3
+
+    def test_chained_lookup(self):
+        self.assertEqual([self.leaf['a'], self.leaf['b'], self.leaf['c']], [1, 2, 3])
+        with self.assertRaises(KeyError):
+            self.middle['c']
+        self.assertTrue('a' in self.leaf)
+        self.assertFalse('c' in self.root)
+        self.assertEqual(self.leaf.get('nope', 0), 0)
+
+    def test_keys_span_chain(self):
+        self.assertEqual(sorted(self.leaf.keys()), ['a', 'b', 'c'])
+        self.assertEqual(sorted(self.leaf.items()), [('a', 1), ('b', 2), ('c', 3)])
+        self.assertEqual(len(self.middle), 2)
+
+    def test_inherited_lookups_are_remembered(self):
+        self.leaf['a']
+        self.leaf.parent = None
+        self.assertEqual(self.leaf['a'], 1)
+
+    def test_sees_later_parent_registrations(self):
+        self.root['d'] = 4
+        self.assertEqual(self.leaf['d'], 4)
+
+    def test_spec_tags_reach_built_double(self):
+        spec = doubles.DoubleSpec('e', lambda: ExampleDoubler('e', tags='slow'), tags='network')
+        self.assertEqual(spec.tags, frozenset(['network']))
+        self.leaf['e'] = spec
+        self.assertEqual(self.leaf['e'].tags, frozenset(['network', 'slow']))
+
+class ChildManagerTests(unittest.TestCase):
+    def setUp(self):
+        self.parent = doubles.DoubleManager()
+        self.parent.register_double(ExampleDoubler('shared', tags='network'))
+        self.child = self.parent.child()
+        self.child.register_double(ExampleDoubler('own', tags='network'))
+
+    def test_child_sees_parent_doubles(self):
+        self.assertTrue(self.child.registry['shared'] is self.parent.registry['shared'])
+        self.assertFalse('own' in self.parent.registry)
+
+    def test_no_shadowing(self):
+        with self.assertRaises(doubles.DuplicateRegistration):
+            self.child.register_double(ExampleDoubler('shared'))
+
+    def test_shared_application_state(self):
+        self.parent.apply_doubles(['shared'])
+        self.assertTrue(self.child.is_applied('shared'))
+        self.assertEqual(self.child.apply_doubles(['shared', 'own']), ['own'])
+        self.assertEqual(self.parent.applied, ['shared'])
+        self.assertEqual(sorted(self.child.applied), ['own', 'shared'])
+
+        # the stack is shared, so the parent can revert the child's frame.
+        self.parent.revert()
+        self.assertFalse(self.child.is_applied('own'))
+        self.assertTrue(self.child.is_applied('shared'))
+        self.child.revert()
+        self.assertEqual(self.child.applied, [])
+
+    def test_siblings_with_same_names(self):
+        sibling = self.parent.child()
+        sibling.register_double(ExampleDoubler('own'))
+        self.child.apply_doubles(['own'])
+        self.assertFalse(sibling.is_applied('own'))
+        self.assertEqual(sibling.applied, [])
+
+    def test_tags_span_chain(self):
+        self.assertEqual(self.child.tagged('network'), set(['own', 'shared']))
+        self.assertEqual(self.parent.tagged('network'), set(['shared']))
+        self.child.apply_doubles(tags='network')
+        self.assertEqual(sorted(self.child.applied), ['own', 'shared'])
+
+    def test_patterns_see_parent_registrations(self):
+        self.assertEqual(self.child._conform_double_names('s*'), ['shared'])
+        self.parent.register_double(ExampleDoubler('second'))
+        self.assertEqual(sorted(self.child._conform_double_names('s*')), ['second', 'shared'])
+
+    def test_deep_chain(self):
+        manager = self.child
+        for i in range(50):
+            manager = manager.child()
+        with doubles.applied(manager, ['own', 'shared']):
+            self.assertEqual(sorted(self.parent.applied), ['shared'])
+            self.assertEqual(sorted(self.child.applied), ['own', 'shared'])
+        self.assertEqual(self.child.applied, [])
+
+class SubscriptionTests(unittest.TestCase):
+    def setUp(self):
+        self.dm = doubles.DoubleManager()
+        self.dm.register_double(ExampleDoubler('example'))
+        self.dm.register_double(doubles.PatchingDoubler(
+            'opd', 1, [__name__ + ':thing_to_patch', 'other.module:thing']))
+        self.events = []
+
+    def test_apply_unapply_revert_events(self):
+        self.dm.subscribe(self.events.append)
+        self.dm.apply_doubles(['example'])
+        self.dm.unapply_doubles(['example'])
+        self.dm.revert()
+        self.assertEqual(self.events, [
+            doubles.DoubleEvent('apply', 'example', (), True),
+            doubles.DoubleEvent('unapply', 'example', (), False),
+            doubles.DoubleEvent('revert', 'example', (), True),
+        ])
+
+    def test_only_changes_are_reported(self):
+        self.dm.apply_doubles(['example'])
+        self.dm.subscribe(self.events.append)
+        self.dm.apply_doubles(['example'])
+        self.dm.revert()
+        self.assertEqual(self.events, [])
+
+    def test_filter_by_action(self):
+        self.dm.subscribe(self.events.append, actions='revert')
+        self.dm.apply_doubles(['example'])
+        self.dm.revert()
+        self.assertEqual([e.action for e in self.events], ['revert'])
+
+    def test_filter_by_target(self):
+        by_target, by_module, unrelated = [], [], []
+        self.dm.subscribe(by_target.append, targets=[__name__ + ':thing_to_patch'])
+        self.dm.subscribe(by_module.append, targets='other.module')
+        self.dm.subscribe(unrelated.append, targets='unrelated')
+        with patch.object(doubles.PatchingDoubler, 'apply'):
+            self.dm.apply_doubles()
+        self.assertEqual([e.name for e in by_target], ['opd'])
+        self.assertEqual(by_target[0].targets, (__name__ + ':thing_to_patch', 'other.module:thing'))
+        self.assertEqual([e.name for e in by_module], ['opd'])
+        self.assertEqual(unrelated, [])
+
+    def test_unsubscribe(self):
+        self.dm.subscribe(self.events.append)
+        self.dm.unsubscribe(self.events.append)
+        self.dm.apply_doubles(['example'])
+        self.assertEqual(self.events, [])
+
+    def test_children_notify_parent_subscribers(self):
+        child = self.dm.child()
+        child.register_double(ExampleDoubler('own'))
+        child_events = []
+        child.subscribe(child_events.append)
+        self.dm.subscribe(self.events.append)
+        child.apply_doubles(['own'])
+        self.dm.apply_doubles(['example'])
+        self.assertEqual([e.name for e in self.events], ['own', 'example'])
+        self.assertEqual([e.name for e in child_events], ['own'])
+
+    def test_no_dispatch_without_subscribers(self):
+        with patch.object(self.dm, '_notify') as notify:
+            self.dm.apply_doubles(['example'])
+            self.dm.revert()
+        self.assertEqual(notify.call_count, 0)
+
 class ContextBasedTests(unittest.TestCase):
     def setUp(self):
         self.dm = doubles.DoubleManager()
@@ -231,6 +496,125 @@ class ContextBasedTests(unittest.TestCase):
         self.assertFalse(self.dm.is_applied('example'))
         self.assertFalse(self.dm.is_applied('example2'))
 
+    def test_reverts_on_error(self):
+        with self.assertRaises(KeyError):
+            with doubles.applied(self.dm, 'example'):
+                raise KeyError
+        self.assertFalse(self.dm.is_applied('example'))
+        self.assertEqual(self.dm._applieds.depth, 1)
+
+class DecoratorTests(unittest.TestCase):
+    def setUp(self):
+        self.dm = doubles.DoubleManager()
+        self.dm.register_double(ExampleDoubler('example'))
+        self.dm.register_double(ExampleDoubler('example2'))
+
+    def test_function(self):
+        @doubles.applied(self.dm, 'example')
+        def check(arg):
+            return arg, self.dm.is_applied('example')
+
+        self.assertEqual(check.__name__, 'check')
+        self.assertEqual(check(1), (1, True))
+        self.assertFalse(self.dm.is_applied('example'))
+
+    def test_nested_decorators(self):
+        @doubles.applied(self.dm, ['example', 'example2'])
+        @doubles.unapplied(self.dm, 'example2')
+        def check():
+            return sorted(self.dm.applied)
+
+        self.assertEqual(check(), ['example'])
+        self.assertEqual(self.dm.applied, [])
+
+    def test_generator_function(self):
+        @doubles.applied(self.dm, 'example')
+        def check():
+            yield self.dm.is_applied('example')
+            received = yield
+            yield received
+
+        gen = check()
+        self.assertFalse(self.dm.is_applied('example'))
+        self.assertEqual(next(gen), True)
+        next(gen)
+        self.assertEqual(gen.send('sent'), 'sent')
+        self.assertTrue(self.dm.is_applied('example'))
+        self.assertEqual(list(gen), [])
+        self.assertFalse(self.dm.is_applied('example'))
+
+    def test_coroutine_function(self):
+        try:
+            import asyncio
+        except ImportError:
+            return
+        namespace = {}
+        exec("async def check(dm):\n    return dm.is_applied('example')", namespace)
+        check = doubles.applied(self.dm, 'example')(namespace['check'])
+        self.assertTrue(asyncio.iscoroutinefunction(check))
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertTrue(loop.run_until_complete(check(self.dm)))
+        finally:
+            loop.close()
+        self.assertFalse(self.dm.is_applied('example'))
+
+    def test_testcase_class(self):
+        dm = self.dm
+        seen = []
+
+        @doubles.applied(dm, 'example')
+        class Decorated(unittest.TestCase):
+            def test_applied(self):
+                seen.append(dm.is_applied('example'))
+
+            def helper(self):
+                seen.append(dm.is_applied('example'))
+
+        Decorated('test_applied').test_applied()
+        Decorated('test_applied').helper()
+        self.assertEqual(seen, [True, False])
+
+    def test_testcase_subclass(self):
+        dm, depths = self.dm, []
+
+        @doubles.applied(dm, 'example')
+        class Decorated(unittest.TestCase):
+            def test_depth(self):
+                depths.append(dm.depth)
+
+        @doubles.unapplied(dm, 'example')
+        class Subclass(Decorated):
+            @staticmethod
+            def test_static():
+                return 'static'
+
+        Subclass('test_depth').test_depth()
+        self.assertEqual(depths, [2])
+        self.assertEqual(Subclass.test_static(), 'static')
+        self.assertEqual(Subclass('test_static').test_static(), 'static')
+
+    def test_names_resolved_once(self):
+        plan = doubles.applied(self.dm, 'example')
+        with patch.object(self.dm, '_resolve_included') as resolve:
+            with plan:
+                pass
+            with plan:
+                pass
+        self.assertEqual(resolve.call_count, 0)
+
+    def test_late_registration(self):
+        plan = doubles.applied(self.dm, 'late')
+        self.dm.register_double(ExampleDoubler('late'))
+        with plan:
+            self.assertTrue(self.dm.is_applied('late'))
+
+    def test_missing_double(self):
+        plan = doubles.applied(self.dm, 'nope')
+        with self.assertRaises(doubles.MissingDouble):
+            with plan:
+                pass
+
 thing_to_patch = 0
 variant_value = object()
 
@@ -311,5 +695,444 @@ class PatchingDoublerTests(unittest.TestCase):
         self.lazy_pd.unapply()
         self.assertEquals(thing_to_patch, 0)
 
+class ResolutionCacheTests(unittest.TestCase):
+    def setUp(self):
+        global thing_to_patch
+        thing_to_patch = 0
+
+    def test_targets_resolved_once(self):
+        opd = ObjectPatchingDoubler('opd')
+        with patch.object(opd, '_build_resolution', wraps=opd._build_resolution) as build:
+            opd.apply()
+            opd.unapply()
+            opd.apply()
+            opd.unapply()
+        self.assertEqual(build.call_count, 1)
+
+    def test_variant_resolved_once(self):
+        lazy_pd = LazyVariantPatchingDoubler('lazy_pd')
+        lazy_pd.resolve()
+        with patch('importlib.import_module') as import_module:
+            lazy_pd.apply()
+            self.assertEqual(thing_to_patch, variant_value)
+            lazy_pd.unapply()
+        self.assertEqual(import_module.call_count, 0)
+
+    def test_module_target_follows_sys_modules(self):
+        mpd = ModulePatchingDoubler('mpd')
+        mpd.apply()
+        mpd.unapply()
+        sys.modules['a_fictitous_module'] = 2
+        try:
+            mpd.apply()
+            self.assertEqual(mpd.normals, [2])
+            mpd.unapply()
+            self.assertEqual(sys.modules['a_fictitous_module'], 2)
+        finally:
+            del sys.modules['a_fictitous_module']
+
+    def test_unimportable_variant_retried(self):
+        global variant_later
+        pd = doubles.PatchingDoubler('later', __name__ + ':variant_later', __name__ + ':thing_to_patch')
+        pd.resolve()
+        variant_later = 3
+        try:
+            pd.apply()
+            self.assertEqual(thing_to_patch, 3)
+            pd.unapply()
+        finally:
+            del variant_later
+
+    def test_literal_variant_cached(self):
+        pd = doubles.PatchingDoubler('literal', 'not a module: a literal', __name__ + ':thing_to_patch')
+        pd.resolve()
+        with patch('importlib.import_module') as import_module:
+            pd.apply()
+            self.assertEqual(thing_to_patch, 'not a module: a literal')
+            pd.unapply()
+        self.assertEqual(import_module.call_count, 0)
+
+    def test_attribute_target_follows_sys_modules(self):
+        pd = doubles.PatchingDoubler('swapped', 1, 'duplo_swapped_module:thing')
+        sys.modules['duplo_swapped_module'] = first = types.ModuleType('duplo_swapped_module')
+        first.thing = 0
+        try:
+            pd.apply()
+            pd.unapply()
+            sys.modules['duplo_swapped_module'] = second = types.ModuleType('duplo_swapped_module')
+            second.thing = 0
+            pd.apply()
+            self.assertEqual((first.thing, second.thing), (0, 1))
+            pd.unapply()
+            self.assertEqual(second.thing, 0)
+        finally:
+            del sys.modules['duplo_swapped_module']
+
+    def test_module_names(self):
+        lazy_pd = LazyVariantPatchingDoubler('lazy_pd')
+        self.assertEqual(lazy_pd.module_names(), [(__name__, 'target'), (__name__, 'variant')])
+        self.assertEqual(ModulePatchingDoubler('mpd').module_names(),
+                         [('a_fictitous_module', 'target')])
+
+other_thing_to_patch = 0
+
+class PartialApplicationTests(unittest.TestCase):
+    def setUp(self):
+        global thing_to_patch, other_thing_to_patch
+        thing_to_patch = other_thing_to_patch = 0
+        self.first = __name__ + ':thing_to_patch'
+        self.second = __name__ + ':other_thing_to_patch'
+        self.pd = doubles.PatchingDoubler('pd', 1, [self.first, self.second])
+
+    def test_originals_per_target(self):
+        self.pd.apply()
+        self.assertEqual(self.pd.originals, {self.first: 0, self.second: 0})
+        self.pd.unapply([self.second])
+        self.assertEqual((thing_to_patch, other_thing_to_patch), (1, 0))
+        self.assertEqual(self.pd.normals, [0])
+        self.pd.unapply()
+        self.assertEqual((thing_to_patch, other_thing_to_patch), (0, 0))
+
+    def test_apply_subset(self):
+        self.pd.apply(self.second)
+        self.assertEqual((thing_to_patch, other_thing_to_patch), (0, 1))
+        self.pd.apply()
+        self.assertEqual((thing_to_patch, other_thing_to_patch), (1, 1))
+        self.pd.unapply()
+        self.assertEqual((thing_to_patch, other_thing_to_patch), (0, 0))
+
+    def test_repeated_apply_is_idempotent(self):
+        self.pd.apply()
+        self.pd.apply()
+        self.assertEqual(self.pd.normals, [0, 0])
+        self.pd.unapply()
+        self.assertEqual((thing_to_patch, other_thing_to_patch), (0, 0))
+        self.pd.unapply([self.first])
+
+    def test_repatches_rebound_target(self):
+        global other_thing_to_patch
+        self.pd.apply()
+        other_thing_to_patch = 0 # e.g. a late `from x import y`
+        with patch.object(self.pd, '_build_resolution') as build:
+            self.pd.apply([self.second])
+        self.assertEqual(build.call_count, 0)
+        self.assertEqual(other_thing_to_patch, 1)
+        self.pd.unapply()
+        self.assertEqual(other_thing_to_patch, 0)
+
+    def test_variant_wrapped_once_per_application(self):
+        wrapped = []
+        self.pd.variant_wrappers.append(lambda double, variant: wrapped.append(variant) or variant)
+        self.pd.apply([self.first])
+        self.pd.apply([self.second])
+        self.assertEqual(wrapped, [1])
+
+    def test_unknown_target(self):
+        with self.assertRaises(doubles.MissingPatchTarget):
+            self.pd.apply(['nope:nothing'])
+
+class BoundedStackTests(unittest.TestCase):
+    def setUp(self):
+        global thing_to_patch
+        thing_to_patch = 0
+        self.dm = doubles.DoubleManager(max_depth=2)
+        self.dm.register_double(ExampleDoubler('example'))
+        self.dm.register_double(doubles.PatchingDoubler('pd', 1, __name__ + ':thing_to_patch'))
+
+    def test_noop_not_stored(self):
+        self.dm.apply_doubles(['example'])
+        self.dm.apply_doubles(['example'])
+        report = self.dm.memory_report()
+        self.assertEqual((report.frames, report.empty_frames, report.entries), (2, 1, 1))
+        self.dm.revert()
+        self.assertTrue(self.dm.is_applied('example'))
+        self.dm.revert()
+        self.assertFalse(self.dm.is_applied('example'))
+
+    def test_bounded_without_revert(self):
+        for i in range(50):
+            self.dm.apply_doubles(['example'])
+            self.dm.unapply_doubles(['example'])
+        report = self.dm.memory_report()
+        self.assertEqual((report.frames, report.compacted, report.entries), (3, 98, 2))
+        self.dm.revert()
+        self.dm.revert()
+        with self.assertRaises(doubles.UnappliedDouble):
+            self.dm.revert()
+
+    def test_reports_originals(self):
+        self.dm.apply_doubles(['pd'])
+        self.assertEqual(self.dm.memory_report().originals,
+                         [('pd', __name__ + ':thing_to_patch', 0)])
+        self.dm.revert()
+        self.assertEqual(self.dm.memory_report().originals, [])
+
+class CountingDoubler(doubles.DoublerBase):
+    def __init__(self, name, **kwargs):
+        super(CountingDoubler, self).__init__(name, **kwargs)
+        self.calls = []
+    def apply(self):
+        self.calls.append('apply')
+    def unapply(self):
+        self.calls.append('unapply')
+
+class RefcountTests(unittest.TestCase):
+    def setUp(self):
+        self.dm = doubles.DoubleManager(refcount=True)
+        self.double = CountingDoubler('counted')
+        self.dm.register_double(self.double)
+
+    def test_only_transitions_patch(self):
+        with doubles.applied(self.dm, 'counted'):
+            with doubles.applied(self.dm, 'counted'):
+                self.assertEqual(self.dm.application_count('counted'), 2)
+            self.assertTrue(self.dm.is_applied('counted'))
+            self.assertEqual(self.dm.application_count('counted'), 1)
+        self.assertFalse(self.dm.is_applied('counted'))
+        self.assertEqual(self.double.calls, ['apply', 'unapply'])
+
+    def test_unapply_overrides_count(self):
+        self.dm.apply_doubles(['counted'])
+        self.dm.apply_doubles(['counted'])
+        with doubles.unapplied(self.dm, 'counted'):
+            self.assertFalse(self.dm.is_applied('counted'))
+        self.assertEqual(self.dm.application_count('counted'), 2)
+        self.dm.revert()
+        self.dm.revert()
+        self.assertEqual(self.double.calls, ['apply', 'unapply', 'apply', 'unapply'])
+
+    def test_events_on_transitions(self):
+        events = []
+        self.dm.subscribe(lambda event: events.append((event.action, event.applied)))
+        self.dm.child().apply_doubles(['counted'])
+        self.dm.apply_doubles(['counted'])
+        self.dm.revert()
+        self.dm.revert()
+        self.assertEqual(events, [('apply', True), ('revert', False)])
+
+class Base(object):
+    def greet(self):
+        return 'base'
+
+class Greeter(Base):
+    @staticmethod
+    def shout():
+        return 'HI'
+
+class Registry(object):
+    pass
+
+registry = Registry()
+registry.client = Greeter()
+
+class AttributePathTests(unittest.TestCase):
+    def test_static_method(self):
+        pd = doubles.PatchingDoubler('pd', lambda: 'fake', __name__ + ':Greeter.shout')
+        pd.apply()
+        self.assertEqual(Greeter.shout(), 'fake')
+        pd.unapply()
+        self.assertTrue(isinstance(vars(Greeter)['shout'], staticmethod))
+        self.assertEqual(Greeter().shout(), 'HI')
+
+    def test_inherited_attribute_deleted(self):
+        pd = doubles.PatchingDoubler('pd', lambda self: 'fake', __name__ + ':Greeter.greet')
+        pd.apply()
+        self.assertEqual(Greeter().greet(), 'fake')
+        self.assertEqual(Base().greet(), 'base')
+        pd.unapply()
+        self.assertFalse('greet' in vars(Greeter))
+
+    def test_nested_instance(self):
+        fake = object()
+        pd = doubles.PatchingDoubler('pd', fake, __name__ + ':registry.client')
+        client = registry.client
+        pd.apply()
+        self.assertTrue(registry.client is fake)
+        self.assertEqual(pd.normals, [client])
+        pd.unapply()
+        self.assertTrue(registry.client is client)
+
+    def test_dotted_variant(self):
+        pd = doubles.PatchingDoubler('pd', __name__ + ':Greeter.shout', __name__ + ':registry.client')
+        client = registry.client
+        pd.apply()
+        self.assertEqual(registry.client(), 'HI')
+        pd.unapply()
+        self.assertTrue(registry.client is client)
+
+    def test_names_failing_link(self):
+        pd = doubles.PatchingDoubler('pd', 1, __name__ + ':registry.server.port')
+        with self.assertRaises(doubles.MissingPatchTarget) as raised:
+            pd.apply()
+        self.assertEqual(str(raised.exception),
+                         "Unable to find {0}:registry.server: {0}:registry has no attribute 'server'".format(__name__))
+
+class DependencyTests(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.dm = doubles.DoubleManager()
+        for name, requires, conflicts in [('db', (), ()), ('cache', 'db', ()),
+                                          ('app', ['cache', 'db'], ()),
+                                          ('stripe', (), 'paypal'), ('paypal', (), ())]:
+            double = CountingDoubler(name, requires=requires, conflicts=conflicts)
+            double.calls = self.calls
+            self.dm.register_double(double)
+
+    def test_requires_expanded_in_order(self):
+        self.dm.apply_doubles(['app'])
+        self.assertEqual(sorted(self.dm.applied), ['app', 'cache', 'db'])
+        self.dm.revert()
+        self.assertEqual(self.dm.applied, [])
+        self.assertEqual(len(self.calls), 6)
+        self.assertEqual([double.name for double in self.dm._resolve_doubles(['app'])],
+                         ['db', 'cache', 'app'])
+
+    def test_reverse_order_for_unapply_and_revert(self):
+        order = []
+        for name in ['db', 'cache', 'app']:
+            double = self.dm.registry[name]
+            double.apply = lambda name=name: order.append(('apply', name))
+            double.unapply = lambda name=name: order.append(('unapply', name))
+        with doubles.applied(self.dm, 'app'):
+            self.dm.unapply_doubles(['app', 'cache', 'db'])
+            self.dm.revert()
+        self.assertEqual(order, [('apply', 'db'), ('apply', 'cache'), ('apply', 'app')] +
+                                [('unapply', 'app'), ('unapply', 'cache'), ('unapply', 'db')] +
+                                [('apply', 'db'), ('apply', 'cache'), ('apply', 'app')] +
+                                [('unapply', 'app'), ('unapply', 'cache'), ('unapply', 'db')])
+
+    def test_conflicts_rejected_up_front(self):
+        with self.assertRaises(doubles.ConflictingDoubles):
+            self.dm.apply_doubles(['db', 'stripe', 'paypal'])
+        self.assertEqual(self.calls, [])
+        with doubles.applied(self.dm, 'paypal'):
+            with self.assertRaises(doubles.ConflictingDoubles):
+                self.dm.apply_doubles(['stripe'])
+        self.assertEqual(self.dm._applieds.depth, 1)
+
+    def test_unapply_takes_dependents(self):
+        with doubles.applied(self.dm, 'app'):
+            self.dm.unapply_doubles(['db'])
+            self.assertEqual(self.dm.applied, [])
+            self.assertEqual(self.dm.select('db', action='unapply'), ['app', 'cache', 'db'])
+            self.dm.revert()
+            self.assertEqual(sorted(self.dm.applied), ['app', 'cache', 'db'])
+
+    def test_select(self):
+        self.assertEqual(self.dm.select('app'), ['db', 'cache', 'app'])
+        self.assertEqual(self.dm.select(exclude=['paypal', 'stripe'], action='unapply'), ['app', 'cache', 'db'])
+        self.assertEqual(self.dm.applied, [])
+        with self.assertRaises(ValueError):
+            self.dm.select('app', action='revert')
+        plan = doubles.unapplied(self.dm, 'cache')
+        self.assertEqual(plan.selected, ['app', 'cache'])
+        self.dm.register_double(CountingDoubler('page', requires='cache'))
+        self.assertEqual(plan.selected, ['page', 'app', 'cache'])
+
+    def test_spec_declares_up_front(self):
+        built = []
+        def build():
+            built.append('mail')
+            return CountingDoubler('mail')
+        self.dm.register_double(doubles.DoubleSpec('mail', build, requires='db', conflicts='paypal'))
+        with doubles.applied(self.dm, 'paypal'):
+            with self.assertRaises(doubles.ConflictingDoubles):
+                self.dm.apply_doubles(['mail'])
+        with doubles.applied(self.dm, 'db'):
+            self.dm.unapply_doubles(['db'])
+        self.assertEqual(built, ['mail'])
+        mail = self.dm.registry['mail']
+        self.assertEqual((mail.requires, mail.conflicts), (frozenset(['db']), frozenset(['paypal'])))
+
+    def test_conflict_check_builds_nothing(self):
+        built = []
+        def build():
+            built.append('lazy')
+            return CountingDoubler('lazy')
+        self.dm.register_double(doubles.DoubleSpec('lazy', build))
+        self.dm.register_double(CountingDoubler('eager', conflicts='lazy'))
+        with doubles.applied(self.dm, 'eager'):
+            self.assertFalse(self.dm.is_applied('lazy'))
+        self.assertEqual(built, [])
+
+    def test_missing_requirement(self):
+        self.dm.register_double(doubles.PatchingDoubler('orphan', 1, __name__ + ':thing_to_patch', requires='nope'))
+        with self.assertRaises(doubles.MissingDouble):
+            self.dm.apply_doubles(['orphan'])
+
+    def test_order_cached_per_selection(self):
+        first = self.dm._resolve_doubles(set(['app']))
+        self.assertTrue(self.dm._resolve_doubles(set(['app'])) is first)
+        self.dm.register_double(ExampleDoubler('later'))
+        self.assertFalse(self.dm._resolve_doubles(set(['app'])) is first)
+
+    def test_caches_bounded(self):
+        self.dm._order_cache.maxsize = self.dm._pattern_cache.maxsize = 2
+        first = self.dm._resolve_doubles(set(['app']))
+        for names in [['db'], ['cache'], ['d*'], ['c*'], ['p*']]:
+            self.dm.select(names)
+        self.assertEqual((len(self.dm._order_cache), len(self.dm._pattern_cache)), (2, 2))
+        self.assertFalse(self.dm._resolve_doubles(set(['app'])) is first)
+        self.dm.register_double(ExampleDoubler('later'))
+        self.dm.select('db')
+        self.assertEqual((len(self.dm._order_cache), len(self.dm._pattern_cache)), (1, 0))
+
+class PrefetchTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name, body in [('duplo_prefetch_target', 'thing = 1\n'),
+                           ('duplo_prefetch_variant', 'fake = 2\n'),
+                           ('duplo_prefetch_broken', 'raise RuntimeError("nope")\n')]:
+            with open(os.path.join(self.tmpdir, name + '.py'), 'w') as fh:
+                fh.write(body)
+        sys.path.insert(0, self.tmpdir)
+
+        self.dm = doubles.DoubleManager()
+        self.dm.register_double(doubles.PatchingDoubler(
+            'prefetched', 'duplo_prefetch_variant:fake', 'duplo_prefetch_target:thing'))
+        self.dm.register_double(ExampleDoubler('example'))
+
+    def tearDown(self):
+        sys.path.remove(self.tmpdir)
+        shutil.rmtree(self.tmpdir)
+        for name in ['duplo_prefetch_target', 'duplo_prefetch_variant', 'duplo_prefetch_broken']:
+            sys.modules.pop(name, None)
+
+    def test_imports_and_reports(self):
+        report = self.dm.prefetch()
+        self.assertEqual(sorted(m.module for m in report),
+                         ['duplo_prefetch_target', 'duplo_prefetch_variant'])
+        self.assertTrue('duplo_prefetch_target' in sys.modules)
+        self.assertTrue('duplo_prefetch_variant' in sys.modules)
+        for module_import in report:
+            self.assertFalse(module_import.already_imported)
+            self.assertEqual(module_import.error, None)
+            self.assertEqual(module_import.doubles, ['prefetched'])
+
+    def test_sorted_most_expensive_first(self):
+        report = self.dm.prefetch()
+        self.assertEqual([m.seconds for m in report],
+                         sorted([m.seconds for m in report], reverse=True))
+
+    def test_fills_resolution_cache(self):
+        self.dm.prefetch()
+        double = self.dm.registry['prefetched']
+        self.assertTrue('duplo_prefetch_target:thing' in double._resolutions)
+        self.assertEqual(double._variants['duplo_prefetch_variant:fake'], 2)
+
+    def test_already_imported(self):
+        import duplo_prefetch_target
+        report = dict((m.module, m) for m in self.dm.prefetch())
+        self.assertTrue(report['duplo_prefetch_target'].already_imported)
+        self.assertEqual(report['duplo_prefetch_target'].seconds, 0.0)
+
+    def test_concurrent_with_errors(self):
+        self.dm.register_double(doubles.PatchingDoubler(
+            'broken', 1, 'duplo_prefetch_broken:thing'))
+        report = dict((m.module, m) for m in self.dm.prefetch(concurrency=4))
+        self.assertTrue(isinstance(report['duplo_prefetch_broken'].error, RuntimeError))
+        self.assertEqual(report['duplo_prefetch_target'].error, None)
+        self.assertTrue('duplo_prefetch_variant' in sys.modules)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,149 @@
+from __future__ import absolute_import
+
+from mock import patch
+import glob, io, os, shutil, sys, tempfile, unittest
+
+from duplo import doubles
+from duplo.filesystem import InMemoryFSDoubler, UnsupportedFSOperation
+
+@unittest.skipIf(sys.version_info < (3, 7), "InMemoryFSDoubler needs Python 3.7")
+class InMemoryFSDoublerTests(unittest.TestCase):
+    def setUp(self):
+        self.real_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.real_dir, 'config.ini'), 'w') as fh:
+            fh.write('[main]\nkey = value\n')
+        os.mkdir(os.path.join(self.real_dir, 'sub'))
+        with open(os.path.join(self.real_dir, 'sub', 'data.bin'), 'wb') as fh:
+            fh.write(b'\x00\x01')
+
+        self.manager = doubles.DoubleManager()
+        self.doubler = InMemoryFSDoubler(seeds=[self.real_dir])
+        self.manager.register_double(self.doubler)
+        self.scratch = os.path.join(tempfile.gettempdir(), 'duplo-scratch-{0}'.format(os.getpid()))
+
+    def tearDown(self):
+        shutil.rmtree(self.real_dir)
+        # only there if a write escaped to the disk.
+        shutil.rmtree(self.scratch, ignore_errors=True)
+
+    def test_writes_stay_in_memory(self):
+        path = os.path.join(self.scratch, 'out.txt')
+        with doubles.applied(self.manager, 'filesystem'):
+            os.makedirs(self.scratch)
+            with open(path, 'w') as fh:
+                fh.write(u'hello')
+            with io.open(path, 'a') as fh:
+                fh.write(u' world')
+            self.assertTrue(os.path.isfile(path))
+            self.assertEqual(os.path.getsize(path), 11)
+            with open(path) as fh:
+                self.assertEqual(fh.read(), 'hello world')
+            self.assertEqual(os.listdir(self.scratch), ['out.txt'])
+        self.assertFalse(os.path.exists(self.scratch))
+
+    def test_seeds_are_copy_on_write(self):
+        config = os.path.join(self.real_dir, 'config.ini')
+        with doubles.applied(self.manager, 'filesystem'):
+            self.assertEqual(sorted(os.listdir(self.real_dir)), ['config.ini', 'sub'])
+            with open(config) as fh:
+                self.assertEqual(fh.readline(), '[main]\n')
+            with open(config, 'w') as fh:
+                fh.write('changed')
+            os.remove(os.path.join(self.real_dir, 'sub', 'data.bin'))
+            self.assertEqual(os.listdir(os.path.join(self.real_dir, 'sub')), [])
+        with open(config) as fh:
+            self.assertEqual(fh.read(), '[main]\nkey = value\n')
+        self.assertTrue(os.path.exists(os.path.join(self.real_dir, 'sub', 'data.bin')))
+
+    def test_reset_on_unapply(self):
+        config = os.path.join(self.real_dir, 'config.ini')
+        with doubles.applied(self.manager, 'filesystem'):
+            os.rename(config, os.path.join(self.real_dir, 'moved.ini'))
+            self.assertFalse(os.path.exists(config))
+        with doubles.applied(self.manager, 'filesystem'):
+            self.assertTrue(os.path.exists(config))
+            self.assertFalse(os.path.exists(os.path.join(self.real_dir, 'moved.ini')))
+
+    def test_walk_glob_and_shutil(self):
+        with doubles.applied(self.manager, 'filesystem'):
+            walked = [(os.path.relpath(root, self.real_dir), sorted(dirs), sorted(files))
+                      for root, dirs, files in os.walk(self.real_dir)]
+            self.assertEqual(walked, [('.', ['sub'], ['config.ini']), ('sub', [], ['data.bin'])])
+            self.assertEqual(glob.glob(os.path.join(self.real_dir, '*.ini')),
+                             [os.path.join(self.real_dir, 'config.ini')])
+            copied = os.path.join(self.real_dir, 'copy.ini')
+            shutil.copy2(os.path.join(self.real_dir, 'config.ini'), copied)
+            with open(copied) as fh:
+                self.assertEqual(fh.read(), '[main]\nkey = value\n')
+            shutil.rmtree(os.path.join(self.real_dir, 'sub'))
+            self.assertFalse(os.path.isdir(os.path.join(self.real_dir, 'sub')))
+        self.assertFalse(os.path.exists(os.path.join(self.real_dir, 'copy.ini')))
+        self.assertTrue(os.path.isdir(os.path.join(self.real_dir, 'sub')))
+
+    def test_tempfile(self):
+        with doubles.applied(self.manager, 'filesystem'):
+            with tempfile.NamedTemporaryFile('w+') as fh:
+                fh.write('temporary')
+                fh.flush()
+                fh.seek(0)
+                self.assertEqual(fh.read(), 'temporary')
+                name = fh.name
+            self.assertFalse(os.path.exists(name))
+
+            fd, path = tempfile.mkstemp()
+            os.write(fd, b'raw')
+            os.close(fd)
+            with open(path, 'rb') as fh:
+                self.assertEqual(fh.read(), b'raw')
+
+            with tempfile.TemporaryDirectory() as directory:
+                with open(os.path.join(directory, 'x'), 'w') as fh:
+                    fh.write('x')
+            self.assertFalse(os.path.exists(directory))
+        self.assertFalse(os.path.exists(path))
+
+    def test_pathlib(self):
+        import pathlib
+        with doubles.applied(self.manager, 'filesystem'):
+            base = pathlib.Path(self.scratch)
+            (base / 'a' / 'b').mkdir(parents=True)
+            (base / 'a' / 'b' / 'c.txt').write_text(u'c')
+            (base / 'a' / 'touched').touch()
+            self.assertEqual((base / 'a' / 'b' / 'c.txt').read_text(), u'c')
+            self.assertEqual(sorted(p.name for p in (base / 'a').iterdir()), ['b', 'touched'])
+            self.assertEqual([p.name for p in base.glob('**/*.txt')], ['c.txt'])
+        self.assertFalse(os.path.exists(self.scratch))
+
+    def test_errors(self):
+        with doubles.applied(self.manager, 'filesystem'):
+            with self.assertRaises(IOError) as raised:
+                open(os.path.join(self.scratch, 'missing'))
+            self.assertEqual(raised.exception.errno, 2)
+            with self.assertRaises(OSError):
+                os.rmdir(self.real_dir)
+            with self.assertRaises(UnsupportedFSOperation):
+                os.symlink(self.real_dir, os.path.join(self.real_dir, 'link'))
+
+    def test_unsupported_versions(self):
+        with patch.object(sys, 'version_info', (3, 6, 15)):
+            with self.assertRaises(UnsupportedFSOperation):
+                self.doubler.apply()
+        self.assertFalse(open is self.doubler.fs.open)
+
+    def test_passthrough(self):
+        with doubles.applied(self.manager, 'filesystem'):
+            self.assertTrue(os.path.exists(os.__file__))
+            with open(os.__file__) as fh:
+                self.assertTrue(fh.read(1) is not None)
+
+    def test_imports_while_applied(self):
+        with open(os.path.join(self.real_dir, 'duplo_fs_probe.py'), 'w') as fh:
+            fh.write('VALUE = 1\n')
+        sys.path.insert(0, self.real_dir)
+        try:
+            with doubles.applied(self.manager, 'filesystem'):
+                import duplo_fs_probe
+            self.assertEqual(duplo_fs_probe.VALUE, 1)
+        finally:
+            sys.path.remove(self.real_dir)
+            sys.modules.pop('duplo_fs_probe', None)
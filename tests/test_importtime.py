@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+
+import json, os, shutil, subprocess, sys, tempfile, unittest
+
+from duplo import doubles, importtime
+from duplo.six import StringIO
+from mock import patch
+
+manager = doubles.DoubleManager()
+
+def make_manager():
+    return manager
+
+not_a_manager = object()
+
+class ImportTimeTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name, body in [('duplo_it_slow', 'import time\ntime.sleep(0.2)\nthing = 1\n'),
+                           ('duplo_it_fast', 'thing = 1\n'),
+                           ('duplo_it_noisy', 'print("{not json")\nthing = 1\n'),
+                           ('duplo_it_fake', 'fake = 2\n'),
+                           ('duplo_it_registry',
+                            'from duplo import doubles\n'
+                            'manager = doubles.DoubleManager()\n'
+                            'manager.register_double(doubles.PatchingDoubler('
+                            '"slow", "duplo_it_fake:fake", "duplo_it_slow:thing"))\n'
+                            'manager.register_double(doubles.PatchingDoubler('
+                            '"fast", "duplo_it_fake:fake", ["duplo_it_fast:thing", "duplo_it_missing:thing"]))\n')]:
+            with open(os.path.join(self.tmpdir, name + '.py'), 'w') as fh:
+                fh.write(body)
+        sys.path.insert(0, self.tmpdir)
+
+    def tearDown(self):
+        sys.path.remove(self.tmpdir)
+        shutil.rmtree(self.tmpdir)
+        for name in list(sys.modules):
+            if name.startswith('duplo_it_'):
+                del sys.modules[name]
+
+    def test_load_manager(self):
+        self.assertTrue(importtime.load_manager(__name__ + ':manager') is manager)
+        self.assertTrue(importtime.load_manager(__name__ + ':make_manager') is manager)
+
+    def test_load_manager_errors(self):
+        with self.assertRaises(importtime.RegistryLoadError):
+            importtime.load_manager(__name__)
+        with self.assertRaises(importtime.RegistryLoadError):
+            importtime.load_manager(__name__ + ':missing')
+        with self.assertRaises(importtime.RegistryLoadError):
+            importtime.load_manager(__name__ + ':not_a_manager')
+
+    def test_measure_import_in_fresh_interpreter(self):
+        import duplo_it_slow
+        seconds, error = importtime.measure_import('duplo_it_slow')
+        self.assertEqual(error, None)
+        self.assertTrue(seconds >= 0.2)
+
+    def test_measure_import_printing(self):
+        seconds, error = importtime.measure_import('duplo_it_noisy')
+        self.assertEqual(error, None)
+
+    def test_project_path(self):
+        import json as stdlib_module
+        path = importtime.project_path()
+        self.assertTrue(self.tmpdir in path)
+        self.assertFalse(os.path.dirname(stdlib_module.__file__) in path)
+        seconds, error = importtime.measure_import('duplo_it_fast', path=[])
+        self.assertTrue('duplo_it_fast' in error)
+
+    def test_measure_import_error(self):
+        seconds, error = importtime.measure_import('duplo_it_missing')
+        self.assertTrue('duplo_it_missing' in error)
+
+    def test_profile_attributes_costs(self):
+        costs = importtime.profile(importtime.load_manager('duplo_it_registry:manager'), jobs=2)
+        self.assertEqual([cost.name for cost in costs], ['slow', 'fast'])
+        slow = costs[0]
+        self.assertEqual([m.module for m in slow.modules], ['duplo_it_slow', 'duplo_it_fake'])
+        self.assertTrue(slow.seconds >= 0.2)
+        fast = costs[1]
+        self.assertEqual(sorted(m.role for m in fast.modules), ['target', 'target', 'variant'])
+        missing = [m for m in fast.modules if m.module == 'duplo_it_missing'][0]
+        self.assertTrue(missing.error)
+
+    def test_main_json(self):
+        out = StringIO()
+        with patch.object(sys, 'stdout', out):
+            importtime.main(['--json', 'duplo_it_registry:manager'])
+        report = json.loads(out.getvalue())
+        self.assertEqual(report[0]['name'], 'slow')
+        self.assertEqual(report[0]['modules'][0]['module'], 'duplo_it_slow')
+
+    def test_main_text(self):
+        out = StringIO()
+        with patch.object(sys, 'stdout', out):
+            importtime.main(['duplo_it_registry:manager'])
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[1].endswith('slow'))
+        self.assertTrue('FAILED' in out.getvalue())
+
+    def test_runs_as_module(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([self.tmpdir, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))])
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'duplo', '--json', 'duplo_it_registry:manager'], env=env)
+        self.assertEqual(json.loads(output.decode('utf-8'))[0]['name'], 'slow')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+from __future__ import absolute_import
+
+import importlib, importlib.machinery, os, shutil, sys, tempfile, unittest
+
+from duplo import doubles
+from duplo.late_imports import LateImportRepair, Repair
+
+MODULES = {
+    'duplo_late_ham': 'def spam():\n    return "normal"\n',
+    'duplo_late_eggs': 'from duplo_late_ham import spam\n',
+    'duplo_late_bacon': 'from duplo_late_ham import spam\n',
+}
+
+def fake_spam():
+    return 'fake'
+
+class LateImportRepairTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name, body in MODULES.items():
+            with open(os.path.join(self.tmpdir, name + '.py'), 'w') as fh:
+                fh.write(body)
+        sys.path.insert(0, self.tmpdir)
+        importlib.invalidate_caches()
+        self.ham = importlib.import_module('duplo_late_ham')
+
+        self.dm = doubles.DoubleManager()
+        self.double = doubles.PatchingDoubler('spam', fake_spam, 'duplo_late_ham:spam')
+        self.dm.register_double(self.double)
+        self.repair = LateImportRepair(self.dm).install()
+
+    def tearDown(self):
+        self.repair.uninstall()
+        sys.path.remove(self.tmpdir)
+        shutil.rmtree(self.tmpdir)
+        for name in MODULES:
+            sys.modules.pop(name, None)
+
+    def test_restores_variant_captured_while_applied(self):
+        with doubles.applied(self.dm, 'spam'):
+            eggs = importlib.import_module('duplo_late_eggs')
+            self.assertEqual(eggs.spam(), 'fake')
+        self.assertEqual(eggs.spam(), 'normal')
+        self.assertEqual(self.repair.repairs, [Repair('spam', 'duplo_late_eggs:spam', 'variant')])
+
+    def test_patches_normal_captured_between_applications(self):
+        with doubles.applied(self.dm, 'spam'):
+            pass
+        bacon = importlib.import_module('duplo_late_bacon')
+        with doubles.applied(self.dm, 'spam'):
+            self.assertEqual(bacon.spam(), 'fake')
+        self.assertEqual(self.double.targets, ['duplo_late_ham:spam', 'duplo_late_bacon:spam'])
+        self.assertEqual(bacon.spam(), 'normal')
+
+    def test_patches_normal_captured_before_first_application(self):
+        eggs = importlib.import_module('duplo_late_eggs')
+        with doubles.applied(self.dm, 'spam'):
+            self.assertEqual(eggs.spam(), 'fake')
+        self.assertEqual(eggs.spam(), 'normal')
+        self.assertEqual(self.repair.repairs, [Repair('spam', 'duplo_late_eggs:spam', 'normal')])
+
+    def test_imports_untouched(self):
+        with doubles.applied(self.dm, 'spam'):
+            eggs = importlib.import_module('duplo_late_eggs')
+        self.assertTrue(isinstance(eggs.__loader__, importlib.machinery.SourceFileLoader))
+        self.assertTrue(eggs.__spec__.loader is eggs.__loader__)
+
+    def test_uninstall(self):
+        with doubles.applied(self.dm, 'spam'):
+            eggs = importlib.import_module('duplo_late_eggs')
+            self.repair.uninstall()
+            self.assertEqual(self.double.targets, ['duplo_late_ham:spam'])
+            self.assertEqual(eggs.spam(), 'normal')
+        self.assertFalse(self.repair.installed)
+        self.assertEqual(self.dm._subscribed, [])
+        self.assertEqual(self.repair.repairs, [])
+        with doubles.applied(self.dm, 'spam'):
+            bacon = importlib.import_module('duplo_late_bacon')
+        self.assertEqual(bacon.spam(), 'fake')
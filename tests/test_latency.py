@@ -0,0 +1,114 @@
+from __future__ import absolute_import
+
+import sys, threading, unittest
+
+from duplo import config, doubles
+from duplo.latency import LatencyProfiler
+
+now = [0.0]
+
+def clock():
+    return now[0]
+
+def slow(seconds):
+    now[0] += seconds
+    return seconds
+
+aliased_slow = slow
+
+def countdown(n):
+    now[0] += 1
+    return n if n == 0 else countdown(n - 1)
+
+def blocking(started, release):
+    started.set()
+    release.wait(5)
+    now[0] += 1
+
+class Base(object):
+    def fetch(self):
+        now[0] += 2
+        return 'fetched'
+
+class Client(Base):
+    @staticmethod
+    def parse(text):
+        now[0] += 0.5
+        return text.upper()
+
+class LatencyProfilerTests(unittest.TestCase):
+    def setUp(self):
+        self.profiler = LatencyProfiler([__name__ + ':slow', __name__ + ':countdown', __name__ + ':blocking',
+                                         __name__ + ':Client.fetch', __name__ + ':Client.parse'],
+                                        clock=clock)
+
+    def test_ranked_report(self):
+        with self.profiler:
+            with self.profiler.scope('test_a'):
+                aliased_slow(3)
+                Client().fetch()
+            with self.profiler.scope('test_b'):
+                slow(1)
+                self.assertEqual(Client.parse('x'), 'X')
+                self.assertEqual(Client().parse('y'), 'Y')
+        report = self.profiler.report()
+        self.assertEqual([(l.target.split(':')[1], l.seconds, l.calls) for l in report],
+                         [('slow', 4, 2), ('Client.fetch', 2, 1), ('Client.parse', 1, 2)])
+        self.assertEqual(report[0].tests, [('test_a', 3), ('test_b', 1)])
+        self.assertEqual(report[0].aliases, [__name__ + ':aliased_slow'])
+
+    def test_restores(self):
+        real_slow = slow
+        with self.profiler:
+            self.assertFalse(sys.modules[__name__].aliased_slow is real_slow)
+        self.assertTrue(sys.modules[__name__].aliased_slow is real_slow)
+        self.assertFalse('fetch' in vars(Client))
+        self.assertTrue(isinstance(vars(Client)['parse'], staticmethod))
+
+    def test_recursion_timed_once(self):
+        with self.profiler:
+            countdown(3)
+        latency = self.profiler.report()[0]
+        self.assertEqual((latency.seconds, latency.calls), (4, 4))
+
+    def test_threads_timed_separately(self):
+        started, release = threading.Event(), threading.Event()
+        with self.profiler:
+            with self.profiler.scope('test_threads'):
+                thread = threading.Thread(target=blocking, args=(started, release))
+                thread.start()
+                started.wait(5)
+                # while the other thread is inside its call.
+                blocking(threading.Event(), started)
+                release.set()
+                thread.join()
+                blocking(threading.Event(), started)
+        latency = self.profiler.report()[0]
+        # 1 each for this thread's calls, 2 for the other's, which spanned the first.
+        self.assertEqual((latency.target, latency.seconds, latency.calls), (__name__ + ':blocking', 4, 3))
+        self.assertEqual(latency.tests, [('test_threads', 4)])
+
+    def test_unknown_target(self):
+        profiler = LatencyProfiler([__name__ + ':nope.thing'])
+        with self.assertRaises(doubles.MissingPatchTarget):
+            profiler.start()
+
+    def test_failed_start_swaps_nothing(self):
+        profiler = LatencyProfiler([__name__ + ':Client.fetch', __name__ + ':Client.nope', __name__ + ':slow'])
+        with self.assertRaises(doubles.MissingPatchTarget):
+            profiler.start()
+        self.assertFalse('fetch' in vars(Client))
+        self.assertFalse(profiler.started)
+        with self.assertRaises(ValueError):
+            profiler.stop()
+
+    def test_config_needs_variants(self):
+        with self.profiler:
+            slow(1)
+        text = self.profiler.format_config()
+        self.assertTrue(text.startswith('# 1.000s in 1 call(s) from 0 test(s)\n[slow]\nvariant =\n'))
+        self.assertTrue('    {0}:aliased_slow'.format(__name__) in text)
+        self.assertEqual(config._declare('x', 'slow', {'variant': 'fakes:slow', 'targets': 'a:b'}).targets,
+                         ('a:b',))
+        with self.assertRaises(config.ConfigError):
+            config._declare('x', 'slow', {'variant': '', 'targets': 'a:b'})
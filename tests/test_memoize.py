@@ -0,0 +1,155 @@
+from __future__ import absolute_import
+
+import os, shutil, tempfile, unittest
+
+from duplo import doubles, memoize
+
+calls = []
+
+def expensive(x, scale=1):
+    calls.append(x)
+    return x * scale
+
+def describe(items):
+    return len(items)
+
+class Quoter(object):
+    def __init__(self, rate):
+        self.rate = rate
+
+    def quote(self, x):
+        calls.append(x)
+        return x * self.rate
+
+class MemoizedTests(unittest.TestCase):
+    def setUp(self):
+        del calls[:]
+
+    def test_caches_by_arguments(self):
+        m = memoize.Memoized(expensive)
+        self.assertEqual(m(2), 2)
+        self.assertEqual(m(2), 2)
+        self.assertEqual(m(2, scale=3), 6)
+        self.assertEqual(calls, [2, 2])
+        self.assertEqual(m.stats(), memoize.CacheStats(1, 2, 0, 128, 2))
+
+    def test_evicts_least_recently_used(self):
+        m = memoize.Memoized(expensive, maxsize=2)
+        m(1)
+        m(2)
+        m(1)
+        m(3)
+        self.assertEqual(list(m.cache.keys()), [((1,), ()), ((3,), ())])
+        self.assertEqual(m.stats().evictions, 1)
+
+    def test_unhashable_arguments_pass_through(self):
+        m = memoize.Memoized(describe)
+        self.assertEqual(m([1, 2]), 2)
+        self.assertEqual(m([1, 2]), 2)
+        self.assertEqual(m.stats(), memoize.CacheStats(0, 2, 0, 128, 0))
+
+    def test_unbounded(self):
+        m = memoize.Memoized(expensive, maxsize=None)
+        for i in range(500):
+            m(i)
+        self.assertEqual(m.stats().currsize, 500)
+
+class MemoizedPersistenceTests(unittest.TestCase):
+    def setUp(self):
+        del calls[:]
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'cache.pickle')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        m = memoize.Memoized(expensive)
+        m(4)
+        m.save(self.path)
+
+        fresh = memoize.Memoized(expensive)
+        self.assertTrue(fresh.load(self.path))
+        self.assertEqual(fresh(4), 4)
+        self.assertEqual(calls, [4])
+
+    def test_missing_file_is_ignored(self):
+        self.assertFalse(memoize.Memoized(expensive).load(self.path))
+
+    def test_corrupt_file_is_ignored(self):
+        with open(self.path, 'wb') as fh:
+            fh.write(b'not a pickle')
+        self.assertFalse(memoize.Memoized(expensive).load(self.path))
+
+    def test_other_functions_cache_is_ignored(self):
+        m = memoize.Memoized(describe)
+        m((1,))
+        m.save(self.path)
+        self.assertFalse(memoize.Memoized(expensive).load(self.path))
+
+class MemoizingDoublerTests(unittest.TestCase):
+    def setUp(self):
+        del calls[:]
+        self.tmpdir = tempfile.mkdtemp()
+        self.dm = doubles.DoubleManager()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_applied_through_manager(self):
+        doubler = memoize.MemoizingDoubler('expensive', __name__ + ':expensive')
+        self.dm.register_double(doubler)
+        self.dm.apply_doubles(['expensive'])
+        self.assertTrue(isinstance(expensive, memoize.Memoized))
+        expensive(1)
+        expensive(1)
+        self.dm.revert()
+
+        self.assertFalse(isinstance(expensive, memoize.Memoized))
+        self.assertEqual(calls, [1])
+        self.assertEqual(doubler.stats.hits, 1)
+
+    def test_cache_survives_reapplication(self):
+        doubler = memoize.MemoizingDoubler('expensive', __name__ + ':expensive')
+        doubler.apply()
+        expensive(1)
+        doubler.unapply()
+        doubler.apply()
+        expensive(1)
+        doubler.unapply()
+        self.assertEqual(calls, [1])
+
+    def test_cache_file_persists_between_doublers(self):
+        path = os.path.join(self.tmpdir, 'expensive.cache')
+        first = memoize.MemoizingDoubler('expensive', __name__ + ':expensive', cache_file=path)
+        first.apply()
+        expensive(5)
+        first.unapply()
+
+        second = memoize.MemoizingDoubler('expensive', __name__ + ':expensive', cache_file=path)
+        second.apply()
+        expensive(5)
+        second.unapply()
+        self.assertEqual(calls, [5])
+        self.assertEqual(second.stats.hits, 1)
+
+    def test_method(self):
+        doubler = memoize.MemoizingDoubler('quote', __name__ + ':Quoter.quote')
+        doubler.apply()
+        try:
+            quoter = Quoter(2)
+            self.assertEqual(quoter.quote(3), 6)
+            self.assertEqual(quoter.quote(3), 6)
+            self.assertEqual(Quoter(3).quote(3), 9)
+        finally:
+            doubler.unapply()
+        self.assertTrue(isinstance(doubler.memoized, memoize.Memoized))
+        # the instance is part of the key.
+        self.assertEqual(calls, [3, 3])
+
+    def test_stats_before_application(self):
+        doubler = memoize.MemoizingDoubler('expensive', __name__ + ':expensive', maxsize=10)
+        self.assertEqual(doubler.stats, memoize.CacheStats(0, 0, 0, 10, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+from __future__ import absolute_import
+
+import socket, sys, threading, unittest
+from socket import getaddrinfo as aliased_getaddrinfo
+from timeit import default_timer
+
+from duplo import doubles
+from duplo.six.moves import http_client
+from duplo.network import HTTPResponder, NetworkBlocked, SocketDoubler, Attempt
+
+def echo(sock, address):
+    while True:
+        data = sock.recv(1024)
+        if not data:
+            break
+        sock.sendall(data.upper())
+
+class SocketDoublerTests(unittest.TestCase):
+    def setUp(self):
+        self.manager = doubles.DoubleManager()
+        self.network = SocketDoubler(allow=['127.0.0.1'])
+        self.manager.register_double(self.network)
+
+    def test_routes_to_handlers(self):
+        self.network.register('echo.example.com', 7, echo)
+        with doubles.applied(self.manager, 'network'):
+            sock = socket.create_connection(('echo.example.com', 7))
+            try:
+                sock.sendall(b'hello')
+                self.assertEqual(sock.recv(1024), b'HELLO')
+                self.assertEqual(sock.getpeername(), ('echo.example.com', 7))
+            finally:
+                sock.close()
+
+    def test_http_responder(self):
+        responder = HTTPResponder(body=b'{"ok": true}', headers={'Content-Type': 'application/json'})
+        self.network.register('api.example.com', None, responder)
+        with doubles.applied(self.manager, 'network'):
+            conn = http_client.HTTPConnection('api.example.com', 8080, timeout=5)
+            try:
+                conn.request('POST', '/things', body=b'abc')
+                response = conn.getresponse()
+                self.assertEqual(response.status, 200)
+                self.assertEqual(response.getheader('Content-Type'), 'application/json')
+                self.assertEqual(response.read(), b'{"ok": true}')
+                conn.request('GET', '/things/1')
+                self.assertEqual(conn.getresponse().read(), b'{"ok": true}')
+            finally:
+                conn.close()
+        self.assertEqual([(r.method, r.target, r.body) for r in responder.requests],
+                         [('POST', '/things', b'abc'), ('GET', '/things/1', b'')])
+
+    def test_blocks_unregistered_hosts(self):
+        with doubles.applied(self.manager, 'network'):
+            started = default_timer()
+            with self.assertRaises(NetworkBlocked):
+                socket.create_connection(('example.org', 80), timeout=30)
+            with self.assertRaises(NetworkBlocked):
+                aliased_getaddrinfo('example.org', 443)
+            sock = socket.socket()
+            try:
+                self.assertNotEqual(sock.connect_ex(('10.1.2.3', 80)), 0)
+            finally:
+                sock.close()
+            self.assertTrue(default_timer() - started < 1)
+        self.assertEqual(self.network.report(), [
+            Attempt('10.1.2.3', 80, 'blocked', 1),
+            Attempt('example.org', 443, 'blocked', 1),
+            Attempt('example.org', 80, 'blocked', 1),
+        ])
+
+    def test_allowed_hosts(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        port = listener.getsockname()[1]
+        accepted = []
+        thread = threading.Thread(target=lambda: accepted.append(listener.accept()))
+        thread.start()
+        try:
+            with doubles.applied(self.manager, 'network'):
+                sock = socket.create_connection(('127.0.0.1', port))
+                sock.close()
+            thread.join(5)
+            self.assertEqual(len(accepted), 1)
+        finally:
+            for conn, address in accepted:
+                conn.close()
+            listener.close()
+        self.assertEqual(self.network.report(), [Attempt('127.0.0.1', port, 'allowed', 1)])
+
+    def test_report_counts(self):
+        self.network.register('echo.example.com', 7, echo)
+        with doubles.applied(self.manager, 'network'):
+            for i in range(3):
+                socket.create_connection(('echo.example.com', 7)).close()
+        self.assertEqual(self.network.report(), [Attempt('echo.example.com', 7, 'routed', 3)])
+        self.assertEqual(self.network.format_report(), 'echo.example.com:7 routed 3')
+
+    def test_restores(self):
+        real_socket, real_getaddrinfo = socket.socket, aliased_getaddrinfo
+        with doubles.applied(self.manager, 'network'):
+            self.assertFalse(socket.socket is real_socket)
+            self.assertFalse(sys.modules[__name__].aliased_getaddrinfo is real_getaddrinfo)
+        self.assertTrue(socket.socket is real_socket)
+        self.assertTrue(sys.modules[__name__].aliased_getaddrinfo is real_getaddrinfo)
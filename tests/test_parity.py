@@ -0,0 +1,144 @@
+from __future__ import absolute_import
+
+import threading, time, unittest
+
+from duplo import doubles, memoize, parity
+
+def real_double(x):
+    return x * 2
+
+def fake_double(x):
+    return x + x
+
+def real_half(x):
+    return x // 2
+
+def fake_half(x):
+    return x / 2.0
+
+def real_fail(x):
+    raise KeyError(x)
+
+def fake_fail(x):
+    raise KeyError(x)
+
+def real_typed(x):
+    return x + 'a'
+
+def fake_typed(x):
+    raise TypeError(x)
+
+real_constant = 1
+fake_constant = 1
+
+def real_slow(x):
+    time.sleep(0.5)
+    return x
+
+release = threading.Event()
+
+def real_hang(x):
+    release.wait(10)
+    return x
+
+class ParityRunnerTests(unittest.TestCase):
+    def setUp(self):
+        self.dm = doubles.DoubleManager()
+        self.dm.register_double(doubles.PatchingDoubler(
+            'double', __name__ + ':fake_double', __name__ + ':real_double'))
+        self.dm.register_double(doubles.PatchingDoubler(
+            'half', __name__ + ':fake_half', __name__ + ':real_half'))
+        self.dm.register_double(doubles.PatchingDoubler(
+            'fail', __name__ + ':fake_fail', __name__ + ':real_fail'))
+
+    def test_matching_cases(self):
+        report = parity.check_parity(self.dm, {'double': [parity.case(1), parity.case(x=3)]})
+        self.assertTrue(report.ok)
+        self.assertEqual([r.status for r in report.results], [parity.MATCH, parity.MATCH])
+        self.assertEqual(report.results[1].variant.value, 6)
+
+    def test_reports_mismatch(self):
+        report = parity.check_parity(self.dm, {'half': [(4,), (5,)]})
+        self.assertEqual([r.case.args for r in report.mismatches], [(5,)])
+        self.assertTrue('MISMATCH half(5)' in report.format())
+
+    def test_same_exception_matches(self):
+        report = parity.check_parity(self.dm, {'fail': [(1,)]})
+        self.assertTrue(report.ok)
+        self.assertTrue(isinstance(report.results[0].normal.exception, KeyError))
+
+    def test_uncallable_cases_are_errors(self):
+        self.dm.register_double(doubles.PatchingDoubler(
+            'constant', __name__ + ':fake_constant', __name__ + ':real_constant'))
+        self.dm.register_double(doubles.PatchingDoubler(
+            'typed', __name__ + ':fake_typed', __name__ + ':real_typed'))
+        report = parity.check_parity(self.dm, {'constant': [(1,)], 'double': [(1, 2)], 'typed': [(1,)]})
+        # TypeErrors raised within both sides still match.
+        self.assertEqual([r.status for r in report.results], [parity.ERROR, parity.ERROR, parity.MATCH])
+        self.assertTrue('ERROR constant(1)' in report.format())
+        self.assertFalse(report.ok)
+
+    def test_skips_doubles_without_cases(self):
+        report = parity.check_parity(self.dm, {'double': [(1,)]})
+        self.assertEqual(list(report.latency().keys()), ['double'])
+
+    def test_parity_cases_attribute(self):
+        self.dm.registry['double'].parity_cases = [(1,), (2,)]
+        report = parity.check_parity(self.dm)
+        self.assertEqual(report.latency()['double'].cases, 2)
+
+    def test_compare_with_applied_double(self):
+        self.dm.apply_doubles(['half'])
+        report = parity.check_parity(self.dm, {'half': [(5,)]})
+        self.dm.revert()
+        self.assertEqual(report.results[0].normal.value, 2)
+        self.assertEqual(report.results[0].variant.value, 2.5)
+
+    def test_timeout(self):
+        self.dm.register_double(doubles.PatchingDoubler(
+            'slow', __name__ + ':fake_double', __name__ + ':real_slow'))
+        report = parity.check_parity(self.dm, {'slow': [(1,)]}, timeout=0.05)
+        self.assertEqual(report.results[0].status, parity.TIMEOUT)
+        self.assertEqual(report.results[0].normal.elapsed, None)
+
+    def test_hung_calls_dont_block_queued_ones(self):
+        self.dm.register_double(doubles.PatchingDoubler(
+            'hang', __name__ + ':fake_double', __name__ + ':real_hang'))
+        started = time.time()
+        try:
+            report = parity.check_parity(self.dm, {'hang': [(1,), (2,)]},
+                                         concurrency=1, timeout=0.1)
+        finally:
+            release.set()
+        self.assertTrue(time.time() - started < 2)
+        self.assertEqual([r.status for r in report.results], [parity.TIMEOUT, parity.TIMEOUT])
+
+    def test_skips_doubles_without_variant(self):
+        self.dm.register_double(memoize.MemoizingDoubler('memo', __name__ + ':real_double'))
+        report = parity.check_parity(self.dm, {'memo': [(1,)], 'double': [(1,)]})
+        self.assertEqual(list(report.latency().keys()), ['double'])
+
+    def test_runs_concurrently_within_limit(self):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def tracking(x):
+            with lock:
+                active.append(x)
+                peak.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.remove(x)
+            return x
+
+        double = self.dm.registry['double']
+        double.variant = tracking
+        double.targets = [__name__ + ':fake_double']
+        parity.check_parity(self.dm, {'double': [(i,) for i in range(8)]},
+                            concurrency=3, compare=lambda a, b: True)
+        self.assertTrue(max(peak) > 1)
+        self.assertTrue(max(peak) <= 3)
+
+if __name__ == '__main__':
+    unittest.main()
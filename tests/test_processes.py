@@ -0,0 +1,92 @@
+from __future__ import absolute_import
+
+import subprocess, sys, unittest
+from subprocess import Popen as aliased_popen
+
+from duplo import doubles
+from duplo.processes import SubprocessDoubler, UnmatchedCommand
+
+class SubprocessDoublerTests(unittest.TestCase):
+    def setUp(self):
+        self.manager = doubles.DoubleManager()
+        self.commands = SubprocessDoubler()
+        self.manager.register_double(self.commands)
+
+    def test_exact(self):
+        self.commands.register(['git', 'rev-parse', 'HEAD'], stdout=b'0123abcd\n')
+        with doubles.applied(self.manager, 'subprocess'):
+            output = subprocess.check_output(['git', 'rev-parse', 'HEAD'])
+            self.assertEqual(output, b'0123abcd\n')
+            self.assertEqual(subprocess.check_output('git rev-parse HEAD', shell=True), b'0123abcd\n')
+        self.assertEqual(self.commands.commands(), [['git', 'rev-parse', 'HEAD']] * 2)
+
+    def test_prefix_prefers_longest(self):
+        self.commands.register_prefix(['git'], stdout=b'git')
+        self.commands.register_prefix(['git', 'log'], stdout=b'log')
+        with doubles.applied(self.manager, 'subprocess'):
+            self.assertEqual(subprocess.check_output(['git', 'log', '-1']), b'log')
+            self.assertEqual(subprocess.check_output(['git', 'status']), b'git')
+
+    def test_regex(self):
+        self.commands.register_regex(r'identify (?P<name>\S+)\.png$', stdout=b'PNG')
+        self.commands.register_regex(r'identify (\S+)\.(jpe?g)$', stdout=b'JPEG')
+        self.commands.register_regex(r'(?i:convert) ', returncode=1, stderr=b'bad')
+        with doubles.applied(self.manager, 'subprocess'):
+            self.assertEqual(subprocess.check_output(['identify', 'a.png']), b'PNG')
+            self.assertEqual(subprocess.check_output(['identify', 'a.jpg']), b'JPEG')
+            result = subprocess.run(['CONVERT', 'a.png', 'b.jpg'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self.assertEqual((result.returncode, result.stdout, result.stderr), (1, b'', b'bad'))
+        self.assertEqual([p.rule.pattern for p in self.commands.processes],
+                         [r'identify (?P<name>\S+)\.png$', r'identify (\S+)\.(jpe?g)$',
+                          r'(?i:convert) '])
+
+    def test_exact_before_prefix_before_regex(self):
+        self.commands.register_regex(r'git', stdout=b'regex')
+        self.commands.register_prefix(['git'], stdout=b'prefix')
+        self.commands.register(['git', 'status'], stdout=b'exact')
+        with doubles.applied(self.manager, 'subprocess'):
+            self.assertEqual(subprocess.check_output(['git', 'status']), b'exact')
+            self.assertEqual(subprocess.check_output(['git', 'diff']), b'prefix')
+            self.assertEqual(subprocess.check_output(['gitk']), b'regex')
+
+    def test_check_raises(self):
+        self.commands.register(['false'], returncode=1)
+        with doubles.applied(self.manager, 'subprocess'):
+            with self.assertRaises(subprocess.CalledProcessError):
+                subprocess.check_call(['false'])
+            self.assertEqual(subprocess.call(['false']), 1)
+
+    def test_unmatched(self):
+        with doubles.applied(self.manager, 'subprocess'):
+            with self.assertRaises(UnmatchedCommand):
+                subprocess.run(['rm', '-rf', '/'])
+
+    def test_streaming_and_text(self):
+        produced = []
+        def lines():
+            for i in range(3):
+                produced.append(i)
+                yield u'line {0}\n'.format(i)
+        self.commands.register(['tail', '-f', 'log'], stdout=lines())
+        with doubles.applied(self.manager, 'subprocess'):
+            process = aliased_popen(['tail', '-f', 'log'], stdout=subprocess.PIPE,
+                                    universal_newlines=True)
+            self.assertEqual(produced, [])
+            self.assertEqual(process.stdout.readline(), 'line 0\n')
+            self.assertTrue(len(produced) < 3)
+            self.assertEqual(list(process.stdout), ['line 1\n', 'line 2\n'])
+            self.assertEqual(process.wait(), 0)
+
+    def test_records_input(self):
+        self.commands.register_prefix(['cat'], respond=lambda process: (process.args[-1], b'', 0))
+        with doubles.applied(self.manager, 'subprocess'):
+            result = subprocess.run(['cat', '-'], input=b'hello', stdout=subprocess.PIPE)
+        self.assertEqual(result.stdout, b'-')
+        self.assertEqual(self.commands.processes[0].input, b'hello')
+
+    def test_restores(self):
+        real_popen = subprocess.Popen
+        with doubles.applied(self.manager, 'subprocess'):
+            self.assertTrue(sys.modules[__name__].aliased_popen is self.commands.popen_class)
+        self.assertTrue(subprocess.Popen is real_popen)
+        self.assertTrue(sys.modules[__name__].aliased_popen is real_popen)
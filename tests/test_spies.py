@@ -0,0 +1,107 @@
+from __future__ import absolute_import
+
+import unittest
+
+from duplo import doubles, spies
+
+def shorten(url, domain='sho.rt'):
+    if not url:
+        raise ValueError(url)
+    return '{0}/{1}'.format(domain, len(url))
+
+class Greeter(object):
+    def greet(self, name):
+        return 'hi ' + name
+
+class SpyTests(unittest.TestCase):
+    def setUp(self):
+        self.spy = spies.Spy(shorten, capacity=4)
+
+    def test_forwards_and_records(self):
+        self.assertEqual(self.spy('http://a'), 'sho.rt/8')
+        self.assertEqual(self.spy.count, 1)
+        call = self.spy.last_call
+        self.assertEqual(call.args, ('http://a',))
+        self.assertEqual(call.kwargs, {})
+        self.assertEqual(call.result, 'sho.rt/8')
+        self.assertEqual(call.exception, None)
+        self.assertTrue(call.timestamp > 0)
+
+    def test_records_exceptions(self):
+        with self.assertRaises(ValueError):
+            self.spy('')
+        self.assertTrue(isinstance(self.spy.last_call.exception, ValueError))
+        self.assertEqual(self.spy.last_call.result, None)
+
+    def test_keeps_most_recent(self):
+        for i in range(6):
+            self.spy('x' * (i + 1))
+        self.assertEqual(self.spy.count, 6)
+        self.assertEqual([c.args[0] for c in self.spy.calls()], ['xxx', 'xxxx', 'xxxxx', 'xxxxxx'])
+        self.assertEqual([c.args[0] for c in self.spy.last(2)], ['xxxxx', 'xxxxxx'])
+        self.assertEqual(len(self.spy.last(10)), 4)
+
+    def test_capacity_at_least_one(self):
+        with self.assertRaises(ValueError):
+            spies.Spy(len, capacity=0)
+        spy = spies.Spy(len, capacity=1)
+        spy('a')
+        spy('bc')
+        self.assertEqual([c.result for c in spy.calls()], [2])
+
+    def test_reused_slot_keeps_newer_result(self):
+        def outer(n):
+            if n:
+                spy(n - 1)
+            return n
+        spy = spies.Spy(outer, capacity=1)
+        spy(1)
+        # the inner call took the slot over before the outer returned.
+        self.assertEqual(spy.count, 2)
+        self.assertEqual([(c.args, c.result) for c in spy.calls()], [((0,), 0)])
+
+    def test_timestamps_ordered(self):
+        for i in range(6):
+            self.spy('x')
+        times = [c.timestamp for c in self.spy.calls()]
+        self.assertEqual(times, sorted(times))
+
+    def test_filter(self):
+        self.spy('a', domain='x.y')
+        self.spy('b')
+        self.spy('a')
+        self.assertEqual(len(self.spy.filter('a')), 2)
+        self.assertEqual([c.result for c in self.spy.filter('a', domain='x.y')], ['x.y/1'])
+        self.assertEqual(self.spy.filter(domain='nope'), [])
+        self.assertTrue(self.spy.called_with('b'))
+        self.assertFalse(self.spy.called_with('c'))
+        self.assertEqual(len(self.spy.where(lambda call: call.result.endswith('/1'))), 3)
+
+    def test_reset(self):
+        self.spy('a')
+        self.spy.reset()
+        self.assertEqual(self.spy.count, 0)
+        self.assertEqual(self.spy.calls(), [])
+        self.assertEqual(self.spy.last_call, None)
+
+    def test_binds_as_method(self):
+        spy = spies.Spy(Greeter.__dict__['greet'])
+        class Spied(Greeter):
+            greet = spy
+        greeter = Spied()
+        self.assertEqual(greeter.greet('bob'), 'hi bob')
+        self.assertEqual(spy.last_call.args, (greeter, 'bob'))
+
+class SpyDoublerTests(unittest.TestCase):
+    def test_applied_through_manager(self):
+        dm = doubles.DoubleManager()
+        doubler = spies.SpyDoubler('shortener', __name__ + ':shorten')
+        dm.register_double(doubler)
+        with doubles.applied(dm, 'shortener'):
+            self.assertEqual(shorten('abc'), 'sho.rt/3')
+        self.assertFalse(isinstance(shorten, spies.Spy))
+        self.assertEqual(doubler.spy.count, 1)
+        self.assertTrue(doubler.spy.called_with('abc'))
+
+if __name__ == '__main__':
+    unittest.main()
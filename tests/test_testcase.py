@@ -0,0 +1,77 @@
+from __future__ import absolute_import
+
+import unittest
+
+from duplo import doubles
+from duplo.testcase import DoublesTestCase, override
+
+class CountingDoubler(doubles.DoublerBase):
+    def __init__(self, name, calls, **kwargs):
+        super(CountingDoubler, self).__init__(name, **kwargs)
+        self.calls = calls
+
+    def apply(self):
+        self.calls.append(('apply', self.name))
+
+    def unapply(self):
+        self.calls.append(('unapply', self.name))
+
+def run(case):
+    suite = unittest.defaultTestLoader.loadTestsFromTestCase(case)
+    result = unittest.TestResult()
+    suite.run(result)
+    return result
+
+class DoublesTestCaseTests(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.manager = doubles.DoubleManager()
+        for name in ['db', 'mail', 'clock']:
+            self.manager.register_double(CountingDoubler(name, self.calls, tags=['fast']))
+        self.manager.register_double(CountingDoubler('cache', self.calls, requires=['db']))
+
+    def make_case(self, **attrs):
+        manager, seen = self.manager, {}
+        class Case(DoublesTestCase, unittest.TestCase):
+            double_manager = manager
+            class_doubles = ['cache', 'mail']
+
+            def test_plain(self):
+                seen['plain'] = sorted(manager.applied)
+
+            def test_plain_too(self):
+                seen['plain_too'] = sorted(manager.applied)
+
+            @override(apply=['clock'], unapply=['mail', 'db'])
+            def test_override(self):
+                seen['override'] = sorted(manager.applied)
+        for name, value in attrs.items():
+            setattr(Case, name, value)
+        return Case, seen
+
+    def test_applied_once_per_class(self):
+        case, seen = self.make_case()
+        result = run(case)
+        self.assertTrue(result.wasSuccessful(), result.errors + result.failures)
+        self.assertEqual(seen['plain'], ['cache', 'db', 'mail'])
+        self.assertEqual(seen['plain_too'], ['cache', 'db', 'mail'])
+        # cache requires db, so goes with it.
+        self.assertEqual(seen['override'], ['clock'])
+        self.assertEqual(case._delta('test_override')[1].selected, ['mail', 'cache', 'db'])
+        self.assertEqual(self.manager.applied, [])
+        self.assertEqual(self.manager.depth, 1)
+        # db, cache, mail for the class; clock, then cache, mail and db, only around test_override.
+        self.assertEqual(len(self.calls), 2 * 3 + 2 * 4)
+
+    def test_tags(self):
+        case, seen = self.make_case(class_doubles=None, class_double_tags=['fast'])
+        run(case)
+        self.assertEqual(seen['plain'], ['clock', 'db', 'mail'])
+        self.assertEqual(seen['override'], ['clock'])
+
+    def test_failed_class_setup_reverts(self):
+        case, seen = self.make_case(class_doubles=['cache', 'nope'])
+        result = run(case)
+        self.assertEqual(len(result.errors), 1)
+        self.assertEqual(self.manager.depth, 1)
+        self.assertEqual(seen, {})
@@ -0,0 +1,143 @@
+from __future__ import absolute_import
+
+from mock import patch
+import json, os, shutil, tempfile, threading, unittest
+
+from duplo import doubles, tracing
+
+thing_to_patch = 0
+
+class TracerTests(unittest.TestCase):
+    def setUp(self):
+        self.dm = doubles.DoubleManager()
+        self.dm.register_double(doubles.PatchingDoubler(
+            'opd', 1, __name__ + ':thing_to_patch'))
+        self.tracer = tracing.Tracer(capacity=64)
+
+    def tearDown(self):
+        if tracing._installed[0] is self.tracer:
+            self.tracer.uninstall()
+
+    def spans(self):
+        return [(e['ph'], e['name']) for e in self.tracer.events()]
+
+    def test_records_spans(self):
+        with self.tracer:
+            self.dm.apply_doubles()
+            self.dm.revert()
+        self.assertEqual(self.spans(), [
+            ('B', 'apply_doubles'),
+            ('B', 'apply:opd'),
+            ('B', 'resolve:' + __name__ + ':thing_to_patch'),
+            ('E', 'resolve:' + __name__ + ':thing_to_patch'),
+            ('E', 'apply:opd'),
+            ('E', 'apply_doubles'),
+            ('B', 'revert'),
+            ('B', 'unapply:opd'),
+            ('E', 'unapply:opd'),
+            ('E', 'revert'),
+        ])
+        resolve = self.tracer.events()[2]
+        self.assertEqual(resolve['args'], {'double': 'opd'})
+
+    def test_selection_inside_span(self):
+        resolve_included = self.dm._resolve_included
+        def resolve(*args, **kwargs):
+            self.tracer.record('select', 'i')
+            return resolve_included(*args, **kwargs)
+        with self.tracer:
+            with patch.object(self.dm, '_resolve_included', resolve):
+                self.dm.apply_doubles('o*')
+                self.dm.revert()
+        self.assertEqual(self.spans()[:2], [('B', 'apply_doubles'), ('i', 'select')])
+
+    def test_records_plans(self):
+        with self.tracer:
+            with doubles.applied(self.dm, 'opd'):
+                with doubles.unapplied(self.dm, 'opd'):
+                    pass
+        self.assertEqual([name for phase, name in self.spans() if phase == 'B'], [
+            'applied', 'apply:opd', 'resolve:' + __name__ + ':thing_to_patch',
+            'unapplied', 'unapply:opd', 'revert', 'apply:opd', 'revert', 'unapply:opd',
+        ])
+
+    def test_recorded_count_doesnt_go_back(self):
+        # the first thread to take a slot is the last to finish recording.
+        first_started, second_done = threading.Event(), threading.Event()
+        main = threading.current_thread()
+        def timer():
+            if threading.current_thread() is not main:
+                first_started.set()
+                second_done.wait(5)
+            return 0.0
+        with patch.object(tracing, 'default_timer', timer):
+            first = threading.Thread(target=self.tracer.record, args=('first', 'B'))
+            first.start()
+            first_started.wait(5)
+            self.tracer.record('second', 'B')
+            second_done.set()
+            first.join()
+        self.assertEqual([name for phase, name in self.spans()], ['first', 'second'])
+
+    def test_uninstall_restores_methods(self):
+        original = doubles.DoubleManager.__dict__['apply_doubles']
+        with self.tracer:
+            self.assertFalse(doubles.DoubleManager.__dict__['apply_doubles'] is original)
+        self.assertTrue(doubles.DoubleManager.__dict__['apply_doubles'] is original)
+        self.dm.apply_doubles()
+        self.dm.revert()
+        self.assertEqual(self.tracer.events(), [])
+
+    def test_one_tracer_at_a_time(self):
+        with self.tracer:
+            with self.assertRaises(tracing.TracerInstalled):
+                tracing.Tracer().install()
+
+    def test_records_even_when_raising(self):
+        with self.tracer:
+            with self.assertRaises(doubles.UnappliedDouble):
+                self.dm.revert()
+        self.assertEqual(self.spans(), [('B', 'revert'), ('E', 'revert')])
+
+    def test_ring_buffer_overwrites_oldest(self):
+        for i in range(100):
+            self.tracer.record(str(i), 'B')
+        events = self.tracer.events()
+        self.assertEqual(len(events), 64)
+        self.assertEqual(events[0]['name'], '36')
+        self.assertEqual(events[-1]['name'], '99')
+        self.assertEqual(self.tracer.dropped, 36)
+
+    def test_thread_ids(self):
+        thread = threading.Thread(target=self.tracer.record, args=('threaded', 'B'))
+        thread.start()
+        thread.join()
+        self.tracer.record('main', 'B')
+        tids = [e['tid'] for e in self.tracer.events()]
+        self.assertEqual(tids[0], thread.ident)
+        self.assertNotEqual(tids[0], tids[1])
+
+    def test_timestamps_increase(self):
+        for i in range(10):
+            self.tracer.record(str(i), 'B')
+        times = [e['ts'] for e in self.tracer.events()]
+        self.assertEqual(times, sorted(times))
+
+    def test_dump(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with self.tracer:
+                self.dm.apply_doubles()
+                self.dm.revert()
+            path = os.path.join(tmpdir, 'trace.json')
+            self.tracer.dump(path)
+            with open(path) as fh:
+                trace = json.load(fh)
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(len(trace['traceEvents']), 10)
+        self.assertEqual(trace['traceEvents'][0]['cat'], 'duplo')
+        self.assertEqual(trace['traceEvents'][0]['pid'], os.getpid())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+from __future__ import absolute_import
+
+import unittest
+
+from duplo import doubles, usage
+
+def real_send(x):
+    return 'sent'
+
+def fake_send(x):
+    return 'faked'
+
+def real_fetch():
+    return 'fetched'
+
+def fake_fetch():
+    return 'fake fetched'
+
+class RealClient(object):
+    pass
+
+class FakeClient(object):
+    pass
+
+class UsageTrackerTests(unittest.TestCase):
+    def setUp(self):
+        self.dm = doubles.DoubleManager()
+        self.dm.register_double(doubles.PatchingDoubler(
+            'send', fake_send, __name__ + ':real_send'))
+        self.dm.register_double(doubles.PatchingDoubler(
+            'fetch', fake_fetch, __name__ + ':real_fetch'))
+        self.dm.register_double(doubles.PatchingDoubler(
+            'client', FakeClient, __name__ + ':RealClient'))
+        self.tracker = usage.UsageTracker(self.dm)
+        self.tracker.start()
+
+    def tearDown(self):
+        self.tracker.stop()
+
+    def run_test(self, label, body):
+        with self.tracker.scope(label):
+            self.dm.apply_doubles()
+            try:
+                body()
+            finally:
+                self.dm.revert()
+
+    def test_counts_calls(self):
+        self.run_test('t', lambda: (real_send(1), real_send(2)))
+        self.assertEqual(self.tracker.hits('send'), 2)
+        self.assertEqual(self.tracker.hits('fetch'), 0)
+
+    def test_wrapper_forwards(self):
+        self.dm.apply_doubles(['send'])
+        self.assertEqual(real_send(1), 'faked')
+        self.assertEqual(real_send.__name__, 'fake_send')
+        self.dm.revert()
+        self.assertEqual(real_send(1), 'sent')
+
+    def test_reports_unused_per_scope(self):
+        self.run_test('mod.Case.test_a', lambda: real_send(1))
+        self.run_test('mod.Case.test_b', lambda: real_fetch())
+        report = self.tracker.report()
+        self.assertEqual(report['mod.Case.test_a'].unused, ['fetch'])
+        self.assertEqual(report['mod.Case.test_b'].unused, ['send'])
+        self.assertEqual(report['mod.Case.test_a'].untracked, ['client'])
+        self.assertEqual(report['mod.Case.test_a'].applied, ['client', 'fetch', 'send'])
+
+    def test_report_by_module(self):
+        self.run_test('mod.Case.test_a', lambda: real_send(1))
+        self.run_test('mod.Case.test_b', lambda: real_fetch())
+        self.run_test('other.Case.test_c', lambda: None)
+        report = self.tracker.report(key=usage.module_of)
+        self.assertEqual(report['mod'].unused, [])
+        self.assertEqual(report['other'].unused, ['fetch', 'send'])
+        self.assertEqual(self.tracker.unused(), [])
+
+    def test_doubles_applied_before_scope(self):
+        self.dm.apply_doubles(['send', 'fetch'])
+        with self.tracker.scope('t'):
+            real_fetch()
+        self.dm.revert()
+        self.assertEqual(self.tracker.report()['t'].unused, ['send'])
+
+    def test_format_report(self):
+        self.run_test('t', lambda: real_send(1))
+        self.assertEqual(self.tracker.format_report(),
+                         't: 1 of 3 applied double(s) unused: fetch')
+
+    def test_stop_leaves_variants_unwrapped(self):
+        self.tracker.stop()
+        self.dm.apply_doubles(['send'])
+        self.assertTrue(real_send is fake_send)
+        self.dm.revert()
+        self.tracker.start()
+
+    def test_nested_scopes_rejected(self):
+        self.tracker.begin('a')
+        with self.assertRaises(ValueError):
+            self.tracker.begin('b')
+        self.tracker.end()
+
+    def test_module_of(self):
+        self.assertEqual(usage.module_of('pkg.test_mod.Case.test_x'), 'pkg.test_mod')
+        self.assertEqual(usage.module_of('pkg/test_mod.py::Case::test_x'), 'pkg/test_mod.py')
+
+if __name__ == '__main__':
+    unittest.main()